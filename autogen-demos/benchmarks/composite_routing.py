@@ -0,0 +1,123 @@
+"""
+Compares N separate routing calls against one composite routing call per prompt.
+
+For every prompt of the query log the qualifier, complexity and policy attributes are
+first requested with one `RouterLLM` call each, then with a single call on the combined
+schema built by `composite_route`. Latency and token usage (from the raw completions)
+are reported for both.
+
+Usage:
+    python -m benchmarks.composite_routing --base-url http://localhost:8000/v1 --model Qwen/Qwen2.5-32B-Instruct
+"""
+import argparse
+import json
+import statistics
+import time
+from typing import Literal, Optional
+
+from pydantic import BaseModel, Field
+
+from benchmarks.semantic_cache_hit_rate import load_query_log
+from src.constants import LLAMA3_2_API_BASE, LLAMA3_2_API_KEY, LLAMA3_2_API_MODEL_NAME
+from src.model.base import RouterLLM
+from src.model.composite import build_composite_model
+
+
+class QualifierCategory(BaseModel):
+    category: Literal["labour_market_query", "conversational_query", "out_of_context_query"]
+    reason: str = Field(..., description="One sentence explaining the category.")
+    choice: Optional[int] = None
+
+
+class QualifierResponse(BaseModel):
+    """Decides whether the user message is in scope for the labour market assistant."""
+    qualifier: QualifierCategory
+    user_message: Optional[str] = None
+
+
+class ComplexityCategory(BaseModel):
+    category: Literal["Simple_Queries", "Moderate_Queries", "Advanced_Queries"]
+    reason: str = Field(..., description="One sentence explaining the category.")
+    choice: Optional[int] = None
+
+
+class ComplexityResponse(BaseModel):
+    """Rates how much research the user message needs."""
+    complexity: ComplexityCategory
+    user_message: Optional[str] = None
+
+
+class PolicyCategory(BaseModel):
+    category: Literal["labor_law_and_employment_policy_query", "migration_or_visa_or_workforce_mobility_query",
+                      "social_security_or_insurance_or_emiratisation_schemes", "not_policy_related"]
+    reason: str = Field(..., description="One sentence explaining the category.")
+    choice: Optional[int] = None
+
+
+class PolicyResponse(BaseModel):
+    """Picks the policy module relevant to the user message."""
+    policy: PolicyCategory
+    user_message: Optional[str] = None
+
+
+RESPONSE_MODELS = {
+    "qualifier": QualifierResponse,
+    "complexity": ComplexityResponse,
+    "policy": PolicyResponse,
+}
+
+ROUTING_DICTS = dict(
+    qualifier_dict={"labour_market_query": 1, "conversational_query": 2, "out_of_context_query": 3},
+    complexity_dict={"Simple_Queries": 1, "Moderate_Queries": 2, "Advanced_Queries": 3},
+    policy_dict={"labor_law_and_employment_policy_query": 1, "migration_or_visa_or_workforce_mobility_query": 2,
+                 "social_security_or_insurance_or_emiratisation_schemes": 3, "not_policy_related": 0},
+)
+
+
+def total_tokens(response) -> int:
+    raw_response = getattr(response, "_raw_response", None)
+    return raw_response.usage.total_tokens if raw_response is not None and raw_response.usage else 0
+
+
+def run(llm: RouterLLM, prompts) -> dict:
+    separate_seconds, composite_seconds = [], []
+    separate_tokens, composite_tokens = 0, 0
+    composite_model = build_composite_model(RESPONSE_MODELS)
+
+    for prompt in prompts:
+        start = time.perf_counter()
+        for response_model in RESPONSE_MODELS.values():
+            response = llm.structured_output_to_pydantic_model(prompt, response_model=response_model)
+            separate_tokens += total_tokens(response)
+        separate_seconds.append(time.perf_counter() - start)
+
+        # Same request `composite_route` sends, kept whole to read the token usage
+        start = time.perf_counter()
+        response = llm.structured_output_to_pydantic_model(prompt, response_model=composite_model)
+        composite_seconds.append(time.perf_counter() - start)
+        composite_tokens += total_tokens(response)
+
+    return {
+        "prompts": len(prompts),
+        "attributes": len(RESPONSE_MODELS),
+        "separate_mean_ms": 1000 * statistics.mean(separate_seconds),
+        "composite_mean_ms": 1000 * statistics.mean(composite_seconds),
+        "latency_saving": 1 - statistics.mean(composite_seconds) / statistics.mean(separate_seconds),
+        "separate_tokens": separate_tokens,
+        "composite_tokens": composite_tokens,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--log", default="benchmarks/data/query_log.jsonl")
+    parser.add_argument("--base-url", default=LLAMA3_2_API_BASE)
+    parser.add_argument("--api-key", default=LLAMA3_2_API_KEY)
+    parser.add_argument("--model", default=LLAMA3_2_API_MODEL_NAME)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    router = RouterLLM(model=args.model, openai_api_base=args.base_url, openai_api_key=args.api_key,
+                       temperature=0, **ROUTING_DICTS)
+    queries = [query for query, _ in load_query_log(args.log)][:args.limit]
+    print(json.dumps(run(router, queries), indent=2))
@@ -0,0 +1,108 @@
+"""
+Microbenchmark of the `RouterLLM` post-processing path: response -> `LLMResult` -> consumer.
+
+No LLM is called. Pre-built routing responses go through `__process_response__` and are read
+back the way consumers do:
+
+- `json_text`: the default `Generation(text=model_dump_json(indent=2))`, parsed back with
+  `model_validate_json`.
+- `parsed`: `parsed_generations=True`; the consumer takes the object from `generation_info`.
+- `parsed_text_read`: as `parsed`, but `.text` is also read, forcing the lazy compact dump.
+
+Usage:
+    python -m benchmarks.llmresult_postprocessing --responses 10000
+"""
+import argparse
+import json
+import time
+import tracemalloc
+from typing import Callable, List, Literal, Optional
+
+from langchain_core.outputs import LLMResult
+from pydantic import BaseModel, Field
+
+from src.model.base import RouterLLM
+from src.model.generation import parsed_response
+
+
+class QualifierCategory(BaseModel):
+    category: Literal["labour_market_query", "conversational_query", "out_of_context_query"]
+    reason: str = Field(..., description="One sentence explaining the category.")
+    choice: Optional[int] = None
+
+
+class QualifierResponse(BaseModel):
+    qualifier: QualifierCategory
+    keywords: List[str] = []
+    user_message: Optional[str] = None
+
+
+def build_responses(count: int) -> List[QualifierResponse]:
+    return [
+        QualifierResponse(
+            qualifier=QualifierCategory(category="labour_market_query",
+                                        reason=f"The user asks about employment figures ({index})."),
+            keywords=["employment", "UAE", "2024", f"sector-{index % 17}"],
+        )
+        for index in range(count)
+    ]
+
+
+def json_text(llm: RouterLLM, prompts, responses):
+    result = LLMResult(generations=[[llm.__process_response__(p, r) for p, r in zip(prompts, responses)]])
+    return [QualifierResponse.model_validate_json(g.text) for g in result.generations[0]]
+
+
+def parsed(llm: RouterLLM, prompts, responses):
+    result = LLMResult(generations=[[llm.__process_response__(p, r) for p, r in zip(prompts, responses)]])
+    return [parsed_response(g) for g in result.generations[0]]
+
+
+def parsed_text_read(llm: RouterLLM, prompts, responses):
+    result = LLMResult(generations=[[llm.__process_response__(p, r) for p, r in zip(prompts, responses)]])
+    return [(parsed_response(g), g.text)[0] for g in result.generations[0]]
+
+
+def measure(name: str, path: Callable, parsed_generations: bool, count: int, repeats: int) -> dict:
+    llm = RouterLLM(model="benchmark", openai_api_base="http://localhost:1/v1", openai_api_key="EMPTY",
+                    qualifier_dict={"labour_market_query": 1, "conversational_query": 2, "out_of_context_query": 3},
+                    parsed_generations=parsed_generations)
+    prompts = [f"How many people were employed in sector {index % 17}?" for index in range(count)]
+    timings = []
+    for _ in range(repeats):
+        responses = build_responses(count)
+        start = time.perf_counter()
+        path(llm, prompts, responses)
+        timings.append(time.perf_counter() - start)
+
+    responses = build_responses(count)
+    tracemalloc.start()
+    path(llm, prompts, responses)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    best = min(timings)
+    return {
+        "path": name,
+        "responses": count,
+        "best_seconds": round(best, 4),
+        "us_per_response": round(best / count * 1e6, 2),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--responses", type=int, default=10000)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    results = [
+        measure("json_text", json_text, False, args.responses, args.repeats),
+        measure("parsed", parsed, True, args.responses, args.repeats),
+        measure("parsed_text_read", parsed_text_read, True, args.responses, args.repeats),
+    ]
+    baseline = results[0]["best_seconds"]
+    for result in results:
+        result["speedup"] = round(baseline / result["best_seconds"], 2)
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,334 @@
+"""
+Local OpenAI-compatible chat completion server for benchmarks.
+
+The server answers `/v1/chat/completions` after a delay drawn from a configurable latency
+distribution. When the request carries tools, the first tool is called with arguments
+generated from its JSON schema, so `RouterLLM` structured outputs validate; otherwise a short
+text answer is returned. Requests with `stream: true` are answered with server-sent events,
+one chunk every `token_latency` seconds. `/rerank` requests are answered in the vLLM/Cohere
+format, scoring each document by the share of query words it contains, and `/embeddings`
+requests with `HashingEmbedder` vectors.
+
+Faults can be injected: a fraction of requests fails with `error_status` (503 by default,
+429 comes with a Retry-After header), hangs for `hang_seconds` to trigger client timeouts,
+or returns truncated tool-call arguments.
+
+Given a cassette recorded with `CASSETTE_MODE=record`, the server instead replays the
+recorded responses, with their latencies and stream timings divided by `speedup`.
+
+Usage:
+    python -m benchmarks.mock_server --port 8900 --latency 0.2 --jitter 0.05
+    python -m benchmarks.mock_server --distribution lognormal --latency 0.8 --jitter 0.6 --error-rate 0.05
+    python -m benchmarks.mock_server --cassette benchmarks/data/cassette.jsonl --speedup 10
+"""
+import argparse
+import base64
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional
+
+from src.model.cassette import Cassette, request_fingerprint
+from src.model.semantic_cache import HashingEmbedder
+
+DISTRIBUTIONS = ("fixed", "normal", "lognormal", "exponential")
+
+
+def example_from_schema(schema: Dict, definitions: Optional[Dict] = None) -> Any:
+    """
+    Builds a minimal value valid against a JSON schema as emitted by pydantic.
+    """
+    definitions = definitions if definitions is not None else schema.get("$defs", {})
+    if "$ref" in schema:
+        return example_from_schema(definitions[schema["$ref"].split("/")[-1]], definitions)
+    if "enum" in schema:
+        return schema["enum"][0]
+    if "const" in schema:
+        return schema["const"]
+    for key in ("anyOf", "oneOf", "allOf"):
+        if key in schema:
+            options = [option for option in schema[key] if option.get("type") != "null"] or schema[key]
+            return example_from_schema(options[0], definitions)
+    if "default" in schema:
+        return schema["default"]
+
+    schema_type = schema.get("type", "object")
+    if schema_type == "object":
+        properties = schema.get("properties", {})
+        return {name: example_from_schema(properties[name], definitions) for name in schema.get("required", [])}
+    if schema_type == "array":
+        return []
+    return {"string": "mock", "integer": 0, "number": 0.0, "boolean": False, "null": None}[schema_type]
+
+
+def _pieces(text: str, size: int) -> List[str]:
+    return [text[index:index + size] for index in range(0, len(text), size)] or [""]
+
+
+class MockServer:
+    """
+    OpenAI-compatible server running in a background thread.
+
+    Args:
+        port (int): Port to listen on; 0 picks a free port.
+        latency (float): Mean response delay in seconds (time to the first streamed chunk).
+        jitter (float): Standard deviation of the delay.
+        error_rate (float): Fraction of requests answered with `error_status`.
+        distribution (str): Latency distribution: `fixed`, `normal`, `lognormal` (heavy tail with
+            the given mean and deviation) or `exponential` (mean `latency`).
+        token_latency (float): Delay between streamed chunks.
+        error_status (int): HTTP status of injected errors.
+        timeout_rate (float): Fraction of requests held for `hang_seconds` before answering.
+        hang_seconds (float): How long a hanging request is held.
+        malformed_rate (float): Fraction of tool calls answered with truncated JSON arguments.
+        text (str): Answer of requests without tools.
+        cassette (Optional[Cassette]): Recorded traffic to replay instead of generating answers.
+        speedup (float): Factor by which replayed latencies are shortened; 0 replays at once.
+    """
+
+    def __init__(self, port: int = 0, latency: float = 0.1, jitter: float = 0.0, error_rate: float = 0.0,
+                 distribution: str = "normal", token_latency: float = 0.01, error_status: int = 503,
+                 timeout_rate: float = 0.0, hang_seconds: float = 30.0, malformed_rate: float = 0.0,
+                 text: str = "A", cassette: Optional[Cassette] = None, speedup: float = 1.0):
+        if distribution not in DISTRIBUTIONS:
+            raise Exception(f"Unknown latency distribution `{distribution}`, expected one of {DISTRIBUTIONS}")
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.distribution = distribution
+        self.token_latency = token_latency
+        self.error_status = error_status
+        self.timeout_rate = timeout_rate
+        self.hang_seconds = hang_seconds
+        self.malformed_rate = malformed_rate
+        self.text = text
+        self.cassette = cassette
+        self.speedup = speedup
+        self.requests = 0
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def delay(self) -> float:
+        if self.distribution == "fixed" or (self.distribution == "normal" and not self.jitter):
+            return self.latency
+        if self.distribution == "normal":
+            return max(0.0, random.gauss(self.latency, self.jitter))
+        if self.distribution == "exponential":
+            return random.expovariate(1 / self.latency) if self.latency > 0 else 0.0
+        # Log-normal with the requested mean and standard deviation
+        sigma2 = math.log(1 + (self.jitter / self.latency) ** 2) if self.latency > 0 else 0.0
+        return random.lognormvariate(math.log(max(self.latency, 1e-9)) - sigma2 / 2, math.sqrt(sigma2))
+
+    def __message__(self, body: Dict) -> Dict:
+        tools = body.get("tools") or []
+        if not tools:
+            return {"role": "assistant", "content": self.text}
+        function = tools[0]["function"]
+        arguments = json.dumps(example_from_schema(function.get("parameters", {})))
+        if random.random() < self.malformed_rate:
+            arguments = arguments[:max(1, len(arguments) // 2)]
+        return {"role": "assistant", "content": None, "tool_calls": [{
+            "id": "call_0", "type": "function",
+            "function": {"name": function["name"], "arguments": arguments},
+        }]}
+
+    def completion(self, body: Dict) -> Dict:
+        message = self.__message__(body)
+        return {
+            "id": f"mock-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if message.get("tool_calls")
+                         else "stop", "logprobs": None}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+        }
+
+    def rerank(self, body: Dict) -> Dict:
+        words = set(body.get("query", "").lower().split())
+        results = [
+            {"index": index, "relevance_score": len(words & set(document.lower().split())) / max(1, len(words))}
+            for index, document in enumerate(body.get("documents") or [])
+        ]
+        return {"id": f"mock-{self.requests}", "model": body.get("model", "mock"),
+                "results": sorted(results, key=lambda result: result["relevance_score"], reverse=True)}
+
+    def embeddings(self, body: Dict) -> Dict:
+        texts = body.get("input") or []
+        texts = [texts] if isinstance(texts, str) else texts
+        vectors = HashingEmbedder(dim=body.get("dimensions") or 256)(texts)
+        return {"object": "list", "model": body.get("model", "mock"),
+                "data": [{"object": "embedding", "index": index,
+                          "embedding": base64.b64encode(vector.tobytes()).decode("ascii")
+                          if body.get("encoding_format") == "base64" else vector.tolist()}
+                         for index, vector in enumerate(vectors)],
+                "usage": {"prompt_tokens": len(texts), "total_tokens": len(texts)}}
+
+    def completion_chunks(self, body: Dict) -> Iterator[Dict]:
+        """
+        Yields the `chat.completion.chunk` events of a streamed answer.
+        """
+        message = self.__message__(body)
+        base = {"id": f"mock-{self.requests}", "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": body.get("model", "mock")}
+
+        def chunk(delta: Dict, finish_reason: Optional[str] = None) -> Dict:
+            return dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": finish_reason,
+                                        "logprobs": None}])
+
+        if message.get("tool_calls"):
+            call = message["tool_calls"][0]
+            yield chunk({"role": "assistant", "content": None, "tool_calls": [{
+                "index": 0, "id": call["id"], "type": "function",
+                "function": {"name": call["function"]["name"], "arguments": ""}}]})
+            for piece in _pieces(call["function"]["arguments"], 8):
+                yield chunk({"tool_calls": [{"index": 0, "function": {"arguments": piece}}]})
+            yield chunk({}, "tool_calls")
+        else:
+            yield chunk({"role": "assistant", "content": ""})
+            for piece in _pieces(message["content"], 4):
+                yield chunk({"content": piece})
+            yield chunk({}, "stop")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield dict(base, choices=[], usage={"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15})
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, payload, headers: Optional[Dict] = None):
+                data = payload.encode() if isinstance(payload, str) else json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                for name, value in (headers or {}).items():
+                    if name.lower() != "content-type":
+                        self.send_header(name, value)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up on the request, e.g. a cancelled hedge
+                    pass
+
+            def _stream(self, events: Iterator, delay: Optional[float] = None):
+                """
+                Sends `(seconds to wait, text)` pairs as a chunked event stream.
+                """
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for wait, text in events:
+                        if wait > 0:
+                            time.sleep(wait)
+                        data = text.encode("utf-8")
+                        self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+                        self.wfile.flush()
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def _generated_stream(self, body: Dict) -> Iterator:
+                for index, event in enumerate(server.completion_chunks(body)):
+                    yield (server.token_latency if index else 0.0), f"data: {json.dumps(event)}\n\n"
+                yield server.token_latency, "data: [DONE]\n\n"
+
+            def _replay(self, raw: bytes):
+                interaction = server.cassette.next(request_fingerprint("POST", self.path, raw))
+                if interaction is None:
+                    self._send(404, {"error": {"message": "No recorded response", "type": "cassette_miss"}})
+                    return
+                scale = 1 / server.speedup if server.speedup > 0 else 0.0
+                time.sleep(interaction["latency"] * scale)
+                if "chunks" not in interaction:
+                    self._send(interaction["status"], interaction["body"], interaction["headers"])
+                    return
+
+                def events():
+                    previous = 0.0
+                    for offset, text in interaction["chunks"]:
+                        yield (offset - previous) * scale, text
+                        previous = offset
+
+                self._stream(events())
+
+            def do_POST(self):
+                raw = self.rfile.read(int(self.headers["Content-Length"]))
+                server.requests += 1
+                if server.cassette is not None:
+                    self._replay(raw)
+                    return
+
+                body = json.loads(raw)
+                time.sleep(server.delay())
+                if random.random() < server.timeout_rate:
+                    time.sleep(server.hang_seconds)
+                if random.random() < server.error_rate:
+                    headers = {"Retry-After": "1"} if server.error_status == 429 else None
+                    self._send(server.error_status, {"error": {"message": "Injected error", "type": "server_error"}},
+                               headers)
+                elif self.path.endswith("/rerank"):
+                    self._send(200, server.rerank(body))
+                elif self.path.endswith("/embeddings"):
+                    self._send(200, server.embeddings(body))
+                elif body.get("stream"):
+                    self._stream(self._generated_stream(body))
+                else:
+                    self._send(200, server.completion(body))
+
+        return Handler
+
+    def start(self) -> "MockServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "MockServer":
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--distribution", choices=DISTRIBUTIONS, default="normal")
+    parser.add_argument("--token-latency", type=float, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--hang-seconds", type=float, default=30.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--cassette", help="Replay the responses recorded in this cassette")
+    parser.add_argument("--speedup", type=float, default=1.0)
+    args = parser.parse_args()
+
+    mock = MockServer(args.port, args.latency, args.jitter, args.error_rate, distribution=args.distribution,
+                      token_latency=args.token_latency, error_status=args.error_status,
+                      timeout_rate=args.timeout_rate, hang_seconds=args.hang_seconds,
+                      malformed_rate=args.malformed_rate,
+                      cassette=Cassette(args.cassette) if args.cassette else None, speedup=args.speedup)
+    print(f"Serving on {mock.base_url}")
+    mock._server.serve_forever()
@@ -0,0 +1,115 @@
+"""
+Load test of the latency-aware `ModelPool` against round-robin balancing.
+
+Three local mock replicas are started: a fast one, a slow and jittery one, and one that
+fails a share of its requests. The same burst of concurrent `RouterLLM` requests is sent
+through a round-robin pool and through `ModelPool`; latency percentiles and per-replica
+traffic are reported for both.
+
+Usage:
+    python -m benchmarks.pool_load_test --requests 300 --concurrency 16
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import statistics
+import time
+from typing import List, Literal
+
+from pydantic import BaseModel
+
+from benchmarks.mock_server import MockServer
+from src.model.base import RouterLLM
+from src.model.pool import ModelPool, Replica
+
+
+class Route(BaseModel):
+    category: Literal["labour_market_query", "conversational_query", "out_of_context_query"]
+
+
+class RoundRobinPool(ModelPool):
+    """
+    Baseline pool cycling through available replicas regardless of latency.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cycle = itertools.cycle(self.replicas)
+
+    def choose(self, exclude=()) -> Replica:
+        with self._lock:
+            now = time.monotonic()
+            for _ in range(len(self.replicas)):
+                replica = next(self._cycle)
+                if replica.is_available(now):
+                    break
+            replica.in_flight += 1
+            replica.requests += 1
+            return replica
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run(pool: ModelPool, requests: int, concurrency: int) -> dict:
+    llm = RouterLLM(model="mock", openai_api_base=pool.replicas[0].base_url, openai_api_key="mock",
+                    model_pool=pool)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            # Failed requests come back as an empty result rather than an exception
+            try:
+                response = await llm.astructured_output_to_pydantic_model(f"Request {i}", response_model=Route)
+            except Exception:
+                response = None
+            if not isinstance(response, Route):
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    return {
+        "throughput_rps": requests / elapsed,
+        "mean_ms": 1000 * statistics.mean(latencies),
+        "p50_ms": 1000 * percentile(latencies, 0.50),
+        "p95_ms": 1000 * percentile(latencies, 0.95),
+        "p99_ms": 1000 * percentile(latencies, 0.99),
+        "errors": errors,
+        "replicas": {r["name"]: {"requests": r["requests"], "failures": r["failures"], "ejections": r["ejections"]}
+                     for r in pool.stats()},
+    }
+
+
+def replicas(servers: List[MockServer]) -> List[Replica]:
+    return [Replica(name=f"replica-{i}", base_url=server.base_url, api_key="mock", model="mock")
+            for i, server in enumerate(servers)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    servers = [
+        MockServer(latency=0.05, jitter=0.01).start(),
+        MockServer(latency=0.30, jitter=0.15).start(),
+        MockServer(latency=0.05, jitter=0.01, error_rate=0.5).start(),
+    ]
+    try:
+        report = {
+            "round_robin": asyncio.run(run(RoundRobinPool(replicas(servers)), args.requests, args.concurrency)),
+            "model_pool": asyncio.run(run(ModelPool(replicas(servers)), args.requests, args.concurrency)),
+        }
+    finally:
+        for server in servers:
+            server.stop()
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,95 @@
+"""
+Replays recorded LLM traffic with its original arrival pattern, compressed by a speedup factor.
+
+Record a cassette by running any demo or `RouterLLM` code with `CASSETTE_MODE=record`. Every
+recorded request is then re-sent at its original offset divided by `--speedup` to a target:
+by default a local `MockServer` answering from the same cassette at the same speedup, which
+makes the run deterministic and offline, or any OpenAI-compatible `--base-url`. Throughput,
+latency percentiles and status counts are reported, so runs before and after a change can be
+compared.
+
+Usage:
+    CASSETTE_MODE=record python selector_group_chat_demo.py
+    python -m benchmarks.replay_cassette --cassette benchmarks/data/cassette.jsonl --speedup 20
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.mock_server import MockServer
+from src.constants import CASSETTE_PATH
+from src.model.cassette import Cassette
+
+
+def percentile(values: List[float], quantile: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(quantile * len(ordered)))], 4)
+
+
+async def replay(interactions: List[Dict], base_url: str, speedup: float, concurrency: int) -> Dict:
+    """
+    Sends the recorded requests to `base_url`, keeping their relative start times divided by `speedup`.
+    """
+    origin = min(interaction["started"] for interaction in interactions)
+    base = httpx.URL(base_url)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, statuses = [], Counter()
+
+    async with httpx.AsyncClient(timeout=None, limits=httpx.Limits(max_connections=concurrency)) as client:
+        start = time.perf_counter()
+
+        async def send(interaction: Dict):
+            offset = (interaction["started"] - origin) / speedup if speedup > 0 else 0.0
+            await asyncio.sleep(max(0.0, offset - (time.perf_counter() - start)))
+            # Recorded paths carry the recording base URL's prefix; keep the target's host
+            url = base.copy_with(path=interaction["path"])
+            async with semaphore:
+                sent = time.perf_counter()
+                async with client.stream(interaction["method"], url, json=interaction["request"]) as response:
+                    await response.aread()
+                latencies.append(time.perf_counter() - sent)
+                statuses[response.status_code] += 1
+
+        await asyncio.gather(*[send(interaction) for interaction in interactions])
+        elapsed = time.perf_counter() - start
+
+    return {
+        "requests": len(interactions),
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(interactions) / elapsed, 2) if elapsed else None,
+        "latency_mean": round(statistics.fmean(latencies), 4) if latencies else None,
+        "latency_p50": percentile(latencies, 0.50),
+        "latency_p95": percentile(latencies, 0.95),
+        "latency_p99": percentile(latencies, 0.99),
+        "statuses": dict(statuses),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cassette", default=CASSETTE_PATH)
+    parser.add_argument("--speedup", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--base-url", help="Target endpoint; by default a mock server replaying the cassette")
+    args = parser.parse_args()
+
+    cassette = Cassette(args.cassette)
+    interactions = [interaction for interaction in cassette.interactions() if interaction["request"] is not None]
+    if not interactions:
+        raise SystemExit(f"No replayable requests in {args.cassette}")
+
+    if args.base_url:
+        report = asyncio.run(replay(interactions, args.base_url, args.speedup, args.concurrency))
+    else:
+        with MockServer(cassette=Cassette(args.cassette), speedup=args.speedup) as mock:
+            report = asyncio.run(replay(interactions, mock.base_url, args.speedup, args.concurrency))
+    report.update(cassette=args.cassette, speedup=args.speedup)
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,243 @@
+"""
+Load test of `RouterLLM` against a local mock backend.
+
+Three client paths are driven: `structured_output_to_pydantic_model`, `_generate` and the
+`function_calling` mode. For every combination of concurrency, prompt size and schema size
+the same number of requests is sent from a thread pool; unique prompts keep request
+coalescing out of the way. The mock backend runs in a separate process, so the CPU time
+measured here is the client's own.
+
+Reported per configuration:
+- throughput and p50/p95/p99 latency of the timed run;
+- `cpu_ms_per_request`: process CPU time of the run divided by the requests;
+- `failures`: requests that raised or came back empty (`{}`, or a generation without text);
+- `alloc_kib_per_request`: mean peak of traced memory during one request, and
+  `retained_blocks_per_request`: memory blocks still allocated after a request, i.e. the net
+  allocations a request leaves behind (a leak signal), not the number of allocations it makes;
+  both from a short sequential run under `tracemalloc` after the timed run.
+
+Results are written as JSON to `--output`; pass a previous file as `--baseline` to print the
+relative change of throughput and p95 per configuration.
+
+Usage:
+    python -m benchmarks.router_load_test --concurrency 1 8 32 --prompt-tokens 50 1000 4000 --schema-fields 2 10 40
+    python -m benchmarks.router_load_test --baseline benchmarks/results/router_load_test_20250101T120000.json
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Literal, Optional, Tuple, Type
+
+import httpx
+from instructor import OpenAISchema
+from langchain_core.outputs import LLMResult
+from pydantic import BaseModel, Field, create_model
+
+from benchmarks.replay_cassette import percentile
+from src.model.base import RouterLLM
+
+PATHS = ("structured", "generate", "function_calling")
+WORDS = "How many Emirati nationals were employed in the private sector in Dubai during 2024".split()
+
+
+def build_schema(fields: int, base: Type[BaseModel] = BaseModel) -> Type[BaseModel]:
+    """
+    Builds a response model with `fields` fields cycling through literal, string, integer and list types.
+    """
+    kinds = [
+        (Literal["labour_market_query", "conversational_query", "out_of_context_query"], ...),
+        (str, Field(..., description="One sentence.")),
+        (int, 0),
+        (List[str], []),
+    ]
+    definitions = {f"field_{index}": kinds[index % len(kinds)] for index in range(fields)}
+    definitions["user_message"] = (Optional[str], None)
+    return create_model(f"Schema{fields}", __base__=base, **definitions)
+
+
+def build_prompt(tokens: int, index: int) -> str:
+    # Roughly 1.3 tokens per word; the index keeps prompts unique
+    words = [WORDS[position % len(WORDS)] for position in range(int(tokens / 1.3))]
+    return f"[{index}] " + " ".join(words)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_backend(latency: float, jitter: float, distribution: str) -> Tuple[subprocess.Popen, str]:
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.mock_server", "--port", str(port), "--latency", str(latency),
+         "--jitter", str(jitter), "--distribution", distribution],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}/v1"
+    for _ in range(100):
+        try:
+            httpx.post(f"{base_url}/chat/completions", json={"model": "mock", "messages": []}, timeout=5)
+            return process, base_url
+        except httpx.TransportError:
+            time.sleep(0.1)
+    process.kill()
+    raise Exception("Mock backend did not start")
+
+
+def request_fn(path: str, base_url: str, fields: int) -> Callable[[str], object]:
+    """
+    Returns a function sending one request through the given `RouterLLM` path.
+    """
+    common = dict(model="mock", openai_api_base=base_url, openai_api_key="EMPTY")
+    if path == "function_calling":
+        llm = RouterLLM(mode="function_calling", **common)
+        tool = build_schema(fields, OpenAISchema)
+        return lambda prompt: llm.structured_output_to_pydantic_model(prompt, tool_functions=[tool])
+
+    llm = RouterLLM(**common)
+    schema = build_schema(fields)
+    if path == "generate":
+        return lambda prompt: llm._generate([prompt], response_model=schema)
+    return lambda prompt: llm.structured_output_to_pydantic_model(prompt, response_model=schema)
+
+
+def succeeded(response) -> bool:
+    """
+    Tells whether a `RouterLLM` call answered: failures come back as `{}`, or as a generation without text.
+    """
+    if isinstance(response, LLMResult):
+        return bool(response.generations and response.generations[0] and response.generations[0][0].text)
+    return bool(response)
+
+
+def run_config(path: str, base_url: str, concurrency: int, prompt_tokens: int, fields: int, requests: int,
+               alloc_samples: int) -> Dict:
+    send = request_fn(path, base_url, fields)
+    prompts = [build_prompt(prompt_tokens, index) for index in range(requests + alloc_samples + concurrency)]
+    # Warm up connections and schema caches
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(send, prompts[:concurrency]))
+    prompts = prompts[concurrency:]
+
+    latencies, failures = [], 0
+
+    def timed(prompt: str):
+        nonlocal failures
+        start = time.perf_counter()
+        try:
+            response = send(prompt)
+        except Exception:
+            response = None
+        latencies.append(time.perf_counter() - start)
+        if not succeeded(response):
+            failures += 1
+
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(timed, prompts[:requests]))
+    wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+    peaks = []
+    tracemalloc.start()
+    blocks_start = len(tracemalloc.take_snapshot().traces)
+    for prompt in prompts[requests:requests + alloc_samples]:
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        send(prompt)
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    blocks = len(tracemalloc.take_snapshot().traces) - blocks_start
+    tracemalloc.stop()
+
+    return {
+        "path": path,
+        "concurrency": concurrency,
+        "prompt_tokens": prompt_tokens,
+        "schema_fields": fields,
+        "requests": requests,
+        "failures": failures,
+        "throughput_rps": round(requests / wall, 2),
+        "latency_p50": percentile(latencies, 0.50),
+        "latency_p95": percentile(latencies, 0.95),
+        "latency_p99": percentile(latencies, 0.99),
+        "cpu_ms_per_request": round(cpu / requests * 1000, 3),
+        "alloc_kib_per_request": round(sum(peaks) / len(peaks) / 1024, 1) if peaks else None,
+        "retained_blocks_per_request": round(blocks / len(peaks), 1) if peaks else None,
+    }
+
+
+def config_key(result: Dict) -> tuple:
+    return result["path"], result["concurrency"], result["prompt_tokens"], result["schema_fields"]
+
+
+def compare(results: List[Dict], baseline_path: str):
+    with open(baseline_path, "r", encoding="utf-8") as file:
+        baseline = {config_key(result): result for result in json.load(file)["results"]}
+    for result in results:
+        previous = baseline.get(config_key(result))
+        if previous is None:
+            continue
+        throughput = result["throughput_rps"] / previous["throughput_rps"] - 1
+        p95 = result["latency_p95"] / previous["latency_p95"] - 1
+        cpu = result["cpu_ms_per_request"] / previous["cpu_ms_per_request"] - 1
+        print(f"{'/'.join(map(str, config_key(result))):40s} throughput {throughput:+.1%}  p95 {p95:+.1%}  "
+              f"cpu {cpu:+.1%}")
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paths", nargs="+", choices=PATHS, default=list(PATHS))
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--prompt-tokens", nargs="+", type=int, default=[50, 1000])
+    parser.add_argument("--schema-fields", nargs="+", type=int, default=[2, 20])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--alloc-samples", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--distribution", default="lognormal")
+    parser.add_argument("--output", default=os.path.join(
+        "benchmarks", "results", f"router_load_test_{datetime.now().strftime('%Y%m%dT%H%M%S')}.json"))
+    parser.add_argument("--baseline", help="Previous results file to compare against")
+    args = parser.parse_args()
+
+    backend, base_url = start_backend(args.latency, args.jitter, args.distribution)
+    results = []
+    try:
+        for path, concurrency, prompt_tokens, fields in itertools.product(
+                args.paths, args.concurrency, args.prompt_tokens, args.schema_fields):
+            result = run_config(path, base_url, concurrency, prompt_tokens, fields, args.requests,
+                                args.alloc_samples)
+            results.append(result)
+            print(json.dumps(result))
+    finally:
+        backend.terminate()
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump({
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "backend": {"latency": args.latency, "jitter": args.jitter, "distribution": args.distribution},
+            "results": results,
+        }, file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        compare(results, args.baseline)
@@ -0,0 +1,83 @@
+"""
+Replays a query log through the `SemanticCache` and reports its hit rate.
+
+Each line of the log is either a plain query or a JSON object with a `query` and an
+optional `label` (the expected routing category). When labels are present the report
+also shows how many hits returned a response cached for a different label.
+
+Usage:
+    python -m benchmarks.semantic_cache_hit_rate --log benchmarks/data/query_log.jsonl --threshold 0.6
+    python -m benchmarks.semantic_cache_hit_rate --embedder api --threshold 0.9
+"""
+import argparse
+import json
+import time
+from typing import List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from src.model.semantic_cache import SemanticCache, HashingEmbedder, OpenAIEmbedder
+
+
+class ReplayedResponse(BaseModel):
+    query: str
+    label: Optional[str] = None
+
+
+def load_query_log(path: str) -> List[Tuple[str, Optional[str]]]:
+    queries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                row = json.loads(line)
+                queries.append((row["query"], row.get("label")))
+            else:
+                queries.append((line, None))
+    return queries
+
+
+def replay(queries, cache: SemanticCache, namespace: str = "benchmark") -> dict:
+    wrong_hits = 0
+    lookup_seconds = 0.0
+    for query, label in queries:
+        start = time.perf_counter()
+        cached = cache.get(query, namespace, ReplayedResponse)
+        lookup_seconds += time.perf_counter() - start
+
+        if cached is None:
+            # A miss stands in for the LLM round-trip; store its response
+            cache.set(query, namespace, ReplayedResponse(query=query, label=label))
+        elif label is not None and cached.label != label:
+            wrong_hits += 1
+
+    report = cache.stats.to_dict()
+    report.update({
+        "queries": len(queries),
+        "wrong_hits": wrong_hits,
+        "mean_lookup_ms": 1000 * lookup_seconds / max(len(queries), 1),
+        "threshold": cache.threshold,
+        "capacity": cache.capacity,
+        "eviction": cache.eviction,
+    })
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--log", default="benchmarks/data/query_log.jsonl")
+    parser.add_argument("--embedder", choices=["hashing", "api"], default="hashing")
+    parser.add_argument("--threshold", type=float, nargs="+", default=[0.5, 0.6, 0.7, 0.8, 0.9])
+    parser.add_argument("--capacity", type=int, default=4096)
+    parser.add_argument("--eviction", choices=["lru", "fifo"], default="lru")
+    args = parser.parse_args()
+
+    queries = load_query_log(args.log)
+    embedder = HashingEmbedder() if args.embedder == "hashing" else OpenAIEmbedder()
+
+    for threshold in args.threshold:
+        cache = SemanticCache(embedder=embedder, threshold=threshold, capacity=args.capacity,
+                              eviction=args.eviction)
+        print(json.dumps(replay(queries, cache)))
@@ -0,0 +1,132 @@
+"""
+Recall-vs-latency benchmark of the local `VectorIndex` on a synthetic clustered corpus.
+
+A corpus of `--corpus` vectors is drawn around random cluster centres, every chunk tagged with
+one module and one country, and indexed as `IVF_FLAT`. Queries are perturbed corpus vectors.
+For every filter (none, module, country, country and module) and every `--n-probe`, the
+recall@k against exact search over the same filtered rows is reported with the search
+latency percentiles, which shows how far `N_PROBE` can be lowered for a target recall.
+
+Usage:
+    python -m benchmarks.vector_index_recall --corpus 1000000 --dim 64 --n-probe 1 4 16 32 64
+"""
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.replay_cassette import percentile
+from src.model.vector_index import VectorIndex
+
+MODULES = ['social_security_or_insurance_or_emiratisation_schemes', 'employment_service_related_queries',
+           'labor_law_and_employment_policy_query', 'migration_or_visa_or_workforce_mobility_query',
+           'mohre_or_government_policy_or_administration_query']
+COUNTRIES = ["UAE", "Saudi Arabia", "Qatar", "Oman", "Kuwait", "Bahrain", "India", "United Kingdom",
+             "United States", "Germany", "France", "Japan", "Australia", "Canada", "Brazil", "South Africa",
+             "Egypt", "Jordan", "Philippines", "Pakistan"]
+
+
+def synthetic_corpus(size: int, dim: int, clusters: int, seed: int):
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dim)).astype(np.float32)
+    vectors = centres[rng.integers(0, clusters, size)] + 0.8 * rng.normal(size=(size, dim)).astype(np.float32)
+    modules = rng.integers(0, len(MODULES), size)
+    # Skewed like real policy corpora: a few countries hold most chunks
+    weights = 1.0 / np.arange(1, len(COUNTRIES) + 1)
+    countries = rng.choice(len(COUNTRIES), size, p=weights / weights.sum())
+    return vectors, modules, countries
+
+
+def exact_top(vectors: np.ndarray, rows: np.ndarray, query: np.ndarray, top_k: int) -> np.ndarray:
+    scores = vectors[rows] @ query
+    best = np.argpartition(-scores, min(top_k, len(scores)) - 1)[:top_k]
+    return rows[best]
+
+
+def run_filter(index: VectorIndex, vectors: np.ndarray, queries: np.ndarray, allowed: np.ndarray,
+               countries: Optional[List[str]], module: Optional[str], n_probes: List[int], top_k: int) -> List[Dict]:
+    truth = [set(exact_top(vectors, allowed, query, top_k).tolist()) for query in queries]
+    results = []
+    for n_probe in n_probes:
+        latencies_ms, recalls = [], []
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            hits = index.search(query, top_k=top_k, n_probe=n_probe, countries=countries, module=module)
+            latencies_ms.append((time.perf_counter() - start) * 1000)
+            recalls.append(len(expected & {hit.id for hit in hits}) / max(1, len(expected)))
+        results.append({
+            "filter": {"countries": countries, "module": module},
+            "allowed_rows": int(len(allowed)),
+            "n_probe": n_probe,
+            "recall": round(float(np.mean(recalls)), 4),
+            "latency_ms_p50": percentile(latencies_ms, 0.50),
+            "latency_ms_p95": percentile(latencies_ms, 0.95),
+            "qps": round(len(queries) / sum(latencies_ms) * 1000, 1),
+        })
+        print(json.dumps(results[-1]))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", type=int, default=1_000_000)
+    parser.add_argument("--dim", type=int, default=64)
+    parser.add_argument("--clusters", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--n-list", type=int, default=0, help="Inverted lists; 0 for the square root of the corpus")
+    parser.add_argument("--n-probe", nargs="+", type=int, default=[1, 2, 4, 8, 16, 32, 64, 128])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--path", help="Index directory; a temporary one by default")
+    parser.add_argument("--output", default=os.path.join(
+        "benchmarks", "results", f"vector_index_recall_{datetime.now().strftime('%Y%m%dT%H%M%S')}.json"))
+    args = parser.parse_args()
+
+    vectors, modules, countries = synthetic_corpus(args.corpus, args.dim, args.clusters, args.seed)
+    records = [{"text": f"chunk {row}", "module": MODULES[modules[row]], "countries": [COUNTRIES[countries[row]]]}
+               for row in range(args.corpus)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.path or os.path.join(directory, "index")
+        start = time.perf_counter()
+        index = VectorIndex.build(path, vectors, records, index_type="IVF_FLAT", metric="IP", n_list=args.n_list,
+                                  seed=args.seed)
+        build_seconds = time.perf_counter() - start
+        print(f"Built {len(index.centroids)} lists over {args.corpus} vectors in {build_seconds:.1f}s")
+
+        rng = np.random.default_rng(args.seed + 1)
+        queries = vectors[rng.choice(args.corpus, args.queries, replace=False)]
+        queries = queries + 0.5 * rng.normal(size=queries.shape).astype(np.float32)
+
+        everything = np.arange(args.corpus)
+        filters = [
+            (everything, None, None),
+            (np.flatnonzero(modules == 0), None, MODULES[0]),
+            (np.flatnonzero(countries == 2), [COUNTRIES[2]], None),
+            (np.flatnonzero((countries == 0) & (modules == 2)), [COUNTRIES[0]], MODULES[2]),
+        ]
+        results = []
+        for allowed, filter_countries, filter_module in filters:
+            results += run_filter(index, vectors, queries, allowed, filter_countries, filter_module, args.n_probe,
+                                  args.top_k)
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump({
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "corpus": args.corpus,
+            "dim": args.dim,
+            "clusters": args.clusters,
+            "top_k": args.top_k,
+            "n_list": int(len(index.centroids)),
+            "build_seconds": round(build_seconds, 2),
+            "results": results,
+        }, file, indent=2)
+    print(f"Results written to {args.output}")
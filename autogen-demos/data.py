@@ -3,7 +3,6 @@ from autogen_agentchat.agents import AssistantAgent, CodeExecutorAgent
 from autogen_agentchat.base import TaskResult
 from autogen_agentchat.messages import TextMessage
 from autogen_core import code_executor
-from autogen_ext.models.openai import OpenAIChatCompletionClient
 from autogen_ext.code_executors.docker import DockerCommandLineCodeExecutor
 from autogen_agentchat.teams import RoundRobinGroupChat
 
@@ -12,15 +11,16 @@ from autogen_agentchat.conditions import TextMentionTermination
 import asyncio
 
 from src.constants import EURI_API_BASE_URL, EURI_API_KEY, EURI_MODEL_NAME_GPT_4_1_NANO, EURI_MODEL_NAME_GPT_4_1_MINI
+from src.model.chat_clients import rate_limited_client
 
 async def main():
-    model = OpenAIChatCompletionClient(
+    model = rate_limited_client(
         model=EURI_MODEL_NAME_GPT_4_1_NANO,
         api_key=EURI_API_KEY,
         base_url=EURI_API_BASE_URL
     )
 
-    model2 = OpenAIChatCompletionClient(
+    model2 = rate_limited_client(
         model=EURI_MODEL_NAME_GPT_4_1_MINI,
         api_key=EURI_API_KEY,
         base_url=EURI_API_BASE_URL
@@ -1,5 +1,4 @@
 import asyncio
-from autogen_ext.models.openai import OpenAIChatCompletionClient
 from autogen_agentchat.agents import AssistantAgent
 from autogen_agentchat.teams import MagenticOneGroupChat
 from autogen_agentchat.ui import Console
@@ -7,9 +6,10 @@ from autogen_agentchat.ui import Console
 from autogen_core.models import ModelFamily, ModelInfo
 
 from src.constants import LLAMA3_2_API_BASE, LLAMA3_2_API_KEY, LLAMA3_2_API_MODEL_NAME, QWEN_API_MODEL_NAME, QWEN_API_KEY, QWEN_API_BASE
+from src.model.chat_clients import rate_limited_client
 
 async def main() -> None:
-    model_client = OpenAIChatCompletionClient(
+    model_client = rate_limited_client(
         model=QWEN_API_MODEL_NAME,
         api_key=QWEN_API_KEY,
         base_url=QWEN_API_BASE,
@@ -28,6 +28,19 @@ from autogen_core.tools import Tool
 
 from multi_agent_design_patterns.data_class.base import WorkerTask, WorkerTaskResult, FinalResult, UserTask, \
     SolverRequest, IntermediateSolverResponse, FinalSolverResponse, Question, Answer, AgentResponse, UserLogin
+from src.model.prompt import assemble_prompt
+
+SYNTHESIS_PROMPT = "You have been provided with a set of responses from various open-source models to the latest user query. Your task is to synthesize these responses into a single, high-quality response. It is crucial to critically evaluate the information provided in these responses, recognizing that some of it may be biased or incorrect. Your response should not simply replicate the given answers but should offer a refined, accurate, and comprehensive reply to the instruction. Ensure your response is well-structured, coherent, and adheres to the highest standards of accuracy and reliability."
+
+
+def synthesis_messages(task: str, previous_results: List[str]) -> List[LLMMessage]:
+    # The instructions stay a fixed system message so every synthesis call shares their cached prefix;
+    # the task and the other models' responses change per call and go last.
+    responses = "\n\n".join([f"{i+1}. {r}" for i, r in enumerate(previous_results)])
+    return [
+        SystemMessage(content=SYNTHESIS_PROMPT),
+        UserMessage(content=assemble_prompt(dynamic=[task, "Responses from models:\n" + responses]), source="user"),
+    ]
 
 
 @default_subscription
@@ -157,11 +170,7 @@ class WorkerAgent(RoutedAgent):
     async def handle_task(self, message: WorkerTask, ctx: MessageContext) -> WorkerTaskResult:
         if message.previous_results:
             # If previous results are provided, we need to synthesize them to create a single prompt.
-            system_prompt = "You have been provided with a set of responses from various open-source models to the latest user query. Your task is to synthesize these responses into a single, high-quality response. It is crucial to critically evaluate the information provided in these responses, recognizing that some of it may be biased or incorrect. Your response should not simply replicate the given answers but should offer a refined, accurate, and comprehensive reply to the instruction. Ensure your response is well-structured, coherent, and adheres to the highest standards of accuracy and reliability.\n\nResponses from models:"
-            system_prompt += "\n" + "\n\n".join([f"{i+1}. {r}" for i, r in enumerate(message.previous_results)])
-            model_result = await self._model_client.create(
-                [SystemMessage(content=system_prompt), UserMessage(content=message.task, source="user")]
-            )
+            model_result = await self._model_client.create(synthesis_messages(message.task, message.previous_results))
         else:
             # If no previous results are provided, we can simply pass the user query to the model.
             model_result = await self._model_client.create([UserMessage(content=message.task, source="user")])
@@ -202,11 +211,7 @@ class OrchestratorAgent(RoutedAgent):
             worker_task = WorkerTask(task=message.task, previous_results=[r.result for r in results])
         # Perform final aggregation.
         print(f"{'-'*80}\nOrchestrator-{self.id}:\nPerforming final aggregation")
-        system_prompt = "You have been provided with a set of responses from various open-source models to the latest user query. Your task is to synthesize these responses into a single, high-quality response. It is crucial to critically evaluate the information provided in these responses, recognizing that some of it may be biased or incorrect. Your response should not simply replicate the given answers but should offer a refined, accurate, and comprehensive reply to the instruction. Ensure your response is well-structured, coherent, and adheres to the highest standards of accuracy and reliability.\n\nResponses from models:"
-        system_prompt += "\n" + "\n\n".join([f"{i+1}. {r}" for i, r in enumerate(worker_task.previous_results)])
-        model_result = await self._model_client.create(
-            [SystemMessage(content=system_prompt), UserMessage(content=message.task, source="user")]
-        )
+        model_result = await self._model_client.create(synthesis_messages(message.task, worker_task.previous_results))
         assert isinstance(model_result.content, str)
         return FinalResult(result=model_result.content)
 
@@ -10,11 +10,11 @@ from autogen_core.models import (
     SystemMessage,
 )
 from autogen_core.tools import FunctionTool
-from autogen_ext.models.openai import OpenAIChatCompletionClient
 
 from multi_agent_design_patterns.agent_class.base import AIAgent, HumanAgent, UserAgent
 from multi_agent_design_patterns.data_class.base import UserLogin
 from src.constants import QWEN_API_MODEL_NAME, QWEN_API_BASE, QWEN_API_KEY, ModelFamily, ModelInfo
+from src.model.chat_clients import guarded_client
 
 
 def execute_order(product: str, price: int) -> str:
@@ -90,7 +90,7 @@ escalate_to_human_tool = FunctionTool(escalate_to_human, description="Only call
 async def main(task):
     runtime = SingleThreadedAgentRuntime()
 
-    model_client = OpenAIChatCompletionClient(
+    model_client = guarded_client(
         model=QWEN_API_MODEL_NAME,
         api_key=QWEN_API_KEY,
         base_url=QWEN_API_BASE,
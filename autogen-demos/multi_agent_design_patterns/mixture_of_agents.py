@@ -1,17 +1,17 @@
 import asyncio
 
 from autogen_core import AgentId, SingleThreadedAgentRuntime
-from autogen_ext.models.openai import OpenAIChatCompletionClient
 
 from multi_agent_design_patterns.agent_class.base import WorkerAgent, OrchestratorAgent
 from multi_agent_design_patterns.data_class.base import UserTask
 from src.constants import LLAMA3_2_API_BASE, LLAMA3_2_API_KEY, LLAMA3_2_API_MODEL_NAME, QWEN_API_MODEL_NAME, \
     QWEN_API_KEY, QWEN_API_BASE, ModelInfo, ModelFamily
+from src.model.chat_clients import rate_limited_client
 
 
 async def main(task):
     runtime = SingleThreadedAgentRuntime()
-    model_client = OpenAIChatCompletionClient(
+    model_client = rate_limited_client(
         model=QWEN_API_MODEL_NAME,
         api_key=QWEN_API_KEY,
         base_url=QWEN_API_BASE,
@@ -6,26 +6,26 @@ from autogen_core import (
     SingleThreadedAgentRuntime,
 )
 
-from autogen_ext.models.openai import OpenAIChatCompletionClient
 
 from multi_agent_design_patterns.agent_class.base import MathSolver, MathAggregator
 from multi_agent_design_patterns.data_class.base import Question
 from src.constants import LLAMA3_2_API_BASE, LLAMA3_2_API_KEY, LLAMA3_2_API_MODEL_NAME, QWEN_API_MODEL_NAME, \
     QWEN_API_KEY, QWEN_API_BASE, ModelInfo, ModelFamily
+from src.model.chat_clients import rate_limited_client
 
 
 async def main(query):
     runtime = SingleThreadedAgentRuntime()
 
 
-    model_client = OpenAIChatCompletionClient(
+    model_client = rate_limited_client(
         model=QWEN_API_MODEL_NAME,
         api_key=QWEN_API_KEY,
         base_url=QWEN_API_BASE,
         model_info=ModelInfo(vision=False, function_calling=True, family=ModelFamily.ANY, json_output=True, structured_output=True),
     )
 
-    model_client1 = OpenAIChatCompletionClient(
+    model_client1 = rate_limited_client(
         model=LLAMA3_2_API_MODEL_NAME,
         api_key=LLAMA3_2_API_KEY,
         base_url=LLAMA3_2_API_BASE,
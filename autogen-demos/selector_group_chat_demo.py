@@ -7,12 +7,13 @@ from autogen_agentchat.conditions import TextMentionTermination, MaxMessageTermi
 from autogen_agentchat.messages import BaseAgentEvent, BaseChatMessage, TextMessage
 from autogen_agentchat.teams import SelectorGroupChat
 from autogen_core.models import ModelInfo, ModelFamily
-from autogen_ext.models.openai import OpenAIChatCompletionClient
 
 from src.constants import QWEN_API_MODEL_NAME, QWEN_API_KEY, QWEN_API_BASE, generate_system_message
+from src.model.chat_clients import guarded_client
+from src.model.prompt import assemble_prompt
 from src.tools import get_data_context_tool, get_policy_context_tool, get_general_context_tool, check_grammar_tool
 
-other_client = OpenAIChatCompletionClient(
+other_client = guarded_client(
     model=QWEN_API_MODEL_NAME,
     api_key=QWEN_API_KEY,
     base_url=QWEN_API_BASE,
@@ -23,7 +24,7 @@ other_client = OpenAIChatCompletionClient(
                          structured_output=True)
 )
 
-greeting_client = OpenAIChatCompletionClient(
+greeting_client = guarded_client(
     model=QWEN_API_MODEL_NAME,
     api_key=QWEN_API_KEY,
     base_url=QWEN_API_BASE,
@@ -38,7 +39,7 @@ system_message = "When you have completed the task, respond with 'TERMINATE' to
 
 greeting_agent = AssistantAgent(
     name="greeting_agent",
-    system_message=generate_system_message("English") + system_message,
+    system_message=assemble_prompt(static=[generate_system_message("English"), system_message]),
     description="Handles simple greetings and hellos, general conversation about the agentic system. Provides friendly introductions and helps users understand how to interact with the system.",
     model_client=greeting_client,
     tools=[]  # No tools needed
@@ -95,24 +96,26 @@ handoff_termination = HandoffTermination(target="user")
 stop_message_termination = StopMessageTermination()
 termination = text_mention_termination | stop_message_termination | handoff_termination | max_messages_termination
 
-selector_prompt = """Select the most appropriate agent to handle the current message based on their specialties:
-
-{roles}
-
-Current conversation context:
-{history}
-
-Available agents: {participants}
-
-Selection criteria:
-- greeting_agent: For initial greetings and basic conversation
-- policy_agent: For questions about labor and economic policies
-- data_agent: For questions about economic data and statistics
-- grammar_agent: For grammar corrections and explanations
-- general_agent: For general knowledge questions not covered by other agents
-
-Select exactly one agent based on the last message in the conversation.
-""" + system_message
+# Instructions and roles first, the conversation last, so every selection reuses the cached prefix
+selector_prompt = assemble_prompt(
+    static=[
+        """Select the most appropriate agent to handle the current message based on their specialties.
+
+        Selection criteria:
+        - greeting_agent: For initial greetings and basic conversation
+        - policy_agent: For questions about labor and economic policies
+        - data_agent: For questions about economic data and statistics
+        - grammar_agent: For grammar corrections and explanations
+        - general_agent: For general knowledge questions not covered by other agents
+        """,
+        system_message,
+    ],
+    stable=["{roles}", "Available agents: {participants}"],
+    dynamic=[
+        "Current conversation context:\n{history}",
+        "Select exactly one agent based on the last message in the conversation.",
+    ],
+)
 
 
 def selector_func(messages: Sequence[BaseAgentEvent | BaseChatMessage]) -> Optional[str]:
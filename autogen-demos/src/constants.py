@@ -1,5 +1,7 @@
 import os
 import sys
+import textwrap
+from functools import lru_cache
 from pathlib import Path
 
 from autogen_core.models import ModelFamily, ModelInfo
@@ -72,8 +74,37 @@ EMBEDDING_DIM = int(LOAD_ENV("MILVUS_EMBEDDING_DIM", "1024"))
 # FAISS
 FAISS_PATH = str(os.getenv("FAISS_PATH", "/home/appuser/apps/chat-api/faiss"))
 
+# Local Vector Index: IVF_FLAT (inverted lists over NumPy arrays) or FLAT (exact search), stored under FAISS_PATH
+POLICY_INDEX_PATH = os.path.join(FAISS_PATH, "policy")
+LOCAL_INDEX_TYPE = str(LOAD_ENV("LOCAL_INDEX_TYPE", "IVF_FLAT"))
+LOCAL_INDEX_N_LIST = int(LOAD_ENV("LOCAL_INDEX_N_LIST", 0))  # 0: square root of the number of chunks
+LOCAL_INDEX_EXACT_ROWS = int(LOAD_ENV("LOCAL_INDEX_EXACT_ROWS", 20000))  # Filters matching fewer rows search exactly
+POLICY_CONTEXT_CHUNKS = int(LOAD_ENV("POLICY_CONTEXT_CHUNKS", 5))
+DATA_INDEX_PATH = os.path.join(FAISS_PATH, "data")
+DATA_CONTEXT_CHUNKS = int(LOAD_ENV("DATA_CONTEXT_CHUNKS", 5))
+
+# Hybrid Retrieval: BM25 parameters of the lexical index and the rank constant of reciprocal-rank fusion
+BM25_K1 = float(LOAD_ENV("BM25_K1", 1.2))
+BM25_B = float(LOAD_ENV("BM25_B", 0.75))
+RRF_K = int(LOAD_ENV("RRF_K", 60))
+
+# Response Cache
+RESPONSE_CACHE_PATH = str(LOAD_ENV("RESPONSE_CACHE_PATH", "/home/appuser/response_cache"))
+RESPONSE_CACHE_TTL = float(LOAD_ENV("RESPONSE_CACHE_TTL", 86400))
+RESPONSE_CACHE_MAX_ITEMS = int(LOAD_ENV("RESPONSE_CACHE_MAX_ITEMS", 1024))
+RESPONSE_CACHE_MAX_BYTES = int(LOAD_ENV("RESPONSE_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+# Semantic Cache
+SEMANTIC_CACHE_THRESHOLD = float(LOAD_ENV("SEMANTIC_CACHE_THRESHOLD", 0.92))
+SEMANTIC_CACHE_CAPACITY = int(LOAD_ENV("SEMANTIC_CACHE_CAPACITY", 4096))
+SEMANTIC_CACHE_EVICTION = str(LOAD_ENV("SEMANTIC_CACHE_EVICTION", "lru"))
+
 # Reranker
 RERANKER_CACHE = str(LOAD_ENV("RERANKER_CACHE", "/home/appuser/rerank_cache"))
+RERANKER_CACHE_TTL = float(LOAD_ENV("RERANKER_CACHE_TTL", 30 * 86400))
+RERANK_MAX_BATCH = int(LOAD_ENV("RERANK_MAX_BATCH", 16))  # Documents per request to the rerank endpoint
+RERANK_MAX_CONCURRENCY = int(LOAD_ENV("RERANK_MAX_CONCURRENCY", 4))
+RERANK_DEADLINE = float(LOAD_ENV("RERANK_DEADLINE", 2.0))  # Seconds before falling back to the first-stage order
 
 EMBEDDING_API_MODEL_URL = LOAD_ENV("MODEL_API_URL_EMBEDDING", "")
 EMBEDDING_API_MODEL_KEY = LOAD_ENV("MODEL_API_KEY_EMBEDDING", "EMPTY")
@@ -85,6 +116,12 @@ SENTENCE_EMBEDDING_API_MODEL_URL = LOAD_ENV("SENTENCE_API_URL_EMBEDDING", "")
 SENTENCE_EMBEDDING_API_MODEL_KEY = LOAD_ENV("SENTENCE_API_KEY_EMBEDDING", "EMPTY")
 SENTENCE_EMBEDDING_API_MODEL_NAME = LOAD_ENV("SENTENCE_API_NAME_EMBEDDING", "bge-m3")
 
+# Embedding Client: micro-batching of concurrent texts and the append-only float16 store of their embeddings
+EMBEDDING_STORE_PATH = str(LOAD_ENV("EMBEDDING_STORE_PATH", "/home/appuser/embedding_store"))
+EMBEDDING_MAX_BATCH = int(LOAD_ENV("EMBEDDING_MAX_BATCH", 64))  # Texts per request to the embedding endpoint
+EMBEDDING_BATCH_WINDOW = float(LOAD_ENV("EMBEDDING_BATCH_WINDOW", 0.01))  # Seconds a batch waits for more texts
+EMBEDDING_MAX_CONCURRENCY = int(LOAD_ENV("EMBEDDING_MAX_CONCURRENCY", 4))
+
 OPENAI_COMPATIBLE_API_KEY = LOAD_ENV("MODEL_API_KEY_CHAT", "")
 OPENAI_COMPATIBLE_API_BASE = LOAD_ENV("MODEL_API_URL_CHAT", "EMPTY")
 OPENAI_COMPATIBLE_API_MODEL_NAME = LOAD_ENV("MODEL_API_NAME_CHAT", "")
@@ -173,6 +210,86 @@ EURI_MODEL_NAME_GEMINI_2_0_FLASH = LOAD_ENV("EURI_MODEL_NAME_GEMINI_2_0_FLASH",
 EURI_MODEL_NAME_GEMINI_2_5_PRO = LOAD_ENV("EURI_MODEL_NAME_GEMINI_2_5_PRO", "")
 EURI_MODEL_NAME_LLAMA_SCOUT = LOAD_ENV("EURI_MODEL_NAME_LLAMA_SCOUT", "")
 
+# Model Pool: interchangeable OpenAI-compatible endpoints usable as load-balanced replicas
+MODEL_POOL_ENDPOINTS = {
+    "LLAMA3_2": {"base_url": LLAMA3_2_API_BASE, "api_key": LLAMA3_2_API_KEY, "model": LLAMA3_2_API_MODEL_NAME},
+    "QWEN": {"base_url": QWEN_API_BASE, "api_key": QWEN_API_KEY, "model": QWEN_API_MODEL_NAME},
+    "CODER": {"base_url": CODER_API_BASE, "api_key": CODER_API_KEY, "model": CODER_API_MODEL_NAME},
+    "CODER_Q": {"base_url": CODER_Q_API_BASE, "api_key": CODER_Q_API_KEY, "model": CODER_Q_API_MODEL_NAME},
+    "EXPERIMENT": {"base_url": EXPERIMENT_API_BASE, "api_key": EXPERIMENT_API_KEY, "model": EXPERIMENT_API_MODEL_NAME},
+    "THINKER": {"base_url": THINKER_API_BASE, "api_key": THINKER_API_KEY, "model": THINKER_API_MODEL_NAME},
+    "EURI": {"base_url": EURI_API_BASE_URL, "api_key": EURI_API_KEY, "model": EURI_MODEL_NAME_GPT_4_1_MINI},
+}
+# Extra comma-separated base URLs serving the same model, e.g. MODEL_API_REPLICAS_QWEN
+MODEL_POOL_REPLICAS = {
+    name: [url.strip() for url in LOAD_ENV(f"MODEL_API_REPLICAS_{name}", "").split(",") if url.strip()]
+    for name in MODEL_POOL_ENDPOINTS
+}
+MODEL_POOL_EWMA_ALPHA = float(LOAD_ENV("MODEL_POOL_EWMA_ALPHA", 0.3))
+MODEL_POOL_FAILURE_THRESHOLD = int(LOAD_ENV("MODEL_POOL_FAILURE_THRESHOLD", 3))
+MODEL_POOL_EJECTION_SECONDS = float(LOAD_ENV("MODEL_POOL_EJECTION_SECONDS", 10))
+MODEL_POOL_MAX_EJECTION_SECONDS = float(LOAD_ENV("MODEL_POOL_MAX_EJECTION_SECONDS", 300))
+
+# Rate Limits: requests per second and tokens per minute per endpoint, e.g. RATE_LIMIT_RPS_QWEN; 0 disables
+RATE_LIMITS = {
+    name: (float(LOAD_ENV(f"RATE_LIMIT_RPS_{name}", 0)), float(LOAD_ENV(f"RATE_LIMIT_TPM_{name}", 0)))
+    for name in MODEL_POOL_ENDPOINTS
+}
+# Directory of the bucket files shared by every worker process on the host
+RATE_LIMIT_PATH = str(LOAD_ENV("RATE_LIMIT_PATH", "/tmp/autogen_rate_limits"))
+RATE_LIMIT_BURST_SECONDS = float(LOAD_ENV("RATE_LIMIT_BURST_SECONDS", 1.0))
+RATE_LIMIT_MAX_WAIT = float(LOAD_ENV("RATE_LIMIT_MAX_WAIT", 120.0))
+
+# Model Cascade: cost per 1K tokens of each endpoint, in relative units roughly proportional to model size
+MODEL_COSTS = {
+    name: float(LOAD_ENV(f"MODEL_COST_{name}", default))
+    for name, default in [("LLAMA3_2", 3), ("QWEN", 32), ("CODER", 32), ("CODER_Q", 32), ("EXPERIMENT", 70),
+                          ("THINKER", 32), ("EURI", 40)]
+}
+# Cheapest first; tiers without a base URL are skipped
+CASCADE_GRAMMAR_TIERS = [name.strip() for name in LOAD_ENV("CASCADE_GRAMMAR_TIERS", "LLAMA3_2,QWEN").split(",")]
+
+# Grammar Checking: long texts are split into sentence-aligned chunks of at most this many tokens, checked concurrently
+GRAMMAR_CHUNK_TOKENS = int(LOAD_ENV("GRAMMAR_CHUNK_TOKENS", 250))
+GRAMMAR_MAX_CONCURRENCY = int(LOAD_ENV("GRAMMAR_MAX_CONCURRENCY", 8))
+
+# Circuit Breaker: opens when the failure rate over the window exceeds the threshold
+CIRCUIT_BREAKER_FAILURE_RATE = float(LOAD_ENV("CIRCUIT_BREAKER_FAILURE_RATE", 0.5))
+CIRCUIT_BREAKER_WINDOW_SECONDS = float(LOAD_ENV("CIRCUIT_BREAKER_WINDOW_SECONDS", 30))
+CIRCUIT_BREAKER_MIN_REQUESTS = int(LOAD_ENV("CIRCUIT_BREAKER_MIN_REQUESTS", 5))
+CIRCUIT_BREAKER_OPEN_SECONDS = float(LOAD_ENV("CIRCUIT_BREAKER_OPEN_SECONDS", 15))
+CIRCUIT_BREAKER_HALF_OPEN_CALLS = int(LOAD_ENV("CIRCUIT_BREAKER_HALF_OPEN_CALLS", 1))
+# MODEL_POOL_ENDPOINTS name receiving the traffic of an open circuit, e.g. LLAMA3_2; empty to fail fast
+CIRCUIT_BREAKER_FALLBACK = str(LOAD_ENV("CIRCUIT_BREAKER_FALLBACK", ""))
+
+# Cassette: "record" writes live LLM traffic to CASSETTE_PATH, "replay" answers from it offline; empty disables
+CASSETTE_MODE = LOAD_ENV("CASSETTE_MODE", "")
+CASSETTE_PATH = LOAD_ENV("CASSETTE_PATH", "benchmarks/data/cassette.jsonl")
+# Replayed latencies are divided by this factor; 0 replays without waiting
+CASSETTE_SPEEDUP = float(LOAD_ENV("CASSETTE_SPEEDUP", 1.0))
+
+# Prompt Prefix: recent requests per model compared to estimate the server's prefix-cache hits; 0 (the default)
+# disables tracking, which tokenizes and logs every request, e.g. 16 to measure a deployment
+PROMPT_PREFIX_WINDOW = int(LOAD_ENV("PROMPT_PREFIX_WINDOW", 0))
+
+# HTTP Connection Pool (shared OpenAI clients)
+HTTP_MAX_CONNECTIONS = int(LOAD_ENV("HTTP_MAX_CONNECTIONS", 100))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(LOAD_ENV("HTTP_MAX_KEEPALIVE_CONNECTIONS", 20))
+HTTP_KEEPALIVE_EXPIRY = float(LOAD_ENV("HTTP_KEEPALIVE_EXPIRY", 30.0))
+HTTP_TIMEOUT = float(LOAD_ENV("HTTP_TIMEOUT", 60.0))
+HTTP_CONNECT_TIMEOUT = float(LOAD_ENV("HTTP_CONNECT_TIMEOUT", 5.0))
+# Retries done inside the OpenAI SDK by the shared clients; `RouterLLM` turns them off on the requests its
+# `Resilience` layer retries, so those fail over to another replica of the model pool instead
+HTTP_MAX_RETRIES = int(LOAD_ENV("HTTP_MAX_RETRIES", 2))
+
+# Resilience: retries and hedged requests of RouterLLM
+RETRY_BASE_DELAY = float(LOAD_ENV("RETRY_BASE_DELAY", 0.5))
+RETRY_MAX_DELAY = float(LOAD_ENV("RETRY_MAX_DELAY", 8.0))
+ATTEMPT_TIMEOUT = float(LOAD_ENV("ATTEMPT_TIMEOUT", 30.0))
+HEDGE_QUANTILE = float(LOAD_ENV("HEDGE_QUANTILE", 0.95))
+HEDGE_MIN_SAMPLES = int(LOAD_ENV("HEDGE_MIN_SAMPLES", 20))
+HEDGE_LATENCY_WINDOW = int(LOAD_ENV("HEDGE_LATENCY_WINDOW", 500))
+
 # This variable is to encourage compatibility of these models with Llama Index LLM API
 UPDATE_FOR_AVAILABLE_MODELS = {
     OPENAI_COMPATIBLE_API_MODEL_NAME: OPENAI_COMPATIBLE_CONTEXT_LENGTH,
@@ -182,6 +299,26 @@ UPDATE_FOR_AVAILABLE_MODELS = {
     EXPERIMENT_API_MODEL_NAME: EXPERIMENT_CONTEXT_LENGTH,
 }
 
+# Context Window: (context length, max completion tokens) per served model, used to trim chat history
+MODEL_TOKEN_LIMITS = {
+    model_name: limits for model_name, limits in [
+        (OPENAI_COMPATIBLE_API_MODEL_NAME, (OPENAI_COMPATIBLE_CONTEXT_LENGTH, OPENAI_COMPATIBLE_MAX_TOKEN)),
+        (ARABIC_API_MODEL_NAME, (ARABIC_CONTEXT_LENGTH, ARABIC_MAX_TOKEN)),
+        (LLAMA3_2_API_MODEL_NAME, (LLAMA3_2_CONTEXT_LENGTH, LLAMA3_2_MAX_TOKEN)),
+        (CODER_API_MODEL_NAME, (CODER_CONTEXT_LENGTH, CODER_MAX_TOKEN)),
+        (QWEN_API_MODEL_NAME, (QWEN_CONTEXT_LENGTH, QWEN_MAX_TOKEN)),
+        (THINKER_API_MODEL_NAME, (THINKER_CONTEXT_LENGTH, THINKER_MAX_TOKEN)),
+        (VISION_OPENAI_COMPATIBLE_API_MODEL_NAME,
+         (VISION_OPENAI_COMPATIBLE_API_CONTEXT_LENGTH, VISION_OPENAI_COMPATIBLE_API_MAX_TOKEN)),
+        (CODER_Q_API_MODEL_NAME, (CODER_Q_CONTEXT_LENGTH, CODER_Q_MAX_TOKEN)),
+        (EXPERIMENT_API_MODEL_NAME, (EXPERIMENT_CONTEXT_LENGTH, EXPERIMENT_MAX_TOKEN)),
+    ] if model_name
+}
+CONTEXT_TOKENIZER_ENCODING = LOAD_ENV("CONTEXT_TOKENIZER_ENCODING", "cl100k_base")
+# Share of the budget kept free because the local tokenizer only approximates the served model's
+CONTEXT_SAFETY_MARGIN = float(LOAD_ENV("CONTEXT_SAFETY_MARGIN", 0.05))
+CONTEXT_SUMMARY_MAX_TOKENS = int(LOAD_ENV("CONTEXT_SUMMARY_MAX_TOKENS", 512))
+
 NLP_MODEL_NAME = "en_core_web_sm"
 
 API_URL_LIBRE = LOAD_ENV("API_URL_LIBRE", "")
@@ -210,6 +347,7 @@ SEED_ANSWERS = [
 # countries = list(pycountry.countries)
 
 
+@lru_cache(maxsize=None)
 def generate_system_message(lang: str) -> str:
     if lang == 'English':
         system_message = f"""
@@ -259,7 +397,9 @@ def generate_system_message(lang: str) -> str:
             Note: Respond in {lang} language only.
         """
 
-    return system_message
+    # Byte-stable across call sites, so the server's prefix cache reuses it; `lang` only changes the last line
+    lines = textwrap.dedent(system_message).strip().splitlines()
+    return "\n".join(line.rstrip() for line in lines)
 
 
 _default_system_message: str = generate_system_message("English")
@@ -1,4 +1,9 @@
+import asyncio
 import inspect
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
 from typing import (
     Any,
     Dict,
@@ -6,19 +11,35 @@ from typing import (
     Optional
 )
 
-import instructor
 from instructor.client import Instructor
 from langchain.llms.base import BaseLLM
 from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
     CallbackManagerForLLMRun,
 )
 from langchain_core.outputs import Generation, LLMResult, RunInfo
 from openai import OpenAI
 from openai.types.chat import ChatCompletionMessage
-from pydantic import Field
+from pydantic import BaseModel, Field
 
 from src.constants import LLAMA3_2_API_BASE, LLAMA3_2_API_KEY, LLAMA3_2_API_MODEL_NAME
 from src.logging import trace_logger
+from src.model.cache import request_key
+from src.model.classification import Classification, TOP_LOGPROBS, label_keys, build_classification_messages, \
+    classification_from_completion
+from src.model.clients import client_registry
+from src.model.composite import build_composite_model, split_composite
+from src.model.context import context_window_for, count_message_tokens, count_text_tokens
+from src.model.generation import ParsedGeneration
+from src.model.prompt import canonical, prefix_tracker, request_text, schema_text
+from src.model.ratelimit import rate_limiter_for, response_tokens
+from src.model.repair import is_parse_failure, repair_failed_response, reask_messages, repair_log
+from src.model.resilience import Resilience
+from src.model.singleflight import single_flight
+from src.model.streaming import complete_strings_model, stream_until, astream_until
+
+# One attempt per instructor call: retries belong to `Resilience` and re-asks to `__structured_create__`
+INSTRUCTOR_MAX_RETRIES = 1
 
 
 class RouterLLM(BaseLLM):
@@ -38,6 +59,22 @@ class RouterLLM(BaseLLM):
         temperature (float): Temperature for controlling randomness in responses.
         max_tokens (int): Maximum number of tokens in a response.
         max_tries (int): Number of attempts for generating a valid response.
+        max_concurrency (int): Maximum number of prompts sent concurrently by `_agenerate`.
+        max_tool_workers (int): Maximum number of tool calls executed concurrently by `function_executor`.
+        response_cache (Optional[Any]): Optional `ResponseCache` consulted before structured requests.
+        semantic_cache (Optional[Any]): Optional `SemanticCache` consulted by `_generate` for paraphrased prompts.
+        model_pool (Optional[Any]): Optional `ModelPool` spreading requests across equivalent replicas.
+        resilience (Optional[Any]): `Resilience` layer retrying and hedging requests; by default one
+            retrying up to `max_tries` attempts without hedging, and with a `model_pool` at least one
+            attempt per replica so a failed request fails over to another replica.
+        rate_limit (bool): Whether requests wait for the endpoint's `RATE_LIMITS` budget, shared across processes.
+        coalesce (bool): Whether concurrent identical structured requests share one in-flight request.
+        repair (bool): Whether structured responses failing to parse are repaired locally before re-asking.
+        max_reasks (int): Times a structured response that cannot be repaired is sent back to the model.
+        parsed_generations (bool): Whether generations carry the validated response in
+            `generation_info["parsed"]`, serializing `.text` only when it is read.
+        context_window (Optional[Any]): `ContextWindow` trimming chat history to the prompt budget; by
+            default one is built from `MODEL_TOKEN_LIMITS` for the configured model.
         frequency_penalty (float): Penalty to reduce repetitive text.
         presence_penalty (float): Penalty to reduce redundancy in context.
         response_format (Optional[Dict]): Format specification for the output.
@@ -45,12 +82,17 @@ class RouterLLM(BaseLLM):
         complexity_dict (Optional[Dict]): Complexity rules for response attributes.
         input_model_params (Optional[Dict]): User-specified model parameters.
         model_params (Optional[Dict]): Parameters used during generation.
-        client (Optional[Any]): OpenAI client instance for handling requests.
+        openai_client (Optional[Any]): Pooled OpenAI client shared through `client_registry`.
+        client (Optional[Any]): Pooled instructor client for handling structured requests.
         set_params (List): List of parameters allowed to be directly set.
 
     Methods:
         __init__: Initializes the RouterLLM with optional parameters.
         _generate: Generates responses based on input prompts.
+        _agenerate: Generates responses for input prompts concurrently on the event loop.
+        stream_structured_output: Yields progressively populated structured responses.
+        classify: Picks a single category label with a calibrated confidence from first-token logprobs.
+        composite_route: Answers several routing response models with a single LLM call.
         _llm_type: Returns the LLM type as a string.
     """
 
@@ -65,6 +107,18 @@ class RouterLLM(BaseLLM):
     temperature: float = 0
     max_tokens: int = 300
     max_tries: int = 1
+    max_concurrency: int = 16
+    max_tool_workers: int = 8
+    response_cache: Optional[Any] = None
+    semantic_cache: Optional[Any] = None
+    model_pool: Optional[Any] = None
+    context_window: Optional[Any] = None
+    coalesce: bool = True
+    rate_limit: bool = True
+    repair: bool = True
+    max_reasks: int = 1
+    parsed_generations: bool = False
+    resilience: Optional[Any] = None
     frequency_penalty: float = 0.5
     presence_penalty: float = 0.5
     response_format: Optional[Dict] = None
@@ -78,7 +132,10 @@ class RouterLLM(BaseLLM):
     model_params: Optional[Dict] = {}
     openai_client: Optional[Any] = None
     client: Optional[Any] = None
-    set_params: List = ['remove_attributes', 'language', 'openai_api_base', 'openai_api_key', 'model', 'mode']
+    set_params: List = ['remove_attributes', 'language', 'openai_api_base', 'openai_api_key', 'model', 'mode',
+                        'max_concurrency', 'max_tool_workers', 'response_cache', 'semantic_cache', 'model_pool',
+                        'context_window', 'resilience', 'max_tries', 'coalesce',
+                        'rate_limit', 'repair', 'max_reasks', 'parsed_generations']
     mode: str = "json_schema_with_response_format"
 
     # , 'response_model'
@@ -90,7 +147,6 @@ class RouterLLM(BaseLLM):
             system_message (str, optional): A message to guide the LLM's behavior.
             kwargs: Additional parameters for model configuration.
         """
-        self.input_model_params = {}  # Initialize here
         self.__update__(system_message, **kwargs)
 
     def __model_update__(self, **kwargs):
@@ -114,22 +170,11 @@ class RouterLLM(BaseLLM):
             else:
                 self.input_model_params[key] = value
 
-                # Initialize OpenAI client with required settings
+        # Fetch the long-lived pooled clients for this endpoint
+        pooled = client_registry.get(self.openai_api_base, self.openai_api_key, self.mode)
+        self.openai_client: OpenAI = pooled.openai_client
         if self.mode == 'json_schema_with_response_format':
-            self.openai_client = OpenAI(
-                base_url=self.openai_api_base,
-                api_key=self.openai_api_key
-            )
-
-            self.client: Instructor = instructor.from_openai(
-                self.openai_client,
-                mode=instructor.Mode.TOOLS
-            )
-        else:
-            self.openai_client = OpenAI(
-                base_url=self.openai_api_base,
-                api_key=self.openai_api_key
-            )
+            self.client: Instructor = pooled.client
 
     def __update__(self, system_message=None, **kwargs):
         """
@@ -150,8 +195,8 @@ class RouterLLM(BaseLLM):
         # Initialize superclass attributes
         super().__init__(**kwargs)
 
-        # Save the system message and other parameters
-        self.system_message = kwargs['system_message']
+        # Save the system message, byte-stable so requests share the server's cached prefix
+        self.system_message = canonical(kwargs['system_message'])
         del kwargs['system_message']
 
         # Organize input parameters for further usage
@@ -202,30 +247,58 @@ class RouterLLM(BaseLLM):
         except Exception:
             return False
 
-    def function_executor(self, execute_func, dataframe, tool_functions, **kwargs):
-        tool_results = []
+    def tool_resultants(self, tool_result) -> List[str]:
+        """
+        Returns the textual parts of a tool result, leaving out base64 image payloads.
+        """
         tool_resultants = []
+        if isinstance(tool_result, tuple):
+            for tool_res in tool_result:
+                if isinstance(tool_res, str):
+                    if not self.is_valid_base64_url(tool_res):
+                        tool_resultants.append(tool_res)
+        else:
+            if isinstance(tool_result, str):
+                if not self.is_valid_base64_url(tool_result):
+                    tool_resultants.append(tool_result)
+        return tool_resultants
 
+    def function_executor(self, execute_func, dataframe, tool_functions, **kwargs):
+        """
+        Executes the tool calls of a completion and appends one `tool` message per call to the chat history.
+
+        Independent tool calls run concurrently on up to `max_tool_workers` threads, so
+        `execute_func` must be safe to call from several threads with the shared `dataframe`.
+        The `tool` messages keep the order of `completion_message.tool_calls` and each carries
+        only its own call's result.
+
+        Args:
+            execute_func (Callable): Executes a single tool call as `execute_func(tool_call, tool_functions, dataframe)`.
+            dataframe: Data passed through to every tool call.
+            tool_functions (List): The tool functions available to the model.
+            kwargs: Must include `chat_history` and `completion_message`.
+
+        Returns:
+            dict: The raw `tool_results` in call order and the extended `chat_history`.
+        """
         chat_history: List = kwargs.get("chat_history")
         completion_message: ChatCompletionMessage = kwargs.get("completion_message")
         query = chat_history[1]['content'].split('\n')[0]
+        tool_calls = completion_message.tool_calls or []
 
-        if not completion_message.tool_calls:
+        if not tool_calls:
             trace_logger.info(f"{query}\033[90m🛠️ No Tool call will be invoked.\033[0m")
+            return {"tool_results": [], "chat_history": chat_history}
 
-        for tool_call in completion_message.tool_calls:
+        for tool_call in tool_calls:
             trace_logger.info(f"{query}\033[90m🛠️ {tool_call.function.name} {tool_call.function.arguments}\033[0m")
-            tool_result = execute_func(tool_call, tool_functions, dataframe)
 
-            if isinstance(tool_result, tuple):
-                for tool_res in tool_result:
-                    if isinstance(tool_res, str):
-                        if not self.is_valid_base64_url(tool_res):
-                            tool_resultants.append(tool_res)
-            else:
-                if isinstance(tool_result, str):
-                    if not self.is_valid_base64_url(tool_result):
-                        tool_resultants.append(tool_result)
+        with ThreadPoolExecutor(max_workers=min(self.max_tool_workers, len(tool_calls))) as executor:
+            tool_results = list(executor.map(
+                lambda tool_call: execute_func(tool_call, tool_functions, dataframe), tool_calls))
+
+        for tool_call, tool_result in zip(tool_calls, tool_results):
+            tool_resultants = self.tool_resultants(tool_result)
 
             trace_logger.info(f"\n\nTool Resultants:\n\n{tool_resultants}\n\n")
             chat_history.append({
@@ -235,9 +308,272 @@ class RouterLLM(BaseLLM):
                 "content": tool_resultants,
             })
 
-            tool_results.append(tool_result)
         return {"tool_results": tool_results, "chat_history": chat_history}
 
+    def __cache_key__(self, messages, response_model):
+        """
+        Returns the response cache key of a structured request, or None when caching is disabled.
+        """
+        if self.response_cache is None or response_model is None:
+            return None
+        return request_key(self.model, messages, response_model, self.input_model_params)
+
+    def __semantic_namespace__(self, response_model, chat_history):
+        """
+        Returns the semantic cache namespace of a routing request, or None when it should bypass the cache.
+
+        Requests carrying chat history depend on more than the prompt, so they are never served
+        from the semantic cache.
+        """
+        if self.semantic_cache is None or chat_history:
+            return None
+        return request_key(self.model, [{"role": "system", "content": self.system_message}], response_model,
+                           self.input_model_params)
+
+    def __flight_key__(self, messages, response_model):
+        """
+        Returns the single-flight key of a structured request, or None when coalescing is disabled.
+        """
+        if not self.coalesce or response_model is None:
+            return None
+        return request_key(self.model, messages, response_model,
+                           dict(self.input_model_params, openai_api_base=self.openai_api_base))
+
+    def __coalesce__(self, messages, response_model, send):
+        """
+        Runs `send`, sharing its result with concurrent identical requests from other threads.
+        """
+        key = self.__flight_key__(messages, response_model)
+        return send() if key is None else single_flight.do(key, send)
+
+    async def __acoalesce__(self, messages, response_model, send):
+        """
+        Async counterpart of `__coalesce__` for requests on the same event loop.
+        """
+        key = self.__flight_key__(messages, response_model)
+        return await send() if key is None else await single_flight.ado(key, send)
+
+    def __context_window__(self):
+        return self.context_window or context_window_for(self.model, self.input_model_params.get("max_tokens"))
+
+    def __schema_tokens__(self, response_model=None, tools=None):
+        """
+        Counts the tokens of the response-model or tool schemas sent next to the messages.
+        """
+        if isinstance(response_model, type) and issubclass(response_model, BaseModel):
+            return count_text_tokens(schema_text(response_model))
+        if tools:
+            return count_text_tokens(json.dumps(tools, sort_keys=True, default=str))
+        return 0
+
+    def __fit_context__(self, messages, pinned=1, response_model=None, tools=None):
+        """
+        Trims `messages` to the model's prompt budget, keeping the first `pinned` messages and the latest turn.
+
+        The schemas of `response_model` or `tools` are counted against the budget. Models missing
+        from `MODEL_TOKEN_LIMITS` are sent untouched unless a `context_window` is set.
+        """
+        context_window = self.__context_window__()
+        if context_window is None:
+            return messages
+        return context_window.fit(messages, pinned=pinned, reserved=self.__schema_tokens__(response_model, tools))
+
+    async def __afit_context__(self, messages, pinned=1, response_model=None, tools=None):
+        """
+        Async counterpart of `__fit_context__`.
+
+        A window with a summarizer is fitted in a worker thread, as summarizing dropped turns is a
+        blocking request to the `SUMMARY_*` model that must not stall the event loop.
+        """
+        context_window = self.__context_window__()
+        if context_window is None or context_window.summarizer is None:
+            return self.__fit_context__(messages, pinned, response_model, tools)
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.__fit_context__, messages, pinned, response_model, tools)
+
+    def __resilience__(self) -> Resilience:
+        """
+        Returns the retry/hedging layer, creating one with `max_tries` attempts on first use.
+
+        With a `model_pool`, every replica gets an attempt: retries avoid the replicas already used,
+        so an endpoint failure moves the request to another replica instead of failing it.
+        """
+        if self.resilience is None:
+            max_tries = self.max_tries
+            if self.model_pool is not None:
+                max_tries = max(max_tries, len(self.model_pool.replicas))
+            self.resilience = Resilience(max_tries=max_tries)
+        return self.resilience
+
+    @contextmanager
+    def __endpoint__(self, used=None):
+        """
+        Yields the pooled clients and model name of the endpoint serving the next request.
+
+        Without a `model_pool` this is the configured endpoint; otherwise a replica is picked by
+        the pool, which also records the latency and outcome of the request. Replicas in `used`
+        are avoided when possible and the chosen one is added to it. The clients come without SDK
+        retries, since every caller runs inside the `resilience` layer, which does the retrying.
+        """
+        if self.model_pool is None:
+            pooled = client_registry.get(self.openai_api_base, self.openai_api_key, self.mode)
+            yield pooled.without_retries(), self.model
+        else:
+            with self.model_pool.acquire(used or ()) as replica:
+                if used is not None:
+                    used.add(replica.name)
+                pooled = client_registry.get(replica.base_url, replica.api_key, self.mode)
+                yield pooled.without_retries(), replica.model
+
+    @asynccontextmanager
+    async def __aendpoint__(self, used=None):
+        """
+        Async counterpart of `__endpoint__`.
+        """
+        if self.model_pool is None:
+            pooled = client_registry.get_async(self.openai_api_base, self.openai_api_key, self.mode)
+            yield pooled.without_retries(), self.model
+        else:
+            async with self.model_pool.aacquire(used or ()) as replica:
+                if used is not None:
+                    used.add(replica.name)
+                pooled = client_registry.get_async(replica.base_url, replica.api_key, self.mode)
+                yield pooled.without_retries(), replica.model
+
+    def __attempt_params__(self, model_params, model, resilience):
+        params = {"timeout": resilience.attempt_timeout}
+        params.update(model_params)
+        # Every attempt gets its own message list, as concurrent hedges must not share one
+        params.update(model=model, messages=list(model_params["messages"]))
+        return params
+
+    def __estimate_tokens__(self, params):
+        """
+        Estimates the tokens a request consumes: its prompt plus the completion tokens it may generate.
+        """
+        return count_message_tokens(params["messages"]) + params.get("max_tokens", self.max_tokens)
+
+    def __parse_failure__(self, error, params, request_seconds, reasks):
+        """
+        Handles a structured response that failed to parse: returns a local repair, or the re-ask params.
+
+        Raises:
+            Exception: `error`, when it is no parse failure or no re-ask is left.
+        """
+        if not is_parse_failure(error):
+            raise error
+        if self.repair:
+            response = repair_failed_response(error, params["response_model"], request_seconds)
+            if response is not None:
+                return response, None
+        if reasks >= self.max_reasks:
+            raise error
+        repair_log.record_reask()
+        trace_logger.info(f"Re-asking {params['model']} after an unparseable response: {error}")
+        return None, dict(params, messages=reask_messages(error, params["messages"]))
+
+    def __structured_create__(self, create, params):
+        """
+        Sends a structured request, repairing an unparseable response locally before re-asking the model.
+
+        `create` is an instructor create making a single attempt (`INSTRUCTOR_MAX_RETRIES`), so
+        every unparseable completion, the first one included, reaches `repair_failed_response`
+        and each re-ask is one request counted by `repair_log`.
+        """
+        for reasks in range(self.max_reasks + 1):
+            start = time.perf_counter()
+            try:
+                return create(**params, max_retries=INSTRUCTOR_MAX_RETRIES)
+            except Exception as e:
+                response, params = self.__parse_failure__(e, params, time.perf_counter() - start, reasks)
+                if response is not None:
+                    return response
+
+    async def __astructured_create__(self, create, params):
+        """
+        Async counterpart of `__structured_create__`.
+        """
+        for reasks in range(self.max_reasks + 1):
+            start = time.perf_counter()
+            try:
+                return await create(**params, max_retries=INSTRUCTOR_MAX_RETRIES)
+            except Exception as e:
+                response, params = self.__parse_failure__(e, params, time.perf_counter() - start, reasks)
+                if response is not None:
+                    return response
+
+    def __observe_prefix__(self, model_params):
+        """
+        Records how much of the request's prompt a prefix-caching server has seen recently, see `PrefixTracker`.
+        """
+        if prefix_tracker.window <= 0:
+            return
+        response_model = model_params.get("response_model")
+        if isinstance(response_model, type) and issubclass(response_model, BaseModel):
+            tools = [schema_text(response_model)]
+        else:
+            tools = model_params.get("tools")
+        prefix_tracker.observe(self.model, request_text(model_params["messages"], tools))
+
+    def __request__(self, model_params, structured=True):
+        """
+        Sends one chat completion request, parsed into `response_model` when `structured`.
+
+        The request goes through the `resilience` layer: retryable errors are retried with
+        backoff up to `max_tries` attempts and slow requests may be hedged. Endpoints with a
+        budget in `RATE_LIMITS` queue the request until it fits their shared rate limit.
+        Structured responses that fail to parse are repaired locally before re-asking.
+        """
+        resilience = self.__resilience__()
+        self.__observe_prefix__(model_params)
+
+        def attempt(used):
+            with self.__endpoint__(used) as (pooled, model):
+                params = self.__attempt_params__(model_params, model, resilience)
+                if structured:
+                    def create(**kwargs):
+                        return self.__structured_create__(pooled.client.chat.completions.create, kwargs)
+                else:
+                    create = pooled.openai_client.chat.completions.create
+                limiter = rate_limiter_for(pooled.openai_client.base_url) if self.rate_limit else None
+                if limiter is None:
+                    return create(**params)
+
+                estimated = self.__estimate_tokens__(params)
+                limiter.acquire(estimated)
+                response = create(**params)
+                limiter.settle(estimated, response_tokens(response))
+                return response
+
+        return resilience.call(attempt)
+
+    async def __arequest__(self, model_params, structured=True):
+        """
+        Async counterpart of `__request__`.
+        """
+        resilience = self.__resilience__()
+        self.__observe_prefix__(model_params)
+
+        async def attempt(used):
+            async with self.__aendpoint__(used) as (pooled, model):
+                params = self.__attempt_params__(model_params, model, resilience)
+                if structured:
+                    async def create(**kwargs):
+                        return await self.__astructured_create__(pooled.client.chat.completions.create, kwargs)
+                else:
+                    create = pooled.openai_client.chat.completions.create
+                limiter = rate_limiter_for(pooled.openai_client.base_url) if self.rate_limit else None
+                if limiter is None:
+                    return await create(**params)
+
+                estimated = self.__estimate_tokens__(params)
+                await limiter.aacquire(estimated)
+                response = await create(**params)
+                limiter.settle(estimated, response_tokens(response))
+                return response
+
+        return await resilience.acall(attempt)
+
     # @log_time_to_sentry(step_name="`RouterLLM` generate Structured Response")
     def __generate_response__(self, prompt, chat_history=[], **kwargs):
         messages = [
@@ -246,6 +582,8 @@ class RouterLLM(BaseLLM):
         ]
         if chat_history:
             messages.extend(chat_history)
+        messages = self.__fit_context__(messages, pinned=2, response_model=kwargs.get("response_model"),
+                                        tools=kwargs.get("tool_functions"))
 
         if self.mode == 'json_schema_with_response_format':
             # Use local variables instead of self.model_params
@@ -256,10 +594,22 @@ class RouterLLM(BaseLLM):
             }
             model_params.update(self.input_model_params)
 
+            cache_key = self.__cache_key__(messages, model_params["response_model"])
+            if cache_key is not None:
+                cached = self.response_cache.get(cache_key, model_params["response_model"])
+                if cached is not None:
+                    return cached
+
+            def send():
+                response = self.__request__(model_params)
+                if cache_key is not None:
+                    self.response_cache.set(cache_key, response)
+                return response
+
             try:
-                response = self.client.chat.completions.create(**model_params)
+                response = self.__coalesce__(messages, model_params["response_model"], send)
             except Exception as e:
-                print(f"Error generating response: {e}")
+                trace_logger.error(f"Error generating response: {e}")
                 return {}
         elif self.mode == 'function_calling':
             # Similar refactoring for other modes
@@ -275,7 +625,7 @@ class RouterLLM(BaseLLM):
 
             try:
                 # Generate response from the OpenAI client using the defined parameters
-                completion = self.openai_client.chat.completions.create(**model_params)
+                completion = self.__request__(model_params, structured=False)
                 completion_message = completion.choices[0].message
 
                 model_params['messages'].append(completion_message)
@@ -286,7 +636,73 @@ class RouterLLM(BaseLLM):
                     return {'completion_message': completion_message, 'chat_history': model_params['messages']}
             except Exception as e:
                 # Print error message if response generation fails
-                print(f"Error while generating response: {e}")
+                trace_logger.error(f"Error while generating response: {e}")
+                return {}
+        else:
+            # to be implemented for text responses only later
+            return {}
+
+        return response
+
+    async def __agenerate_response__(self, prompt, chat_history=[], **kwargs):
+        """
+        Async counterpart of `__generate_response__` using the pooled `AsyncOpenAI` clients.
+        """
+        messages = [
+            {"role": "system", "content": self.system_message},
+            {"role": "user", "content": prompt},
+        ]
+        if chat_history:
+            messages.extend(chat_history)
+        messages = await self.__afit_context__(messages, pinned=2, response_model=kwargs.get("response_model"),
+                                               tools=kwargs.get("tool_functions"))
+
+        if self.mode == 'json_schema_with_response_format':
+            model_params = {
+                "messages": messages,
+                "response_model": kwargs.get("response_model"),
+                "model": self.model,
+            }
+            model_params.update(self.input_model_params)
+
+            cache_key = self.__cache_key__(messages, model_params["response_model"])
+            if cache_key is not None:
+                cached = self.response_cache.get(cache_key, model_params["response_model"])
+                if cached is not None:
+                    return cached
+
+            async def send():
+                response = await self.__arequest__(model_params)
+                if cache_key is not None:
+                    self.response_cache.set(cache_key, response)
+                return response
+
+            try:
+                response = await self.__acoalesce__(messages, model_params["response_model"], send)
+            except Exception as e:
+                trace_logger.error(f"Error generating response: {e}")
+                return {}
+        elif self.mode == 'function_calling':
+            model_params = dict(
+                messages=messages,
+                tools=kwargs.get("tool_functions"),
+                tool_choice="auto",
+                model=self.model,
+            )
+            model_params.update(self.input_model_params)
+
+            try:
+                completion = await self.__arequest__(model_params, structured=False)
+                completion_message = completion.choices[0].message
+
+                model_params['messages'].append(completion_message)
+
+                if completion_message.tool_calls is None:
+                    return {'completion_message': completion_message}
+                else:
+                    return {'completion_message': completion_message, 'chat_history': model_params['messages']}
+            except Exception as e:
+                trace_logger.error(f"Error while generating response: {e}")
                 return {}
         else:
             # to be implemented for text responses only later
@@ -301,6 +717,7 @@ class RouterLLM(BaseLLM):
         messages.append({"role": "user", "content": prompt})
 
         self.__model_update__(**kwargs)
+        messages = self.__fit_context__(messages)
 
         self.model_params = dict(
             messages=messages,
@@ -360,6 +777,335 @@ class RouterLLM(BaseLLM):
                 chat_history=kwargs.get("chat_history", []),
             )  # Return the generated response
 
+    async def astructured_output_to_pydantic_model(self, prompt: str, **kwargs):
+        """
+        Async counterpart of `structured_output_to_pydantic_model`.
+
+        Args:
+            prompt (str): The input prompt for which the model should generate a response.
+            **kwargs: Same keyword arguments as `structured_output_to_pydantic_model`.
+
+        Returns:
+            dict: The response generated by the language model, or an empty dictionary
+                in case of an error.
+        """
+        if self.mode == 'json_schema_with_response_format':
+            response_model = self.fetch_response_model(**kwargs)
+
+            return await self.__agenerate_response__(
+                prompt=prompt,
+                response_model=response_model,
+                chat_history=kwargs.get("chat_history", []),
+            )
+        else:
+            tool_functions = self.fetch_tool_functions(**kwargs)
+
+            return await self.__agenerate_response__(
+                prompt=prompt,
+                tool_functions=tool_functions,
+                chat_history=kwargs.get("chat_history", []),
+            )
+
+    def __classification_params__(self, prompt, labels=None, attribute=None, descriptions=None):
+        """
+        Builds the label keys and `max_tokens=1` request parameters of a classification call.
+        """
+        if labels is None:
+            if attribute is None or getattr(self, f"{attribute}_dict", None) is None:
+                raise Exception(
+                    f"Either `labels` or an `attribute` with a configured `_dict` is required at `{self.__class__.__name__}`")
+            labels = list(getattr(self, f"{attribute}_dict").keys())
+
+        keys = label_keys(labels)
+        model_params = dict(self.input_model_params)
+        model_params.update(
+            messages=build_classification_messages(prompt, keys, self.system_message, descriptions),
+            model=self.model,
+            max_tokens=1,
+            temperature=0,
+            logprobs=True,
+            top_logprobs=TOP_LOGPROBS,
+        )
+        return keys, model_params
+
+    def __classification_choice__(self, classification: Classification, attribute=None) -> Classification:
+        if attribute is not None and classification.category is not None:
+            classification.choice = getattr(self, f"{attribute}_dict")[classification.category]
+        return classification
+
+    def classify(self, prompt: str, labels: Optional[List[str]] = None, attribute: Optional[str] = None,
+                 descriptions: Optional[Dict[str, str]] = None, calibration_temperature: float = 1.0) -> Classification:
+        """
+        Classifies a prompt into one category label from a single generated token.
+
+        Instead of generating a full JSON object, the model is asked for the letter of the
+        category and the candidate labels are scored from the first-token logprobs. This is the
+        fast path for pure routing calls such as `policy` or `complexity`. The request goes through
+        the same endpoint selection, resilience and rate limiting as every other request.
+
+        Args:
+            prompt (str): The user message to classify.
+            labels (Optional[List[str]]): Candidate category labels.
+            attribute (Optional[str]): Routing attribute (e.g. `policy`) whose `_dict` keys are the labels;
+                the mapped `_dict` value is returned as `choice`.
+            descriptions (Optional[Dict[str, str]]): Optional description per label added to the prompt.
+            calibration_temperature (float): Temperature applied to the logprobs before normalising.
+
+        Returns:
+            Classification: The predicted category, its confidence and the per-label scores.
+        """
+        keys, model_params = self.__classification_params__(prompt, labels, attribute, descriptions)
+        completion = self.__request__(model_params, structured=False)
+        classification = classification_from_completion(completion, keys, calibration_temperature)
+        return self.__classification_choice__(classification, attribute)
+
+    async def aclassify(self, prompt: str, labels: Optional[List[str]] = None, attribute: Optional[str] = None,
+                        descriptions: Optional[Dict[str, str]] = None,
+                        calibration_temperature: float = 1.0) -> Classification:
+        """
+        Async counterpart of `classify`.
+        """
+        keys, model_params = self.__classification_params__(prompt, labels, attribute, descriptions)
+        completion = await self.__arequest__(model_params, structured=False)
+        classification = classification_from_completion(completion, keys, calibration_temperature)
+        return self.__classification_choice__(classification, attribute)
+
+    def __stream_params__(self, prompt, stream_strings=False, **kwargs):
+        """
+        Builds the request parameters of a partial (streamed) structured response.
+
+        The messages are not fitted to the context window yet, see `__fit_context__`.
+        """
+        if self.mode != 'json_schema_with_response_format':
+            raise Exception(
+                f"Streaming is only supported in `json_schema_with_response_format` mode at `{self.__class__.__name__}`")
+
+        response_model = self.fetch_response_model(**kwargs)
+        if not stream_strings:
+            response_model = complete_strings_model(response_model)
+
+        messages = [
+            {"role": "system", "content": self.system_message},
+            {"role": "user", "content": prompt},
+        ]
+        if kwargs.get("chat_history"):
+            messages.extend(kwargs.get("chat_history"))
+
+        model_params = {
+            "messages": messages,
+            "response_model": response_model,
+            "model": self.model,
+        }
+        model_params.update(self.input_model_params)
+        return model_params
+
+    def __open_stream__(self, model_params):
+        """
+        Opens a partial-response stream through the endpoint, rate-limit and resilience layers.
+
+        An attempt lasts until the first partial arrives, so failures before the stream starts are
+        retried, on another replica when there is a `model_pool`, which records the time to the
+        first partial as the replica's latency.
+
+        Returns:
+            Iterator: The partial responses, the first one included; closing it ends the HTTP stream.
+        """
+        resilience = self.__resilience__()
+        self.__observe_prefix__(model_params)
+
+        def attempt(used):
+            with self.__endpoint__(used) as (pooled, model):
+                params = self.__attempt_params__(model_params, model, resilience)
+                limiter = rate_limiter_for(pooled.openai_client.base_url) if self.rate_limit else None
+                if limiter is not None:
+                    limiter.acquire(self.__estimate_tokens__(params))
+                partials = pooled.client.chat.completions.create_partial(**params, max_retries=INSTRUCTOR_MAX_RETRIES)
+                return partials, next(partials, None)
+
+        partials, first = resilience.call(attempt)
+
+        def stream():
+            try:
+                if first is not None:
+                    yield first
+                yield from partials
+            finally:
+                partials.close()
+
+        return stream()
+
+    async def __aopen_stream__(self, model_params):
+        """
+        Async counterpart of `__open_stream__`.
+        """
+        resilience = self.__resilience__()
+        self.__observe_prefix__(model_params)
+
+        async def attempt(used):
+            async with self.__aendpoint__(used) as (pooled, model):
+                params = self.__attempt_params__(model_params, model, resilience)
+                limiter = rate_limiter_for(pooled.openai_client.base_url) if self.rate_limit else None
+                if limiter is not None:
+                    await limiter.aacquire(self.__estimate_tokens__(params))
+                partials = pooled.client.chat.completions.create_partial(**params, max_retries=INSTRUCTOR_MAX_RETRIES)
+                try:
+                    return partials, await partials.__anext__()
+                except StopAsyncIteration:
+                    return partials, None
+
+        partials, first = await resilience.acall(attempt)
+
+        async def stream():
+            try:
+                if first is not None:
+                    yield first
+                async for partial in partials:
+                    yield partial
+            finally:
+                await partials.aclose()
+
+        return stream()
+
+    def stream_structured_output(self, prompt: str, stop_when=None, stream_strings=False, **kwargs):
+        """
+        Streams progressively populated structured responses for a prompt.
+
+        Each yielded object is a partial instance of `response_model` whose fields fill in as
+        tokens arrive. The stream stops early as soon as any `stop_when` predicate holds, e.g.
+        `field_is_known("policy.category")`, so routing can act before the remaining fields
+        are generated. The stream is opened like any other request, through the model pool,
+        resilience and rate limiting, see `__open_stream__`.
+
+        Args:
+            prompt (str): The input prompt for which the model should generate a response.
+            stop_when (Optional[Callable or List[Callable]]): Early-exit predicates over a partial response.
+            stream_strings (bool): Also expose incomplete string values while they stream. Leave it off
+                for models with `Literal`/`Enum` fields.
+            **kwargs: Additional keyword arguments that may include:
+                - response_model: The model to be used for generating the response.
+                - chat_history: Messages appended after the prompt.
+
+        Yields:
+            BaseModel: Partial responses, the last one being the most complete.
+        """
+        model_params = self.__stream_params__(prompt, stream_strings=stream_strings, **kwargs)
+        model_params["messages"] = self.__fit_context__(model_params["messages"], pinned=2,
+                                                        response_model=model_params["response_model"])
+        yield from stream_until(self.__open_stream__(model_params), stop_when)
+
+    async def astream_structured_output(self, prompt: str, stop_when=None, stream_strings=False, **kwargs):
+        """
+        Async counterpart of `stream_structured_output`.
+        """
+        model_params = self.__stream_params__(prompt, stream_strings=stream_strings, **kwargs)
+        model_params["messages"] = await self.__afit_context__(model_params["messages"], pinned=2,
+                                                               response_model=model_params["response_model"])
+        async for partial in astream_until(await self.__aopen_stream__(model_params), stop_when):
+            yield partial
+
+    def __apply_choices__(self, response, attributes):
+        """
+        Sets the `choice` of each routing attribute from its `_dict` using the predicted `category`.
+        """
+        # Process response choices based on attributes and associated dictionaries
+        for attribute in attributes:
+            if hasattr(response, attribute) and hasattr(self, f"{attribute}_dict"):
+                try:
+                    getattr(response, attribute).choice = getattr(self, f"{attribute}_dict")[
+                        getattr(response, attribute).category]
+                except Exception as e:
+                    print(f"Response: {response} with erorr {e}")
+                    raise e
+
+    def __composite_models__(self, response_models) -> Dict:
+        if self.mode != 'json_schema_with_response_format':
+            raise Exception(
+                f"Composite routing is only supported in `json_schema_with_response_format` mode at `{self.__class__.__name__}`")
+        return {
+            attribute: model.set_definition(self.language) if hasattr(model, 'set_definition') else model
+            for attribute, model in response_models.items()
+        }
+
+    def __split_composite__(self, prompt, response, response_models) -> Dict:
+        if not response:
+            return {}
+        parts = split_composite(response, response_models)
+        for part in parts.values():
+            if 'user_message' in type(part).model_fields:
+                part.user_message = prompt
+            attributes = [name for name in type(part).model_fields if name not in self.remove_attributes]
+            self.__apply_choices__(part, attributes)
+        return parts
+
+    def composite_route(self, prompt: str, response_models: Dict[str, Any], **kwargs) -> Dict:
+        """
+        Answers several routing response models with a single LLM call.
+
+        The response models are merged into one combined schema, a single structured request is
+        sent, and the result is split back into one object per attribute with its `_dict`
+        choices applied. This replaces N separate `RouterLLM` invocations for the same prompt.
+
+        Args:
+            prompt (str): The user message to route.
+            response_models (Dict[str, Any]): Response model per routing attribute,
+                e.g. `{"qualifier": QualifierResponse, "complexity": ComplexityResponse}`.
+            **kwargs: Additional keyword arguments that may include:
+                - chat_history: Messages appended after the prompt.
+
+        Returns:
+            Dict: The response object per attribute, or an empty dictionary in case of an error.
+        """
+        response_models = self.__composite_models__(response_models)
+        response = self.__generate_response__(
+            prompt=prompt,
+            response_model=build_composite_model(response_models),
+            chat_history=kwargs.get("chat_history", []),
+        )
+        return self.__split_composite__(prompt, response, response_models)
+
+    async def acomposite_route(self, prompt: str, response_models: Dict[str, Any], **kwargs) -> Dict:
+        """
+        Async counterpart of `composite_route`.
+        """
+        response_models = self.__composite_models__(response_models)
+        response = await self.__agenerate_response__(
+            prompt=prompt,
+            response_model=build_composite_model(response_models),
+            chat_history=kwargs.get("chat_history", []),
+        )
+        return self.__split_composite__(prompt, response, response_models)
+
+    def __process_response__(self, prompt, response) -> Generation:
+        """
+        Applies the attribute `_dict` choices to a structured response and wraps it in a `Generation`.
+
+        Args:
+            prompt (str): The user prompt the response was generated for.
+            response: The pydantic response returned by the LLM client.
+
+        Returns:
+            Generation: The processed response serialised as JSON, or a `ParsedGeneration`
+                carrying it when `parsed_generations` is set.
+        """
+        # Set attributes to include in the response if not already defined
+        if not self.attributes:
+            self.attributes = list(response.__dict__.keys())
+            for attribute in self.remove_attributes:
+                if attribute in self.attributes:
+                    self.attributes.remove(attribute)
+
+        response.user_message = prompt
+
+        self.__apply_choices__(response, self.attributes)
+        if self.parsed_generations:
+            return ParsedGeneration(response)
+        try:
+            # Convert the response to JSON format and store it
+            return Generation(text=response.model_dump_json(indent=2))
+        except AttributeError as e:
+            trace_logger.error(f"Error generating response: {e}")
+            raise e
+
     def _generate(self, prompts: List[str], stop=None, **kwargs):
         """
         Generates a response for a list of prompts using the LLM client.
@@ -375,42 +1121,84 @@ class RouterLLM(BaseLLM):
         # define the response model's language setup if the model exists
         response_model = self.fetch_response_model(**kwargs)
 
+        namespace = self.__semantic_namespace__(response_model, kwargs.get("chat_history", []))
+
         generations = []
         for prompt in prompts:
-            # Define parameters for generating a response
-            response = self.__generate_response__(
-                prompt=prompt,
-                response_model=response_model,
-                chat_history=kwargs.get("chat_history", []),
-            )
+            response = None
+            if namespace is not None:
+                response = self.semantic_cache.get(prompt, namespace, response_model)
+
+            if response is None:
+                # Define parameters for generating a response
+                response = self.__generate_response__(
+                    prompt=prompt,
+                    response_model=response_model,
+                    chat_history=kwargs.get("chat_history", []),
+                )
+                if namespace is not None and response:
+                    self.semantic_cache.set(prompt, namespace, response)
+
+            generations.append(self.__process_response__(prompt, response))
+
+        return LLMResult(generations=[generations])
+
+    async def _agenerate(
+            self,
+            prompts: List[str],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+    ) -> LLMResult:
+        """
+        Generates responses for a list of prompts concurrently on the event loop.
+
+        At most `max_concurrency` requests are in flight at once. Results keep the order of
+        `prompts`, and a failing prompt yields an empty `Generation` carrying the error in
+        `generation_info` instead of failing the whole batch.
+
+        Args:
+            prompts (List[str]): A list of user input prompts for the LLM.
+            stop (Optional[List[str]]): Optional stopping criteria for the LLM generation.
+            run_manager (Optional[AsyncCallbackManagerForLLMRun]): Callback manager for the run.
+            kwargs: Additional parameters for model behavior.
 
-            # Set attributes to include in the response if not already defined
-            if not self.attributes:
-                self.attributes = list(response.__dict__.keys())
-                for attribute in self.remove_attributes:
-                    if attribute in self.attributes:
-                        self.attributes.remove(attribute)
-
-            response.user_message = prompt
-
-            # Process response choices based on attributes and associated dictionaries
-            for attribute in self.attributes:
-                if hasattr(response, attribute) and hasattr(self, f"{attribute}_dict"):
-                    try:
-                        getattr(response, attribute).choice = getattr(self, f"{attribute}_dict")[
-                            getattr(response, attribute).category]
-                    except Exception as e:
-                        print(f"Response: {response} with erorr {e}")
-                        raise e
+        Returns:
+            LLMResult: The generated responses from the LLM.
+        """
+        response_model = self.fetch_response_model(**kwargs)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        namespace = self.__semantic_namespace__(response_model, kwargs.get("chat_history", []))
+        # Semantic cache lookups embed the prompt with a blocking request, so they run in worker threads
+        loop = asyncio.get_running_loop()
+
+        async def generate_one(prompt: str) -> Generation:
             try:
-                # Convert the response to JSON format and store it
-                generation = Generation(text=response.model_dump_json(indent=2))
-                generations.append(generation)
-            except AttributeError as e:
+                response = None
+                if namespace is not None:
+                    response = await loop.run_in_executor(
+                        None, self.semantic_cache.get, prompt, namespace, response_model)
+
+                if response is None:
+                    async with semaphore:
+                        response = await self.__agenerate_response__(
+                            prompt=prompt,
+                            response_model=response_model,
+                            chat_history=kwargs.get("chat_history", []),
+                        )
+                    if namespace is not None and response:
+                        await loop.run_in_executor(None, self.semantic_cache.set, prompt, namespace, response)
+
+                if not response:
+                    raise Exception(f"Empty response received for prompt: {prompt}")
+                return self.__process_response__(prompt, response)
+            except Exception as e:
                 trace_logger.error(f"Error generating response: {e}")
-                raise e
+                return Generation(text="", generation_info={"error": str(e)})
 
-        return LLMResult(generations=[generations])
+        generations = await asyncio.gather(*[generate_one(prompt) for prompt in prompts])
+
+        return LLMResult(generations=[list(generations)])
 
     def _generate_helper(
             self,
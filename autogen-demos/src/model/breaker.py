@@ -0,0 +1,212 @@
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, asdict
+from typing import Dict, Optional
+
+from src.constants import CIRCUIT_BREAKER_FAILURE_RATE, CIRCUIT_BREAKER_WINDOW_SECONDS, \
+    CIRCUIT_BREAKER_MIN_REQUESTS, CIRCUIT_BREAKER_OPEN_SECONDS, CIRCUIT_BREAKER_HALF_OPEN_CALLS
+from src.logging import trace_logger
+from src.model.pool import is_endpoint_failure
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of sending a request while a circuit is open.
+
+    Attributes:
+        name (str): The endpoint whose circuit is open.
+        retry_after (float): Seconds until the circuit lets a trial request through.
+    """
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit of {name} is open, retry in {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+@dataclass
+class CircuitBreakerStats:
+    """
+    Counters of a `CircuitBreaker`.
+
+    Attributes:
+        successes (int): Requests that reached the endpoint and got an answer.
+        failures (int): Requests that failed with a connection, timeout, throttling or server error.
+        rejected (int): Requests failed fast while the circuit was open.
+        opened (int): Times the circuit opened.
+    """
+    successes: int = 0
+    failures: int = 0
+    rejected: int = 0
+    opened: int = 0
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open circuit breaker of one endpoint.
+
+    While closed, the outcome of every request is kept for `window_seconds`; once at least
+    `min_requests` are in the window and the share of endpoint failures reaches
+    `failure_rate`, the circuit opens and calls fail fast with `CircuitOpenError` for
+    `open_seconds`. It then turns half-open and lets `half_open_calls` trial requests through:
+    a success closes the circuit, a failure opens it again. Errors that say nothing about the
+    endpoint's health (e.g. a 400) count as successes.
+
+    Attributes:
+        name (str): Endpoint identifier used in errors and logs.
+        failure_rate (float): Failure share that opens the circuit.
+        window_seconds (float): Length of the sliding outcome window.
+        min_requests (int): Requests needed in the window before the circuit may open.
+        open_seconds (float): Time the circuit stays open before a trial request.
+        half_open_calls (int): Concurrent trial requests allowed while half-open.
+        stats (CircuitBreakerStats): Counters of the breaker.
+
+    Methods:
+        state: Returns the current state.
+        allow: Admits a request or raises `CircuitOpenError`.
+        record: Records the outcome of an admitted request.
+        guard: Context manager admitting a request and recording its outcome.
+        aguard: Async counterpart of `guard`.
+    """
+
+    def __init__(self,
+                 name: str,
+                 failure_rate: float = CIRCUIT_BREAKER_FAILURE_RATE,
+                 window_seconds: float = CIRCUIT_BREAKER_WINDOW_SECONDS,
+                 min_requests: int = CIRCUIT_BREAKER_MIN_REQUESTS,
+                 open_seconds: float = CIRCUIT_BREAKER_OPEN_SECONDS,
+                 half_open_calls: int = CIRCUIT_BREAKER_HALF_OPEN_CALLS):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.window_seconds = window_seconds
+        self.min_requests = min_requests
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.stats = CircuitBreakerStats()
+
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._trials = 0
+        self._outcomes = deque()
+        self._lock = threading.Lock()
+
+    def __transition__(self, now: float):
+        if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._trials = 0
+            trace_logger.info(f"Circuit of {self.name} is half-open")
+
+    def state(self) -> str:
+        with self._lock:
+            self.__transition__(time.monotonic())
+            return self._state
+
+    def allow(self) -> bool:
+        """
+        Admits a request; returns True for a half-open trial request.
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or half-open with all trial slots taken.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.__transition__(now)
+            if self._state == CLOSED:
+                return False
+            if self._state == HALF_OPEN and self._trials < self.half_open_calls:
+                self._trials += 1
+                return True
+            self.stats.rejected += 1
+            retry_after = max(0.0, self._opened_at + self.open_seconds - now)
+            raise CircuitOpenError(self.name, retry_after)
+
+    def __open__(self, now: float):
+        self._state = OPEN
+        self._opened_at = now
+        self._outcomes.clear()
+        self.stats.opened += 1
+        trace_logger.error(f"Circuit of {self.name} opened for {self.open_seconds:.0f}s")
+
+    def record(self, trial: bool, error: Optional[BaseException] = None):
+        failed = error is not None and is_endpoint_failure(error)
+        with self._lock:
+            now = time.monotonic()
+            if failed:
+                self.stats.failures += 1
+            else:
+                self.stats.successes += 1
+
+            if trial:
+                self._trials -= 1
+                if failed:
+                    self.__open__(now)
+                elif self._state == HALF_OPEN:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                    trace_logger.info(f"Circuit of {self.name} closed")
+                return
+            if self._state != CLOSED:
+                # Late answer of a request admitted before the circuit opened
+                return
+
+            self._outcomes.append((now, failed))
+            while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+                self._outcomes.popleft()
+            failures = sum(outcome for _, outcome in self._outcomes)
+            if len(self._outcomes) >= self.min_requests and failures / len(self._outcomes) >= self.failure_rate:
+                self.__open__(now)
+
+    @contextmanager
+    def guard(self):
+        trial = self.allow()
+        try:
+            yield
+        except Exception as e:
+            self.record(trial, e)
+            raise
+        except BaseException:
+            # Cancellation says nothing about the endpoint; give the trial slot back
+            if trial:
+                with self._lock:
+                    self._trials -= 1
+            raise
+        self.record(trial)
+
+    @asynccontextmanager
+    async def aguard(self):
+        trial = self.allow()
+        try:
+            yield
+        except Exception as e:
+            self.record(trial, e)
+            raise
+        except BaseException:
+            if trial:
+                with self._lock:
+                    self._trials -= 1
+            raise
+        self.record(trial)
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def circuit_breaker_for(base_url: str) -> CircuitBreaker:
+    """
+    Returns the process-wide circuit breaker of an endpoint.
+    """
+    key = str(base_url).rstrip("/")
+    with _breakers_lock:
+        if key not in _breakers:
+            _breakers[key] = CircuitBreaker(key)
+        return _breakers[key]
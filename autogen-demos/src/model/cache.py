@@ -0,0 +1,285 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+from src.constants import RESPONSE_CACHE_PATH, RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_ITEMS, \
+    RESPONSE_CACHE_MAX_BYTES
+from src.logging import trace_logger
+
+
+def _json_default(value: Any):
+    # Chat history may carry pydantic objects such as `ChatCompletionMessage`
+    if isinstance(value, BaseModel):
+        return value.model_dump(exclude_none=True)
+    return str(value)
+
+
+def schema_hash(response_model: Type[BaseModel]) -> str:
+    """
+    Returns a stable hash of the JSON schema of a pydantic response model.
+    """
+    schema = json.dumps(response_model.model_json_schema(), sort_keys=True, default=_json_default)
+    return hashlib.sha256(schema.encode("utf-8")).hexdigest()
+
+
+def request_key(model: str, messages: List[Dict], response_model: Type[BaseModel], params: Dict) -> str:
+    """
+    Builds a content-addressed key for a structured-output request.
+
+    Args:
+        model (str): Name of the model the request is sent to.
+        messages (List[Dict]): The chat messages of the request.
+        response_model (Type[BaseModel]): The pydantic model the response is parsed into.
+        params (Dict): Sampling parameters sent with the request.
+
+    Returns:
+        str: A SHA-256 hex digest identifying the request.
+    """
+    payload = json.dumps(
+        {
+            "model": model,
+            "messages": messages,
+            "schema": schema_hash(response_model),
+            "params": params,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+        default=_json_default,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheStats:
+    """
+    Counters exposed by the `ResponseCache` for sizing.
+    """
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    memory_evictions: int = 0
+    disk_evictions: int = 0
+    expirations: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+
+    def to_dict(self) -> Dict:
+        return {**asdict(self), "hit_rate": self.hit_rate}
+
+
+class MemoryTier:
+    """
+    In-memory LRU tier holding serialised responses, with the same TTL expiry as the disk tier.
+    """
+
+    def __init__(self, max_items: int = RESPONSE_CACHE_MAX_ITEMS, ttl: float = RESPONSE_CACHE_TTL):
+        self.max_items = max_items
+        self.ttl = ttl
+        # key -> (value, creation time)
+        self._items: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+
+    def get(self, key: str) -> Tuple[Optional[str], bool]:
+        """
+        Returns the stored value (or None) and whether an expired entry was dropped.
+        """
+        item = self._items.get(key)
+        if item is None:
+            return None, False
+        value, created = item
+        if self.ttl and time.time() - created > self.ttl:
+            del self._items[key]
+            return None, True
+        self._items.move_to_end(key)
+        return value, False
+
+    def delete(self, key: str):
+        self._items.pop(key, None)
+
+    def set(self, key: str, value: str, created: Optional[float] = None) -> int:
+        """
+        Stores a value and returns the number of entries evicted to make room for it.
+
+        `created` keeps the creation time of a value promoted from the disk tier, so promotion
+        does not extend its lifetime.
+        """
+        self._items[key] = (value, time.time() if created is None else created)
+        self._items.move_to_end(key)
+        evicted = 0
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+            evicted += 1
+        return evicted
+
+    def clear(self):
+        self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class DiskTier:
+    """
+    Persistent SQLite tier with TTL expiry and size-based LRU eviction.
+    """
+
+    def __init__(self,
+                 path: str = RESPONSE_CACHE_PATH,
+                 ttl: float = RESPONSE_CACHE_TTL,
+                 max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+        os.makedirs(path, exist_ok=True)
+        self._connection = sqlite3.connect(os.path.join(path, "responses.sqlite3"), check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._connection.commit()
+
+    def get(self, key: str) -> Tuple[Optional[str], Optional[float], bool]:
+        """
+        Returns the stored value and its creation time (or None), and whether an expired entry was dropped.
+        """
+        row = self._connection.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None, None, False
+
+        now = time.time()
+        if self.ttl and now - row[1] > self.ttl:
+            self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._connection.commit()
+            return None, None, True
+
+        self._connection.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        self._connection.commit()
+        return row[0], row[1], False
+
+    def set(self, key: str, value: str) -> int:
+        """
+        Stores a value and returns the number of entries evicted to stay under `max_bytes`.
+        """
+        now = time.time()
+        self._connection.execute(
+            "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+            (key, value, len(value.encode("utf-8")), now, now)
+        )
+
+        evicted = 0
+        total = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total > self.max_bytes:
+            # Drop least recently accessed entries until the tier fits again
+            for old_key, size in self._connection.execute(
+                    "SELECT key, size FROM responses ORDER BY accessed ASC").fetchall():
+                if total <= self.max_bytes or old_key == key:
+                    break
+                self._connection.execute("DELETE FROM responses WHERE key = ?", (old_key,))
+                total -= size
+                evicted += 1
+
+        self._connection.commit()
+        return evicted
+
+    def delete(self, key: str):
+        self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+        self._connection.commit()
+
+    def clear(self):
+        self._connection.execute("DELETE FROM responses")
+        self._connection.commit()
+
+    def close(self):
+        self._connection.close()
+
+
+class ResponseCache:
+    """
+    Two-tier, content-addressed cache for structured LLM responses.
+
+    Lookups go to the in-memory LRU tier first and then to the on-disk tier; disk hits are
+    promoted to memory. Both tiers expire entries `ttl` seconds after they were first stored,
+    disk hits promoted to memory included. Responses are stored as JSON and rebuilt into the requested pydantic
+    model on a hit, so no network call is made.
+
+    Attributes:
+        memory (MemoryTier): In-memory LRU tier.
+        disk (Optional[DiskTier]): Persistent tier, disabled when `path` is None.
+        stats (CacheStats): Hit, miss and eviction counters.
+
+    Methods:
+        get: Returns the cached response for a key rebuilt into `response_model`, or None.
+        set: Stores a response under a key in both tiers.
+        clear: Empties both tiers.
+    """
+
+    def __init__(self,
+                 path: Optional[str] = RESPONSE_CACHE_PATH,
+                 ttl: float = RESPONSE_CACHE_TTL,
+                 max_items: int = RESPONSE_CACHE_MAX_ITEMS,
+                 max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.memory = MemoryTier(max_items=max_items, ttl=ttl)
+        self.disk = DiskTier(path=path, ttl=ttl, max_bytes=max_bytes) if path else None
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, response_model: Type[BaseModel]) -> Optional[BaseModel]:
+        with self._lock:
+            value, expired = self.memory.get(key)
+            created, from_disk = None, False
+            if value is None and self.disk is not None:
+                value, created, disk_expired = self.disk.get(key)
+                expired = expired or disk_expired
+                from_disk = value is not None
+
+            self.stats.expirations += int(expired)
+            if value is None:
+                self.stats.misses += 1
+                return None
+
+        try:
+            response = response_model.model_validate_json(value)
+        except Exception as e:
+            # The schema changed under the same name; drop the entry and treat it as a miss
+            trace_logger.error(f"Discarding cached response that no longer validates: {e}")
+            with self._lock:
+                self.stats.misses += 1
+                self.memory.delete(key)
+                if self.disk is not None:
+                    self.disk.delete(key)
+            return None
+
+        # Hits are only counted, and disk hits promoted, once the response validates
+        with self._lock:
+            if from_disk:
+                self.stats.disk_hits += 1
+                self.stats.memory_evictions += self.memory.set(key, value, created)
+            else:
+                self.stats.memory_hits += 1
+        return response
+
+    def set(self, key: str, response: BaseModel):
+        value = response.model_dump_json()
+        with self._lock:
+            self.stats.memory_evictions += self.memory.set(key, value)
+            if self.disk is not None:
+                self.stats.disk_evictions += self.disk.set(key, value)
+
+    def clear(self):
+        with self._lock:
+            self.memory.clear()
+            if self.disk is not None:
+                self.disk.clear()
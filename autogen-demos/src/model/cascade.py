@@ -0,0 +1,227 @@
+import threading
+import time
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, Iterable, List, Sequence, Type, Union
+
+from pydantic import BaseModel, ValidationError
+
+from src.constants import MODEL_POOL_ENDPOINTS, MODEL_COSTS
+from src.logging import trace_logger
+from src.model.base import RouterLLM
+from src.model.ratelimit import response_tokens
+
+# A check returns False (or raises) when a response must be escalated to the next tier
+Check = Callable[[BaseModel], bool]
+
+
+def confidence_at_least(threshold: float, path: str = "confidence") -> Check:
+    """
+    Builds a check passing when the dotted numeric field `path` is at least `threshold`.
+    """
+    attributes = path.split(".")
+
+    def check(response: BaseModel) -> bool:
+        value = response
+        for attribute in attributes:
+            value = getattr(value, attribute, None)
+        return value is not None and value >= threshold
+
+    check.__name__ = f"confidence_at_least({path}, {threshold})"
+    return check
+
+
+@dataclass
+class CascadeTier:
+    """
+    One model of a cascade.
+
+    Attributes:
+        name (str): Tier name, usually the `MODEL_POOL_ENDPOINTS` name.
+        llm (RouterLLM): Router sending the structured requests of this tier.
+        cost (float): Cost per 1K tokens, see `MODEL_COSTS`.
+    """
+    name: str
+    llm: RouterLLM
+    cost: float = 0.0
+
+
+@dataclass
+class TierStats:
+    """
+    Counters of one cascade tier.
+
+    Attributes:
+        attempts (int): Requests sent to the tier.
+        served (int): Requests whose response passed validation at this tier.
+        escalated (int): Requests passed on to the next tier.
+        seconds (float): Total latency of the tier's requests.
+        tokens (int): Total tokens reported by the tier.
+    """
+    attempts: int = 0
+    served: int = 0
+    escalated: int = 0
+    seconds: float = 0.0
+    tokens: int = 0
+
+
+class Cascade:
+    """
+    Cheap-first cascade of structured-output models.
+
+    Each request goes to the cheapest tier first. The response is re-validated against the
+    pydantic schema and every `checks` function; only when this fails (empty response,
+    validation error, failed check) is the request escalated to the next tier. If no tier
+    passes, the last parsed response is returned, or an empty dict like `RouterLLM`.
+
+    Attributes:
+        tiers (List[CascadeTier]): Tiers from cheapest to most capable.
+        checks (List[Callable]): Confidence checks applied to every response.
+
+    Methods:
+        from_endpoints: Builds a cascade over named `MODEL_POOL_ENDPOINTS`.
+        run: Answers a prompt with the cheapest tier that passes validation.
+        arun: Async counterpart of `run`.
+        report: Returns the share of traffic, latency and cost per tier and the savings.
+    """
+
+    def __init__(self, tiers: Iterable[CascadeTier], checks: Sequence[Check] = ()):
+        self.tiers: List[CascadeTier] = list(tiers)
+        if not self.tiers:
+            raise Exception("A cascade needs at least one tier")
+        self.checks = list(checks)
+        self.stats: Dict[str, TierStats] = {tier.name: TierStats() for tier in self.tiers}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_endpoints(cls, names: Iterable[str], checks: Sequence[Check] = (), **router_kwargs) -> "Cascade":
+        """
+        Builds a cascade from `MODEL_POOL_ENDPOINTS` names, cheapest first, skipping unconfigured endpoints.
+
+        Args:
+            names (Iterable[str]): Endpoint names, e.g. `["LLAMA3_2", "QWEN"]`.
+            checks (Sequence[Callable]): Confidence checks applied to every response.
+            router_kwargs: Arguments of every tier's `RouterLLM` (`temperature`, `top_p`, ...).
+        """
+        tiers = []
+        for name in names:
+            endpoint = MODEL_POOL_ENDPOINTS[name]
+            if not endpoint["base_url"]:
+                continue
+            llm = RouterLLM(
+                model=endpoint["model"],
+                openai_api_base=endpoint["base_url"],
+                openai_api_key=endpoint["api_key"],
+                **router_kwargs
+            )
+            tiers.append(CascadeTier(name=name, llm=llm, cost=MODEL_COSTS.get(name, 0.0)))
+        return cls(tiers, checks)
+
+    def __accept__(self, response, response_model: Type[BaseModel], checks: Sequence[Check]) -> bool:
+        if not isinstance(response, response_model):
+            return False
+        try:
+            response_model.model_validate(response.model_dump())
+            return all(check(response) for check in checks)
+        except ValidationError as e:
+            trace_logger.info(f"Cascade response failed validation: {e}")
+            return False
+        except Exception as e:
+            trace_logger.info(f"Cascade check failed: {e}")
+            return False
+
+    def __record__(self, tier: CascadeTier, seconds: float, response, accepted: bool, last: bool):
+        with self._lock:
+            stats = self.stats[tier.name]
+            stats.attempts += 1
+            stats.seconds += seconds
+            stats.tokens += response_tokens(response) or 0
+            if accepted:
+                stats.served += 1
+            elif not last:
+                stats.escalated += 1
+
+    def run(self, prompt: str, response_model: Type[BaseModel], checks: Sequence[Check] = (),
+            **kwargs) -> Union[BaseModel, Dict]:
+        """
+        Answers `prompt` with the cheapest tier whose response passes validation.
+
+        Args:
+            prompt (str): The user prompt.
+            response_model (Type[BaseModel]): The schema of the response.
+            checks (Sequence[Callable]): Extra checks for this request only.
+            kwargs: Passed to `structured_output_to_pydantic_model`, e.g. `chat_history`.
+
+        Returns:
+            The accepted response; otherwise the last parsed response or an empty dict.
+        """
+        checks = self.checks + list(checks)
+        fallback = {}
+        for index, tier in enumerate(self.tiers):
+            start = time.perf_counter()
+            response = tier.llm.structured_output_to_pydantic_model(prompt, response_model=response_model, **kwargs)
+            accepted = self.__accept__(response, response_model, checks)
+            self.__record__(tier, time.perf_counter() - start, response, accepted, index == len(self.tiers) - 1)
+            if accepted:
+                return response
+            if isinstance(response, response_model):
+                fallback = response
+            trace_logger.info(f"Cascade tier {tier.name} rejected the response")
+        return fallback
+
+    async def arun(self, prompt: str, response_model: Type[BaseModel], checks: Sequence[Check] = (),
+                   **kwargs) -> Union[BaseModel, Dict]:
+        """
+        Async counterpart of `run`.
+        """
+        checks = self.checks + list(checks)
+        fallback = {}
+        for index, tier in enumerate(self.tiers):
+            start = time.perf_counter()
+            response = await tier.llm.astructured_output_to_pydantic_model(
+                prompt, response_model=response_model, **kwargs)
+            accepted = self.__accept__(response, response_model, checks)
+            self.__record__(tier, time.perf_counter() - start, response, accepted, index == len(self.tiers) - 1)
+            if accepted:
+                return response
+            if isinstance(response, response_model):
+                fallback = response
+            trace_logger.info(f"Cascade tier {tier.name} rejected the response")
+        return fallback
+
+    def report(self) -> Dict:
+        """
+        Returns traffic share, latency and cost per tier, and the savings over always using the top tier.
+
+        Savings compare the observed totals with every request sent straight to the top tier at
+        its observed mean latency and cost per token; they are None until the top tier has
+        served at least one request.
+        """
+        with self._lock:
+            stats = {name: TierStats(**asdict(tier_stats)) for name, tier_stats in self.stats.items()}
+
+        requests = stats[self.tiers[0].name].attempts
+        top = self.tiers[-1]
+        top_stats = stats[top.name]
+        tiers = {}
+        total_seconds, total_cost, total_tokens = 0.0, 0.0, 0
+        for tier in self.tiers:
+            tier_stats = stats[tier.name]
+            cost = tier_stats.tokens / 1000 * tier.cost
+            total_seconds += tier_stats.seconds
+            total_cost += cost
+            total_tokens += tier_stats.tokens
+            tiers[tier.name] = dict(
+                asdict(tier_stats),
+                share=tier_stats.served / requests if requests else 0.0,
+                mean_latency=tier_stats.seconds / tier_stats.attempts if tier_stats.attempts else None,
+                cost=cost,
+            )
+
+        report = {"requests": requests, "tiers": tiers, "latency_saved": None, "cost_saved": None}
+        if requests and top_stats.attempts:
+            top_latency = top_stats.seconds / top_stats.attempts
+            # Tokens per request barely depend on the tier for the same prompt and schema
+            top_cost = total_tokens / sum(s.attempts for s in stats.values()) / 1000 * top.cost
+            report["latency_saved"] = requests * top_latency - total_seconds
+            report["cost_saved"] = requests * top_cost - total_cost
+        return report
@@ -0,0 +1,312 @@
+import asyncio
+import codecs
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+from src.constants import CASSETTE_MODE, CASSETTE_PATH, CASSETTE_SPEEDUP
+from src.logging import trace_logger
+
+RECORD = "record"
+REPLAY = "replay"
+
+# Response headers worth replaying; everything else depends on the live server
+_KEPT_HEADERS = ("content-type", "retry-after")
+
+
+def request_fingerprint(method: str, path: str, body: bytes) -> str:
+    """
+    Returns the cassette key of a request: its method, URL path and canonical JSON body.
+
+    The host is left out, so traffic recorded against one deployment replays against any base URL.
+    """
+    try:
+        canonical = json.dumps(json.loads(body), sort_keys=True, ensure_ascii=False).encode("utf-8")
+    except (TypeError, ValueError):
+        canonical = body or b""
+    digest = hashlib.sha256(f"{method.upper()} {path}\n".encode("utf-8") + canonical)
+    return digest.hexdigest()
+
+
+class Cassette:
+    """
+    Append-only JSONL file of recorded HTTP interactions.
+
+    Every line holds one request/response pair: the fingerprint, request body, status, kept
+    headers, wall-clock start, latency until the response headers, and either the body or, for
+    streamed responses, the text chunks with their offsets. Identical requests recorded several
+    times are replayed in turn.
+
+    Attributes:
+        path (str): Location of the cassette file.
+
+    Methods:
+        append: Writes a new interaction.
+        next: Returns the next recorded interaction for a fingerprint.
+        interactions: Returns every interaction in recording order.
+    """
+
+    def __init__(self, path: str = CASSETTE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._interactions: List[Dict] = []
+        self._by_key: Dict[str, List[Dict]] = {}
+        self._cursors: Dict[str, int] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as file:
+                for line in file:
+                    if line.strip():
+                        self.__remember__(json.loads(line))
+
+    def __remember__(self, interaction: Dict):
+        self._interactions.append(interaction)
+        self._by_key.setdefault(interaction["key"], []).append(interaction)
+
+    def append(self, interaction: Dict):
+        line = json.dumps(interaction, ensure_ascii=False)
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(line + "\n")
+            self.__remember__(interaction)
+
+    def next(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            recorded = self._by_key.get(key)
+            if not recorded:
+                return None
+            cursor = self._cursors.get(key, 0)
+            self._cursors[key] = cursor + 1
+            return recorded[cursor % len(recorded)]
+
+    def interactions(self) -> List[Dict]:
+        with self._lock:
+            return list(self._interactions)
+
+
+def _interaction(request: httpx.Request, body: bytes, key: str, started: float, latency: float,
+                 response: httpx.Response) -> Dict:
+    try:
+        request_body = json.loads(body)
+    except (TypeError, ValueError):
+        request_body = None
+    return {
+        "key": key,
+        "method": request.method,
+        "path": request.url.path,
+        "request": request_body,
+        "status": response.status_code,
+        "headers": {name: response.headers[name] for name in _KEPT_HEADERS if name in response.headers},
+        "started": started,
+        "latency": latency,
+    }
+
+
+def _is_stream(response: httpx.Response) -> bool:
+    return response.headers.get("content-type", "").startswith("text/event-stream")
+
+
+class _Recorder:
+    """
+    Collects the chunks of a live response and writes the interaction once it is complete.
+    """
+
+    def __init__(self, cassette: Cassette, interaction: Dict, stream: bool):
+        self.cassette = cassette
+        self.interaction = interaction
+        self.stream = stream
+        self.start = time.perf_counter()
+        self.chunks = []
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    def feed(self, data: bytes):
+        text = self.decoder.decode(data)
+        if text:
+            self.chunks.append([time.perf_counter() - self.start, text])
+
+    def finish(self):
+        tail = self.decoder.decode(b"", final=True)
+        if tail:
+            self.chunks.append([time.perf_counter() - self.start, tail])
+        if self.stream:
+            self.interaction["chunks"] = self.chunks
+        else:
+            self.interaction["body"] = "".join(text for _, text in self.chunks)
+        self.cassette.append(self.interaction)
+
+
+class _RecordingStream(httpx.SyncByteStream):
+    def __init__(self, inner: httpx.SyncByteStream, recorder: _Recorder):
+        self.inner = inner
+        self.recorder = recorder
+
+    def __iter__(self) -> Iterator[bytes]:
+        for data in self.inner:
+            self.recorder.feed(data)
+            yield data
+
+    def close(self):
+        self.inner.close()
+        self.recorder.finish()
+
+
+class _AsyncRecordingStream(httpx.AsyncByteStream):
+    def __init__(self, inner: httpx.AsyncByteStream, recorder: _Recorder):
+        self.inner = inner
+        self.recorder = recorder
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for data in self.inner:
+            self.recorder.feed(data)
+            yield data
+
+    async def aclose(self):
+        await self.inner.aclose()
+        self.recorder.finish()
+
+
+class _ReplayStream(httpx.SyncByteStream):
+    def __init__(self, chunks: List, speedup: float):
+        self.chunks = chunks
+        self.speedup = speedup
+
+    def __iter__(self) -> Iterator[bytes]:
+        start = time.perf_counter()
+        for offset, text in self.chunks:
+            if self.speedup > 0:
+                time.sleep(max(0.0, offset / self.speedup - (time.perf_counter() - start)))
+            yield text.encode("utf-8")
+
+
+class _AsyncReplayStream(httpx.AsyncByteStream):
+    def __init__(self, chunks: List, speedup: float):
+        self.chunks = chunks
+        self.speedup = speedup
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        start = time.perf_counter()
+        for offset, text in self.chunks:
+            if self.speedup > 0:
+                await asyncio.sleep(max(0.0, offset / self.speedup - (time.perf_counter() - start)))
+            yield text.encode("utf-8")
+
+
+def _missing(key: str) -> httpx.Response:
+    # A 404 is raised by the OpenAI SDK as NotFoundError and never retried
+    return httpx.Response(404, json={"error": {"message": f"No recorded response for request {key[:12]}",
+                                               "type": "cassette_miss"}})
+
+
+class CassetteTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """
+    httpx transport recording live LLM traffic to a `Cassette`, or replaying it without a network.
+
+    In `record` mode requests go to the real endpoint and each response is written to the
+    cassette once fully read, streamed responses included, so recording does not change what
+    the caller sees. In `replay` mode the recorded response is returned after its recorded
+    latency divided by `speedup` (0 replays at once); streamed chunks keep their relative
+    timing. Requests missing from the cassette get a 404.
+
+    Attributes:
+        mode (str): `record` or `replay`.
+        cassette (Cassette): The recorded interactions.
+        speedup (float): Factor by which replayed latencies are shortened.
+    """
+
+    def __init__(self, mode: str, cassette: Cassette, speedup: float = CASSETTE_SPEEDUP,
+                 limits: Optional[httpx.Limits] = None):
+        if mode not in (RECORD, REPLAY):
+            raise Exception(f"Unknown cassette mode `{mode}`, expected `{RECORD}` or `{REPLAY}`")
+        self.mode = mode
+        self.cassette = cassette
+        self.speedup = speedup
+        limits = limits or httpx.Limits()
+        self._transport = httpx.HTTPTransport(limits=limits)
+        self._async_transport = httpx.AsyncHTTPTransport(limits=limits)
+
+    def __replay__(self, key: str) -> Tuple[Optional[Dict], float]:
+        interaction = self.cassette.next(key)
+        if interaction is None:
+            trace_logger.warning(f"Cassette has no response for request {key[:12]}")
+            return None, 0.0
+        return interaction, interaction["latency"] / self.speedup if self.speedup > 0 else 0.0
+
+    def __replayed_response__(self, interaction: Dict, sync: bool) -> httpx.Response:
+        if "chunks" in interaction:
+            stream = _ReplayStream(interaction["chunks"], self.speedup) if sync \
+                else _AsyncReplayStream(interaction["chunks"], self.speedup)
+            return httpx.Response(interaction["status"], headers=interaction["headers"], stream=stream)
+        return httpx.Response(interaction["status"], headers=interaction["headers"],
+                              content=interaction["body"].encode("utf-8"))
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        body = request.read()
+        key = request_fingerprint(request.method, request.url.path, body)
+        if self.mode == REPLAY:
+            interaction, delay = self.__replay__(key)
+            if interaction is None:
+                return _missing(key)
+            time.sleep(delay)
+            return self.__replayed_response__(interaction, sync=True)
+
+        # Recorded bodies must be plain text
+        request.headers["Accept-Encoding"] = "identity"
+        started, start = time.time(), time.perf_counter()
+        response = self._transport.handle_request(request)
+        interaction = _interaction(request, body, key, started, time.perf_counter() - start, response)
+        recorder = _Recorder(self.cassette, interaction, _is_stream(response))
+        return httpx.Response(response.status_code, headers=response.headers,
+                              stream=_RecordingStream(response.stream, recorder), extensions=response.extensions)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        key = request_fingerprint(request.method, request.url.path, body)
+        if self.mode == REPLAY:
+            interaction, delay = self.__replay__(key)
+            if interaction is None:
+                return _missing(key)
+            await asyncio.sleep(delay)
+            return self.__replayed_response__(interaction, sync=False)
+
+        request.headers["Accept-Encoding"] = "identity"
+        started, start = time.time(), time.perf_counter()
+        response = await self._async_transport.handle_async_request(request)
+        interaction = _interaction(request, body, key, started, time.perf_counter() - start, response)
+        recorder = _Recorder(self.cassette, interaction, _is_stream(response))
+        return httpx.Response(response.status_code, headers=response.headers,
+                              stream=_AsyncRecordingStream(response.stream, recorder),
+                              extensions=response.extensions)
+
+    def close(self):
+        self._transport.close()
+
+    async def aclose(self):
+        await self._async_transport.aclose()
+
+
+_cassettes: Dict[str, Cassette] = {}
+_cassettes_lock = threading.Lock()
+
+
+def cassette_transport(limits: Optional[httpx.Limits] = None) -> Optional[CassetteTransport]:
+    """
+    Returns a transport over the process-wide `CASSETTE_PATH` cassette, or None unless `CASSETTE_MODE` is set.
+
+    Args:
+        limits (Optional[httpx.Limits]): Connection pool limits of the live transport used for recording.
+    """
+    if not CASSETTE_MODE:
+        return None
+    with _cassettes_lock:
+        if CASSETTE_PATH not in _cassettes:
+            _cassettes[CASSETTE_PATH] = Cassette(CASSETTE_PATH)
+            trace_logger.info(f"Cassette {CASSETTE_MODE} mode on {CASSETTE_PATH}")
+        cassette = _cassettes[CASSETTE_PATH]
+    return CassetteTransport(CASSETTE_MODE, cassette, CASSETTE_SPEEDUP, limits)
@@ -0,0 +1,486 @@
+from typing import Any, AsyncGenerator, Dict, Iterable, Mapping, Optional, Sequence, Union
+
+import httpx
+from autogen_core import CancellationToken
+from autogen_core.models import ChatCompletionClient, CreateResult, LLMMessage, ModelCapabilities, ModelInfo, \
+    RequestUsage
+from autogen_core.tools import Tool, ToolSchema
+from autogen_ext.models.openai import OpenAIChatCompletionClient
+from pydantic import BaseModel
+
+from src.constants import MODEL_POOL_ENDPOINTS, CIRCUIT_BREAKER_FALLBACK
+from src.logging import trace_logger
+from src.model.breaker import CircuitBreaker, CircuitOpenError, circuit_breaker_for
+from src.model.cassette import cassette_transport
+from src.model.context import MESSAGE_OVERHEAD_TOKENS, IMAGE_TOKENS, count_text_tokens
+from src.model.pool import ModelPool, Replica, is_endpoint_failure
+from src.model.prompt import PrefixTracker, prefix_tracker, request_text
+from src.model.ratelimit import RateLimiter, rate_limiter_for
+
+
+class ChatCompletionClientWrapper(ChatCompletionClient):
+    """
+    Delegates every `ChatCompletionClient` call to an inner client.
+
+    Subclasses override `create` / `create_stream` to add behaviour (load balancing, rate
+    limiting, circuit breaking, ...) while agents keep using the standard client interface.
+    """
+
+    def __init__(self, inner: ChatCompletionClient):
+        self._inner = inner
+
+    async def create(
+            self,
+            messages: Sequence[LLMMessage],
+            *,
+            tools: Sequence[Union[Tool, ToolSchema]] = [],
+            json_output: Optional[Union[bool, type[BaseModel]]] = None,
+            extra_create_args: Mapping[str, Any] = {},
+            cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        return await self._inner.create(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        )
+
+    async def create_stream(
+            self,
+            messages: Sequence[LLMMessage],
+            *,
+            tools: Sequence[Union[Tool, ToolSchema]] = [],
+            json_output: Optional[Union[bool, type[BaseModel]]] = None,
+            extra_create_args: Mapping[str, Any] = {},
+            cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        async for item in self._inner.create_stream(
+                messages,
+                tools=tools,
+                json_output=json_output,
+                extra_create_args=extra_create_args,
+                cancellation_token=cancellation_token,
+        ):
+            yield item
+
+    async def close(self) -> None:
+        await self._inner.close()
+
+    def actual_usage(self) -> RequestUsage:
+        return self._inner.actual_usage()
+
+    def total_usage(self) -> RequestUsage:
+        return self._inner.total_usage()
+
+    def count_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Union[Tool, ToolSchema]] = []) -> int:
+        return self._inner.count_tokens(messages, tools=tools)
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], *,
+                         tools: Sequence[Union[Tool, ToolSchema]] = []) -> int:
+        return self._inner.remaining_tokens(messages, tools=tools)
+
+    @property
+    def capabilities(self) -> ModelCapabilities:
+        return self._inner.capabilities
+
+    @property
+    def model_info(self) -> ModelInfo:
+        return self._inner.model_info
+
+
+def estimate_message_tokens(messages: Sequence[LLMMessage]) -> int:
+    """
+    Estimates the prompt tokens of autogen messages without calling the model's tokenizer.
+    """
+    tokens = 0
+    for message in messages:
+        tokens += MESSAGE_OVERHEAD_TOKENS
+        content = getattr(message, "content", "")
+        for part in content if isinstance(content, list) else [content]:
+            if isinstance(part, str):
+                tokens += count_text_tokens(part)
+            elif hasattr(part, "arguments"):
+                # FunctionCall
+                tokens += count_text_tokens(part.name) + count_text_tokens(part.arguments)
+            elif isinstance(getattr(part, "content", None), str):
+                # FunctionExecutionResult
+                tokens += count_text_tokens(part.content)
+            else:
+                tokens += IMAGE_TOKENS
+    return tokens
+
+
+def _sum_usage(usages: Iterable[RequestUsage]) -> RequestUsage:
+    prompt_tokens, completion_tokens = 0, 0
+    for usage in usages:
+        prompt_tokens += usage.prompt_tokens
+        completion_tokens += usage.completion_tokens
+    return RequestUsage(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+
+def _usage_tokens(result: CreateResult) -> int:
+    return result.usage.prompt_tokens + result.usage.completion_tokens
+
+
+class RateLimitedChatCompletionClient(ChatCompletionClientWrapper):
+    """
+    `ChatCompletionClient` queueing requests until they fit the endpoint's shared `RateLimiter` budget.
+
+    Args:
+        inner (ChatCompletionClient): The client sending the requests.
+        limiter (RateLimiter): Budget of the endpoint behind `inner`.
+        max_tokens (int): Completion tokens reserved per request on top of the prompt estimate.
+    """
+
+    def __init__(self, inner: ChatCompletionClient, limiter: RateLimiter, max_tokens: int = 0):
+        super().__init__(inner)
+        self.limiter = limiter
+        self.max_tokens = max_tokens
+
+    async def create(
+            self,
+            messages: Sequence[LLMMessage],
+            *,
+            tools: Sequence[Union[Tool, ToolSchema]] = [],
+            json_output: Optional[Union[bool, type[BaseModel]]] = None,
+            extra_create_args: Mapping[str, Any] = {},
+            cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        estimated = estimate_message_tokens(messages) + self.max_tokens
+        await self.limiter.aacquire(estimated)
+        result = await super().create(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        )
+        self.limiter.settle(estimated, _usage_tokens(result))
+        return result
+
+    async def create_stream(
+            self,
+            messages: Sequence[LLMMessage],
+            *,
+            tools: Sequence[Union[Tool, ToolSchema]] = [],
+            json_output: Optional[Union[bool, type[BaseModel]]] = None,
+            extra_create_args: Mapping[str, Any] = {},
+            cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        estimated = estimate_message_tokens(messages) + self.max_tokens
+        await self.limiter.aacquire(estimated)
+        async for item in super().create_stream(
+                messages,
+                tools=tools,
+                json_output=json_output,
+                extra_create_args=extra_create_args,
+                cancellation_token=cancellation_token,
+        ):
+            if isinstance(item, CreateResult):
+                self.limiter.settle(estimated, _usage_tokens(item))
+            yield item
+
+
+class PrefixTrackingChatCompletionClient(ChatCompletionClientWrapper):
+    """
+    `ChatCompletionClient` recording the shared-prefix length of every request in a `PrefixTracker`.
+
+    Args:
+        inner (ChatCompletionClient): The client sending the requests.
+        model (str): Model name the requests are tracked under.
+        tracker (PrefixTracker): Tracker of the recent prompts per model.
+    """
+
+    def __init__(self, inner: ChatCompletionClient, model: str, tracker: PrefixTracker = prefix_tracker):
+        super().__init__(inner)
+        self.model = model
+        self.tracker = tracker
+
+    def __observe__(self, messages: Sequence[LLMMessage], tools: Sequence[Union[Tool, ToolSchema]]):
+        schemas = [tool.schema if isinstance(tool, Tool) else tool for tool in tools]
+        self.tracker.observe(self.model, request_text(messages, schemas))
+
+    async def create(
+            self,
+            messages: Sequence[LLMMessage],
+            *,
+            tools: Sequence[Union[Tool, ToolSchema]] = [],
+            json_output: Optional[Union[bool, type[BaseModel]]] = None,
+            extra_create_args: Mapping[str, Any] = {},
+            cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        self.__observe__(messages, tools)
+        return await super().create(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        )
+
+    async def create_stream(
+            self,
+            messages: Sequence[LLMMessage],
+            *,
+            tools: Sequence[Union[Tool, ToolSchema]] = [],
+            json_output: Optional[Union[bool, type[BaseModel]]] = None,
+            extra_create_args: Mapping[str, Any] = {},
+            cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        self.__observe__(messages, tools)
+        async for item in super().create_stream(
+                messages,
+                tools=tools,
+                json_output=json_output,
+                extra_create_args=extra_create_args,
+                cancellation_token=cancellation_token,
+        ):
+            yield item
+
+
+def rate_limited_client(**client_kwargs) -> ChatCompletionClient:
+    """
+    Builds an `OpenAIChatCompletionClient`, wrapped in the endpoint's rate limiter when `RATE_LIMITS` sets one.
+
+    Requests are also recorded in `prefix_tracker` when `PROMPT_PREFIX_WINDOW` is set above 0.
+
+    Args:
+        client_kwargs: Arguments of `OpenAIChatCompletionClient`; `base_url` selects the limiter.
+
+    Returns:
+        ChatCompletionClient: The rate-limited client, or the unthrottled client for unlimited endpoints.
+    """
+    transport = cassette_transport() if "http_client" not in client_kwargs else None
+    if transport is not None:
+        # Recording or replaying through `CASSETTE_PATH`, like the `RouterLLM` clients
+        client_kwargs = dict(client_kwargs, http_client=httpx.AsyncClient(transport=transport))
+    client = OpenAIChatCompletionClient(**client_kwargs)
+    if prefix_tracker.window > 0:
+        client = PrefixTrackingChatCompletionClient(client, client_kwargs.get("model") or "")
+    limiter = rate_limiter_for(client_kwargs.get("base_url") or "")
+    if limiter is None:
+        return client
+    return RateLimitedChatCompletionClient(client, limiter, client_kwargs.get("max_tokens") or 0)
+
+
+class CircuitBreakerChatCompletionClient(ChatCompletionClientWrapper):
+    """
+    `ChatCompletionClient` failing fast while its endpoint's circuit is open.
+
+    When the circuit is open, or a request fails with an endpoint error, the request goes to
+    `fallback` if one is configured; otherwise `CircuitOpenError` (or the original error) is
+    raised immediately instead of waiting for HTTP timeouts.
+
+    Args:
+        inner (ChatCompletionClient): The client of the protected endpoint.
+        breaker (CircuitBreaker): Circuit breaker of that endpoint.
+        fallback (Optional[ChatCompletionClient]): Client of the model taking over during an outage.
+    """
+
+    def __init__(self, inner: ChatCompletionClient, breaker: CircuitBreaker,
+                 fallback: Optional[ChatCompletionClient] = None):
+        super().__init__(inner)
+        self.breaker = breaker
+        self.fallback = fallback
+        self.fallbacks = 0
+
+    def __fail_over__(self, error: Exception) -> bool:
+        if self.fallback is None or not (isinstance(error, CircuitOpenError) or is_endpoint_failure(error)):
+            return False
+        self.fallbacks += 1
+        trace_logger.warning(f"Falling back from {self.breaker.name}: {error}")
+        return True
+
+    async def create(
+            self,
+            messages: Sequence[LLMMessage],
+            *,
+            tools: Sequence[Union[Tool, ToolSchema]] = [],
+            json_output: Optional[Union[bool, type[BaseModel]]] = None,
+            extra_create_args: Mapping[str, Any] = {},
+            cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        try:
+            async with self.breaker.aguard():
+                return await super().create(
+                    messages,
+                    tools=tools,
+                    json_output=json_output,
+                    extra_create_args=extra_create_args,
+                    cancellation_token=cancellation_token,
+                )
+        except Exception as e:
+            if not self.__fail_over__(e):
+                raise
+        return await self.fallback.create(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        )
+
+    async def create_stream(
+            self,
+            messages: Sequence[LLMMessage],
+            *,
+            tools: Sequence[Union[Tool, ToolSchema]] = [],
+            json_output: Optional[Union[bool, type[BaseModel]]] = None,
+            extra_create_args: Mapping[str, Any] = {},
+            cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        streamed = False
+        try:
+            async with self.breaker.aguard():
+                async for item in super().create_stream(
+                        messages,
+                        tools=tools,
+                        json_output=json_output,
+                        extra_create_args=extra_create_args,
+                        cancellation_token=cancellation_token,
+                ):
+                    streamed = True
+                    yield item
+                return
+        except Exception as e:
+            # Chunks already yielded cannot be taken back, so only fail over before the first one
+            if streamed or not self.__fail_over__(e):
+                raise
+        async for item in self.fallback.create_stream(
+                messages,
+                tools=tools,
+                json_output=json_output,
+                extra_create_args=extra_create_args,
+                cancellation_token=cancellation_token,
+        ):
+            yield item
+
+    async def close(self) -> None:
+        await super().close()
+        if self.fallback is not None:
+            await self.fallback.close()
+
+    def actual_usage(self) -> RequestUsage:
+        if self.fallback is None:
+            return super().actual_usage()
+        return _sum_usage([super().actual_usage(), self.fallback.actual_usage()])
+
+    def total_usage(self) -> RequestUsage:
+        if self.fallback is None:
+            return super().total_usage()
+        return _sum_usage([super().total_usage(), self.fallback.total_usage()])
+
+
+def guarded_client(fallback: Optional[str] = CIRCUIT_BREAKER_FALLBACK, **client_kwargs) -> ChatCompletionClient:
+    """
+    Builds a rate-limited client behind its endpoint's circuit breaker.
+
+    Args:
+        fallback (Optional[str]): `MODEL_POOL_ENDPOINTS` name taking over while the circuit is
+            open; defaults to `CIRCUIT_BREAKER_FALLBACK`. Other client arguments are reused.
+        client_kwargs: Arguments of `OpenAIChatCompletionClient`.
+
+    Returns:
+        ChatCompletionClient: The protected client.
+    """
+    fallback_client = None
+    endpoint = MODEL_POOL_ENDPOINTS.get(fallback) if fallback else None
+    if endpoint and endpoint["base_url"] and endpoint["base_url"] != client_kwargs.get("base_url"):
+        fallback_client = rate_limited_client(**dict(client_kwargs, **endpoint))
+    return CircuitBreakerChatCompletionClient(
+        rate_limited_client(**client_kwargs),
+        circuit_breaker_for(client_kwargs.get("base_url") or ""),
+        fallback_client,
+    )
+
+
+class PooledChatCompletionClient(ChatCompletionClientWrapper):
+    """
+    `ChatCompletionClient` spreading requests across the replicas of a `ModelPool`.
+
+    One `OpenAIChatCompletionClient` is kept per replica, rate limited like `rate_limited_client`;
+    every `create` / `create_stream` call is routed to the replica picked by the pool, which
+    records its latency and health.
+
+    Args:
+        pool (ModelPool): The replicas to balance across.
+        client_kwargs: Arguments shared by every replica client (`model_info`, `temperature`, ...).
+    """
+
+    def __init__(self, pool: ModelPool, **client_kwargs):
+        self.pool = pool
+        self._client_kwargs = client_kwargs
+        self._clients: Dict[str, ChatCompletionClient] = {}
+        super().__init__(self._client(pool.replicas[0]))
+
+    def _client(self, replica: Replica) -> ChatCompletionClient:
+        if replica.name not in self._clients:
+            self._clients[replica.name] = rate_limited_client(
+                model=replica.model,
+                base_url=replica.base_url,
+                api_key=replica.api_key,
+                **self._client_kwargs
+            )
+        return self._clients[replica.name]
+
+    async def create(
+            self,
+            messages: Sequence[LLMMessage],
+            *,
+            tools: Sequence[Union[Tool, ToolSchema]] = [],
+            json_output: Optional[Union[bool, type[BaseModel]]] = None,
+            extra_create_args: Mapping[str, Any] = {},
+            cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        async with self.pool.aacquire() as replica:
+            return await self._client(replica).create(
+                messages,
+                tools=tools,
+                json_output=json_output,
+                extra_create_args=extra_create_args,
+                cancellation_token=cancellation_token,
+            )
+
+    async def create_stream(
+            self,
+            messages: Sequence[LLMMessage],
+            *,
+            tools: Sequence[Union[Tool, ToolSchema]] = [],
+            json_output: Optional[Union[bool, type[BaseModel]]] = None,
+            extra_create_args: Mapping[str, Any] = {},
+            cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        async with self.pool.aacquire() as replica:
+            async for item in self._client(replica).create_stream(
+                    messages,
+                    tools=tools,
+                    json_output=json_output,
+                    extra_create_args=extra_create_args,
+                    cancellation_token=cancellation_token,
+            ):
+                yield item
+
+    async def close(self) -> None:
+        for client in self._clients.values():
+            await client.close()
+
+    def actual_usage(self) -> RequestUsage:
+        return _sum_usage(client.actual_usage() for client in self._clients.values())
+
+    def total_usage(self) -> RequestUsage:
+        return _sum_usage(client.total_usage() for client in self._clients.values())
+
+
+def pooled_chat_completion_client(endpoints: Iterable[str], **client_kwargs) -> PooledChatCompletionClient:
+    """
+    Builds a load-balanced chat completion client over the named `MODEL_POOL_ENDPOINTS`.
+
+    Args:
+        endpoints (Iterable[str]): Endpoint names, e.g. `["QWEN"]`.
+        client_kwargs: Arguments shared by every replica client.
+
+    Returns:
+        PooledChatCompletionClient: The load-balanced client.
+    """
+    return PooledChatCompletionClient(ModelPool.from_endpoints(endpoints), **client_kwargs)
@@ -0,0 +1,115 @@
+import math
+import string
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+# Single-letter keys are one token in every tokenizer we serve
+LABEL_KEYS = string.ascii_uppercase
+TOP_LOGPROBS = 20
+
+
+@dataclass
+class Classification:
+    """
+    Result of a single-label classification call.
+
+    Attributes:
+        category (Optional[str]): The predicted label, or None if the model answered outside the label set.
+        confidence (Optional[float]): Calibrated probability of `category`; None when the backend
+            returned no logprobs.
+        scores (Dict[str, float]): Calibrated probability of every candidate label.
+        choice (Any): Value mapped from `category` through the attribute's `_dict`, if any.
+        completion_tokens (int): Tokens generated by the backend for this call.
+    """
+    category: Optional[str]
+    confidence: Optional[float]
+    scores: Dict[str, float] = field(default_factory=dict)
+    choice: Any = None
+    completion_tokens: int = 0
+
+
+def label_keys(labels: Sequence[str]) -> Dict[str, str]:
+    """
+    Maps one single-letter key to each label.
+    """
+    if len(labels) > len(LABEL_KEYS):
+        raise Exception(f"At most {len(LABEL_KEYS)} labels can be classified in one call, got {len(labels)}")
+    return {LABEL_KEYS[i]: label for i, label in enumerate(labels)}
+
+
+def build_classification_messages(prompt: str, keys: Dict[str, str], system_message: str,
+                                  descriptions: Optional[Dict[str, str]] = None) -> List[Dict]:
+    """
+    Builds a constrained prompt asking for the single-letter key of the best label.
+    """
+    options = "\n".join(
+        f"{key}. {label}" + (f": {descriptions[label]}" if descriptions and label in descriptions else "")
+        for key, label in keys.items()
+    )
+    instruction = (
+        f"{system_message}\n\n"
+        "Classify the user message into exactly one of the following categories:\n"
+        f"{options}\n\n"
+        "Answer with the letter of the category only."
+    )
+    return [
+        {"role": "system", "content": instruction},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def scores_from_logprobs(top_logprobs, keys: Dict[str, str], temperature: float = 1.0) -> Dict[str, float]:
+    """
+    Turns first-token logprobs into calibrated label probabilities.
+
+    Token variants of the same key (`A`, ` A`, `a`) are pooled, the result is temperature-scaled
+    and renormalised over the candidate labels. Labels absent from the top logprobs get 0.
+
+    Args:
+        top_logprobs: The `top_logprobs` entries of the first generated token.
+        keys (Dict[str, str]): Mapping of single-letter key to label.
+        temperature (float): Calibration temperature; values above 1 soften overconfident backends.
+
+    Returns:
+        Dict[str, float]: Probability per label.
+    """
+    logprobs: Dict[str, float] = {}
+    for entry in top_logprobs:
+        key = entry.token.strip().rstrip(".").upper()
+        if key in keys:
+            label = keys[key]
+            if label in logprobs:
+                logprobs[label] = math.log(math.exp(logprobs[label]) + math.exp(entry.logprob))
+            else:
+                logprobs[label] = entry.logprob
+
+    if not logprobs:
+        return {label: 0.0 for label in keys.values()}
+
+    scaled = {label: value / temperature for label, value in logprobs.items()}
+    peak = max(scaled.values())
+    weights = {label: math.exp(value - peak) for label, value in scaled.items()}
+    total = sum(weights.values())
+    return {label: weights.get(label, 0.0) / total for label in keys.values()}
+
+
+def classification_from_completion(completion, keys: Dict[str, str], temperature: float = 1.0) -> Classification:
+    """
+    Reads the predicted label and its confidence from a `max_tokens=1` chat completion.
+    """
+    choice = completion.choices[0]
+    completion_tokens = completion.usage.completion_tokens if completion.usage else 0
+
+    logprobs = choice.logprobs.content if choice.logprobs and choice.logprobs.content else None
+    if logprobs:
+        scores = scores_from_logprobs(logprobs[0].top_logprobs or [logprobs[0]], keys, temperature)
+        category, confidence = max(scores.items(), key=lambda item: item[1])
+        if confidence == 0.0:
+            return Classification(category=None, confidence=None, scores=scores,
+                                  completion_tokens=completion_tokens)
+        return Classification(category=category, confidence=confidence, scores=scores,
+                              completion_tokens=completion_tokens)
+
+    # Backend returned no logprobs; fall back to the generated letter without a confidence
+    key = (choice.message.content or "").strip().rstrip(".").upper()[:1]
+    return Classification(category=keys.get(key), confidence=None, completion_tokens=completion_tokens)
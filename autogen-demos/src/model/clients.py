@@ -0,0 +1,239 @@
+import asyncio
+import atexit
+import threading
+import weakref
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple, Union
+
+import httpx
+import instructor
+from instructor.client import AsyncInstructor, Instructor
+from openai import AsyncOpenAI, OpenAI
+
+from src.constants import HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS, HTTP_KEEPALIVE_EXPIRY, \
+    HTTP_TIMEOUT, HTTP_CONNECT_TIMEOUT, HTTP_MAX_RETRIES
+from src.logging import trace_logger
+from src.model.cassette import cassette_transport
+
+
+@dataclass
+class PooledClient:
+    """
+    A long-lived pair of clients handed out by the `ClientRegistry`.
+
+    Attributes:
+        openai_client (Union[OpenAI, AsyncOpenAI]): Raw OpenAI client backed by a shared keep-alive
+            connection pool.
+        client (Optional[Union[Instructor, AsyncInstructor]]): Instructor wrapper around `openai_client`,
+            only set for the `json_schema_with_response_format` mode.
+    """
+    openai_client: Union[OpenAI, AsyncOpenAI]
+    client: Optional[Union[Instructor, AsyncInstructor]] = None
+    _without_retries: Optional["PooledClient"] = field(default=None, init=False, repr=False, compare=False)
+
+    def without_retries(self) -> "PooledClient":
+        """
+        Returns these clients with the SDK retries turned off, for callers that retry on their own.
+
+        The copy shares the connection pool of `openai_client` and is built once per pooled client.
+        """
+        if self.openai_client.max_retries == 0:
+            return self
+        if self._without_retries is None:
+            openai_client = self.openai_client.with_options(max_retries=0)
+            client = instructor.from_openai(openai_client, mode=self.client.mode) if self.client is not None else None
+            self._without_retries = PooledClient(openai_client=openai_client, client=client)
+        return self._without_retries
+
+
+class ClientRegistry:
+    """
+    Process-wide registry of OpenAI clients keyed by (base_url, api_key, mode).
+
+    Every endpoint gets exactly one `httpx.Client`, so repeated `RouterLLM` constructions and
+    requests reuse warm keep-alive connections instead of opening a new pool and TLS session
+    each time. Instructor wrappers are cached per mode on top of the shared OpenAI client.
+
+    Attributes:
+        max_connections (int): Maximum number of concurrent connections per endpoint.
+        max_keepalive_connections (int): Maximum number of idle connections kept alive per endpoint.
+        keepalive_expiry (float): Seconds an idle connection is kept before being closed.
+        timeout (float): Default read/write timeout in seconds for every request.
+        connect_timeout (float): Timeout in seconds for establishing a new connection.
+        max_retries (int): Retries done by the OpenAI SDK itself on connection and server errors.
+
+    Async clients are pooled the same way but per running event loop, since an
+    `httpx.AsyncClient` connection pool cannot be shared between loops.
+
+    Methods:
+        get: Returns the pooled clients for an endpoint, creating them on first use.
+        get_async: Returns the pooled async clients for an endpoint on the running event loop.
+        configure: Updates the pool limits used for clients created afterwards.
+        close: Closes every pooled sync connection and empties the registry.
+        aclose: Closes the pooled async connections of the running event loop.
+    """
+
+    def __init__(self,
+                 max_connections: int = HTTP_MAX_CONNECTIONS,
+                 max_keepalive_connections: int = HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                 keepalive_expiry: float = HTTP_KEEPALIVE_EXPIRY,
+                 timeout: float = HTTP_TIMEOUT,
+                 connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+                 max_retries: int = HTTP_MAX_RETRIES):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+
+        self._lock = threading.Lock()
+        self._openai_clients: Dict[Tuple[str, str], OpenAI] = {}
+        self._clients: Dict[Tuple[str, str, str], PooledClient] = {}
+        self._async_clients: "weakref.WeakKeyDictionary[Any, Dict[Tuple[str, str, str], PooledClient]]" = \
+            weakref.WeakKeyDictionary()
+
+    def configure(self, **kwargs):
+        """
+        Updates the pool limits. Clients that already exist keep their limits until `close` is called.
+
+        Args:
+            kwargs: Any of `max_connections`, `max_keepalive_connections`, `keepalive_expiry`,
+                `timeout`, `connect_timeout` and `max_retries`.
+        """
+        for key, value in kwargs.items():
+            if key not in ('max_connections', 'max_keepalive_connections', 'keepalive_expiry', 'timeout',
+                           'connect_timeout', 'max_retries'):
+                raise Exception(f"Unknown pool setting `{key}` received at `{self.__class__.__name__}`")
+            setattr(self, key, value)
+
+    def _http_settings(self) -> Dict:
+        limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+        settings = dict(limits=limits, timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout))
+        transport = cassette_transport(limits)
+        if transport is not None:
+            # Recording or replaying through `CASSETTE_PATH`, see `CassetteTransport`
+            settings["transport"] = transport
+        return settings
+
+    def _http_client(self) -> httpx.Client:
+        return httpx.Client(**self._http_settings())
+
+    def _openai_client(self, base_url: str, api_key: str) -> OpenAI:
+        key = (base_url, api_key)
+        if key not in self._openai_clients:
+            self._openai_clients[key] = OpenAI(
+                base_url=base_url,
+                api_key=api_key,
+                max_retries=self.max_retries,
+                http_client=self._http_client()
+            )
+        return self._openai_clients[key]
+
+    def get(self, base_url: str, api_key: str, mode: str) -> PooledClient:
+        """
+        Returns the pooled clients for an endpoint, creating them on first use.
+
+        Args:
+            base_url (str): API base URL of the OpenAI-compatible endpoint.
+            api_key (str): API key for the endpoint.
+            mode (str): `RouterLLM` mode; an instructor wrapper is attached for
+                `json_schema_with_response_format`.
+
+        Returns:
+            PooledClient: The shared clients for the endpoint.
+        """
+        key = (base_url, api_key, mode)
+        pooled = self._clients.get(key)
+        if pooled is not None:
+            return pooled
+
+        with self._lock:
+            if key not in self._clients:
+                openai_client = self._openai_client(base_url, api_key)
+                if mode == 'json_schema_with_response_format':
+                    client = instructor.from_openai(openai_client, mode=instructor.Mode.TOOLS)
+                else:
+                    client = None
+                self._clients[key] = PooledClient(openai_client=openai_client, client=client)
+                trace_logger.debug(f"Created pooled client for {base_url} ({mode})")
+            return self._clients[key]
+
+    def get_async(self, base_url: str, api_key: str, mode: str) -> PooledClient:
+        """
+        Returns the pooled async clients for an endpoint on the running event loop.
+
+        Args:
+            base_url (str): API base URL of the OpenAI-compatible endpoint.
+            api_key (str): API key for the endpoint.
+            mode (str): `RouterLLM` mode; an async instructor wrapper is attached for
+                `json_schema_with_response_format`.
+
+        Returns:
+            PooledClient: The shared async clients for the endpoint.
+        """
+        loop = asyncio.get_running_loop()
+        key = (base_url, api_key, mode)
+
+        with self._lock:
+            loop_clients = self._async_clients.setdefault(loop, {})
+            if key not in loop_clients:
+                # Reuse the loop's connection pool across modes of the same endpoint
+                openai_client = next(
+                    (pooled.openai_client for (url, secret, _), pooled in loop_clients.items()
+                     if (url, secret) == (base_url, api_key)),
+                    None
+                )
+                if openai_client is None:
+                    openai_client = AsyncOpenAI(
+                        base_url=base_url,
+                        api_key=api_key,
+                        max_retries=self.max_retries,
+                        http_client=httpx.AsyncClient(**self._http_settings())
+                    )
+                if mode == 'json_schema_with_response_format':
+                    client = instructor.from_openai(openai_client, mode=instructor.Mode.TOOLS)
+                else:
+                    client = None
+                loop_clients[key] = PooledClient(openai_client=openai_client, client=client)
+                trace_logger.debug(f"Created pooled async client for {base_url} ({mode})")
+            return loop_clients[key]
+
+    async def aclose(self):
+        """
+        Closes the pooled async connections of the running event loop.
+        """
+        with self._lock:
+            loop_clients = self._async_clients.pop(asyncio.get_running_loop(), {})
+        for openai_client in {id(pooled.openai_client): pooled.openai_client
+                              for pooled in loop_clients.values()}.values():
+            try:
+                await openai_client.close()
+            except Exception as e:
+                trace_logger.error(f"Error closing pooled async client: {e}")
+
+    def close(self):
+        """
+        Closes every pooled sync connection and empties the registry.
+        """
+        with self._lock:
+            for openai_client in self._openai_clients.values():
+                try:
+                    openai_client.close()
+                except Exception as e:
+                    trace_logger.error(f"Error closing pooled client: {e}")
+            self._openai_clients.clear()
+            self._clients.clear()
+            self._async_clients.clear()
+
+    def __len__(self):
+        return len(self._clients)
+
+
+# Shared registry for the whole process
+client_registry = ClientRegistry()
+atexit.register(client_registry.close)
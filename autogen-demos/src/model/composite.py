@@ -0,0 +1,52 @@
+from typing import Dict, Tuple, Type
+
+from pydantic import BaseModel, create_model
+
+_composite_models: Dict[Tuple, Type[BaseModel]] = {}
+
+
+def build_composite_model(response_models: Dict[str, Type[BaseModel]],
+                          name: str = "CompositeRouting") -> Type[BaseModel]:
+    """
+    Merges several routing response models into one flat schema.
+
+    The fields of every model (e.g. `qualifier`, `complexity`, `policy`) become fields of the
+    combined model. Fields shared by several models, such as `user_message`, are merged when
+    they have the same type. Models are memoised so repeated calls reuse the same class and
+    JSON schema.
+
+    Args:
+        response_models (Dict[str, Type[BaseModel]]): Response model per routing attribute,
+            e.g. `{"qualifier": QualifierResponse, "complexity": ComplexityResponse}`.
+        name (str): Name of the combined model sent as the tool schema.
+
+    Returns:
+        Type[BaseModel]: The combined response model.
+    """
+    key = (name,) + tuple(response_models.items())
+    if key not in _composite_models:
+        fields = {}
+        for model in response_models.values():
+            for field_name, field_info in model.model_fields.items():
+                if field_name in fields and fields[field_name][0] != field_info.annotation:
+                    raise Exception(f"Field `{field_name}` has conflicting types across the composite response models")
+                fields[field_name] = (field_info.annotation, field_info)
+
+        description = "Answer every routing attribute below for the same user message:\n" + "\n".join(
+            f"- {attribute}: {(model.__doc__ or model.__name__).strip()}" for attribute, model in response_models.items()
+        )
+        _composite_models[key] = create_model(name, __doc__=description, **fields)
+    return _composite_models[key]
+
+
+def split_composite(response: BaseModel, response_models: Dict[str, Type[BaseModel]]) -> Dict[str, BaseModel]:
+    """
+    Splits a combined response back into one object per routing attribute.
+    """
+    return {
+        attribute: model.model_validate({
+            field_name: getattr(response, field_name) for field_name in model.model_fields
+            if field_name in response.model_fields_set
+        })
+        for attribute, model in response_models.items()
+    }
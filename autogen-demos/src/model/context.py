@@ -0,0 +1,293 @@
+import hashlib
+import json
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional
+
+from src.constants import MODEL_TOKEN_LIMITS, CONTEXT_TOKENIZER_ENCODING, CONTEXT_SAFETY_MARGIN, \
+    CONTEXT_SUMMARY_MAX_TOKENS, SUMMARY_OPENAI_COMPATIBLE_API_BASE, SUMMARY_OPENAI_COMPATIBLE_API_KEY, \
+    SUMMARY_OPENAI_COMPATIBLE_API_MODEL_NAME
+from src.logging import trace_logger
+
+try:
+    import tiktoken
+except ImportError:
+    # Without tiktoken token counts are estimated from the text length
+    tiktoken = None
+
+# Chat template tokens wrapped around every message (role header, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+# Flat cost of an image part, whatever its resolution
+IMAGE_TOKENS = 765
+CHARS_PER_TOKEN = 4
+
+Summarizer = Callable[[List[Dict], int], str]
+
+
+@lru_cache(maxsize=None)
+def _encoding(name: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        # The BPE file is downloaded on first use, which fails on offline hosts
+        trace_logger.warning(f"tiktoken encoding `{name}` unavailable, estimating token counts: {e}")
+        return None
+
+
+@lru_cache(maxsize=8192)
+def count_text_tokens(text: str, encoding: str = CONTEXT_TOKENIZER_ENCODING) -> int:
+    """
+    Counts the tokens of a text; results are cached so chat history is only tokenized once.
+    """
+    tokenizer = _encoding(encoding)
+    if tokenizer is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(tokenizer.encode(text, disallowed_special=()))
+
+
+def truncate_text(text: str, max_tokens: int, encoding: str = CONTEXT_TOKENIZER_ENCODING) -> str:
+    """
+    Keeps the beginning of `text` up to `max_tokens` tokens.
+    """
+    tokenizer = _encoding(encoding)
+    if tokenizer is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    return tokenizer.decode(tokenizer.encode(text, disallowed_special=())[:max_tokens])
+
+
+def _field(message, name: str, default=None):
+    if isinstance(message, dict):
+        return message.get(name, default)
+    return getattr(message, name, default)
+
+
+def _as_dict(message) -> Dict:
+    if isinstance(message, dict):
+        return message
+    return message.model_dump(exclude_none=True)
+
+
+def message_tokens(message, encoding: str = CONTEXT_TOKENIZER_ENCODING) -> int:
+    """
+    Counts the tokens of one chat message: its content, tool calls and template overhead.
+
+    Messages may be dicts or `ChatCompletionMessage` objects; content may be a string, a list
+    of strings (tool results) or a list of text / image parts.
+    """
+    tokens = MESSAGE_OVERHEAD_TOKENS
+    content = _field(message, "content")
+    if isinstance(content, str):
+        tokens += count_text_tokens(content, encoding)
+    elif isinstance(content, list):
+        for part in content:
+            if isinstance(part, str):
+                tokens += count_text_tokens(part, encoding)
+            elif isinstance(part, dict) and part.get("type") == "text":
+                tokens += count_text_tokens(part.get("text", ""), encoding)
+            elif isinstance(part, dict):
+                tokens += IMAGE_TOKENS
+
+    for tool_call in _field(message, "tool_calls") or []:
+        function = _field(tool_call, "function")
+        tokens += count_text_tokens(_field(function, "name") or "", encoding)
+        tokens += count_text_tokens(_field(function, "arguments") or "", encoding)
+    return tokens
+
+
+def count_message_tokens(messages: List, encoding: str = CONTEXT_TOKENIZER_ENCODING) -> int:
+    """
+    Counts the tokens of a list of chat messages.
+    """
+    return sum(message_tokens(message, encoding) for message in messages)
+
+
+def group_turns(messages: List) -> List[List]:
+    """
+    Groups messages into turns: a user (or system) message with the assistant replies, tool calls
+    and `tool` results following it, so trimming never keeps a reply without its question.
+    """
+    turns = []
+    for message in messages:
+        if _field(message, "role") in ("user", "system") or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return turns
+
+
+class ContextWindow:
+    """
+    Fits chat messages into a model's prompt budget before they are sent.
+
+    The budget is `context_length - max_tokens`, less a safety margin for the gap between the
+    local tokenizer and the served model's. The leading `pinned` messages (system message and
+    user prompt in `RouterLLM`) and the latest turn are always kept; older turns are dropped
+    oldest first and, when a `summarizer` is set, replaced by a summary message. If the pinned
+    messages alone overflow, the longest of them is truncated.
+
+    Attributes:
+        context_length (int): Context length of the model.
+        max_tokens (int): Tokens reserved for the completion.
+        summarizer (Optional[Callable]): Called as `summarizer(dropped_messages, max_tokens)`
+            to condense dropped turns; without it they are discarded.
+        encoding (str): tiktoken encoding used for counting.
+        safety_margin (float): Share of the budget left unused.
+        summary_max_tokens (int): Token budget of the summary message.
+
+    Methods:
+        for_model: Builds the window of a model listed in `MODEL_TOKEN_LIMITS`.
+        count: Counts the tokens of a list of messages.
+        fit: Returns the messages trimmed to the budget.
+    """
+
+    def __init__(self,
+                 context_length: int,
+                 max_tokens: int,
+                 summarizer: Optional[Summarizer] = None,
+                 encoding: str = CONTEXT_TOKENIZER_ENCODING,
+                 safety_margin: float = CONTEXT_SAFETY_MARGIN,
+                 summary_max_tokens: int = CONTEXT_SUMMARY_MAX_TOKENS):
+        self.context_length = context_length
+        self.max_tokens = max_tokens
+        self.summarizer = summarizer
+        self.encoding = encoding
+        self.safety_margin = safety_margin
+        self.summary_max_tokens = summary_max_tokens
+        self._summaries: OrderedDict = OrderedDict()
+
+    @classmethod
+    def for_model(cls, model: str, max_tokens: Optional[int] = None, **kwargs) -> Optional["ContextWindow"]:
+        """
+        Returns the window of `model`, or None when its limits are unknown.
+
+        Args:
+            model (str): Served model name.
+            max_tokens (Optional[int]): Completion tokens requested; defaults to the model's `*_MAX_TOKEN`.
+        """
+        if model not in MODEL_TOKEN_LIMITS:
+            return None
+        context_length, model_max_tokens = MODEL_TOKEN_LIMITS[model]
+        return cls(context_length, max_tokens if max_tokens is not None else model_max_tokens, **kwargs)
+
+    @property
+    def budget(self) -> int:
+        return int((self.context_length - self.max_tokens) * (1 - self.safety_margin))
+
+    def count(self, messages: List) -> int:
+        return count_message_tokens(messages, self.encoding)
+
+    def __summary__(self, dropped: List) -> Optional[Dict]:
+        """
+        Returns the summary message of the dropped turns, memoised on their content.
+        """
+        key = hashlib.sha256(json.dumps(
+            [[_field(m, "role"), _field(m, "content")] for m in dropped], default=str
+        ).encode()).hexdigest()
+        if key not in self._summaries:
+            try:
+                self._summaries[key] = self.summarizer(dropped, self.summary_max_tokens)
+            except Exception as e:
+                trace_logger.error(f"Summarizing {len(dropped)} dropped messages failed: {e}")
+                return None
+            if len(self._summaries) > 128:
+                self._summaries.popitem(last=False)
+        summary = truncate_text(self._summaries[key], self.summary_max_tokens, self.encoding)
+        return {"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"}
+
+    def __truncate_pinned__(self, pinned: List, budget: int) -> List:
+        """
+        Shortens the longest string message among `pinned` until they fit `budget`.
+        """
+        pinned = list(pinned)
+        overflow = self.count(pinned) - budget
+        candidates = [i for i, m in enumerate(pinned) if isinstance(_field(m, "content"), str)]
+        if overflow > 0 and candidates:
+            index = max(candidates, key=lambda i: message_tokens(pinned[i], self.encoding))
+            content = _field(pinned[index], "content")
+            keep = max(0, count_text_tokens(content, self.encoding) - overflow)
+            pinned[index] = dict(_as_dict(pinned[index]), content=truncate_text(content, keep, self.encoding))
+            trace_logger.warning(f"Truncated a {_field(pinned[index], 'role')} message by {overflow} tokens "
+                                 f"to fit the context window")
+        return pinned
+
+    def fit(self, messages: List, pinned: int = 1, reserved: int = 0) -> List:
+        """
+        Trims `messages` to the prompt budget.
+
+        Args:
+            messages (List): Chat messages in request order.
+            pinned (int): Number of leading messages that are never dropped.
+            reserved (int): Prompt tokens taken outside the messages, e.g. tool or response-model schemas.
+
+        Returns:
+            List: The messages to send; `messages` itself is returned when it already fits.
+        """
+        budget = self.budget - reserved
+        if self.count(messages) <= budget:
+            return messages
+
+        head, turns = list(messages[:pinned]), group_turns(messages[pinned:])
+        latest = turns.pop() if turns else []
+        kept_tokens = self.count(head) + self.count(latest)
+        if self.summarizer is not None and turns:
+            kept_tokens += self.summary_max_tokens + MESSAGE_OVERHEAD_TOKENS
+
+        kept = []
+        for turn in reversed(turns):
+            tokens = self.count(turn)
+            if kept_tokens + tokens > budget:
+                break
+            kept.insert(0, turn)
+            kept_tokens += tokens
+
+        dropped = [message for turn in turns[:len(turns) - len(kept)] for message in turn]
+        summary = self.__summary__(dropped) if dropped and self.summarizer is not None else None
+        kept = [message for turn in kept for message in turn]
+        if dropped:
+            trace_logger.info(f"Context window: dropped {len(dropped)} of {len(messages)} messages"
+                              f"{' (summarized)' if summary else ''} to fit {budget} tokens")
+
+        if self.count(head) + self.count(latest) > budget:
+            return self.__truncate_pinned__(head + latest, budget)
+        return head + ([summary] if summary else []) + kept + latest
+
+
+def summary_llm_summarizer(base_url: str = SUMMARY_OPENAI_COMPATIBLE_API_BASE,
+                           api_key: str = SUMMARY_OPENAI_COMPATIBLE_API_KEY,
+                           model: str = SUMMARY_OPENAI_COMPATIBLE_API_MODEL_NAME) -> Optional[Summarizer]:
+    """
+    Returns a summarizer backed by the `SUMMARY_*` chat model, or None when it is not configured.
+    """
+    if not base_url or not model:
+        return None
+
+    from src.model.clients import client_registry
+
+    def summarize(messages: List, max_tokens: int) -> str:
+        transcript = "\n".join(
+            f"{_field(message, 'role')}: {_field(message, 'content')}" for message in messages
+            if _field(message, "content")
+        )
+        completion = client_registry.get(base_url, api_key, "summary").openai_client.chat.completions.create(
+            model=model,
+            max_tokens=max_tokens,
+            temperature=0,
+            messages=[
+                {"role": "system", "content": "Summarize the conversation below. Keep facts, figures, names and "
+                                              "decisions the assistant may need later. Be concise."},
+                {"role": "user", "content": transcript},
+            ],
+        )
+        return completion.choices[0].message.content or ""
+
+    return summarize
+
+
+@lru_cache(maxsize=64)
+def context_window_for(model: str, max_tokens: Optional[int] = None) -> Optional[ContextWindow]:
+    """
+    Returns the shared `ContextWindow` of a model, summarizing with the `SUMMARY_*` model when configured.
+    """
+    return ContextWindow.for_model(model, max_tokens, summarizer=summary_llm_summarizer())
@@ -0,0 +1,352 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.constants import EMBEDDING_API_MODEL_URL, EMBEDDING_API_MODEL_KEY, EMBEDDING_API_MODEL_NAME, \
+    EMBEDDING_MAX_LENGTH, SENTENCE_EMBEDDING_API_MODEL_URL, SENTENCE_EMBEDDING_API_MODEL_KEY, \
+    SENTENCE_EMBEDDING_API_MODEL_NAME, SENTENCE_EMBEDDING_MAX_LENGTH, EMBEDDING_STORE_PATH, EMBEDDING_MAX_BATCH, \
+    EMBEDDING_BATCH_WINDOW, EMBEDDING_MAX_CONCURRENCY
+from src.logging import trace_logger
+from src.model.clients import client_registry
+from src.model.context import truncate_text
+
+KEY_BYTES = 16
+KEYS_FILE = "keys.bin"
+VECTORS_FILE = "vectors.f16"
+META_FILE = "meta.json"
+
+_UNSAFE_PATTERN = re.compile(r"[^\w.-]+")
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32)
+
+
+def content_key(model: str, text: str) -> bytes:
+    """
+    Content hash of a text as embedded by `model`.
+    """
+    return hashlib.blake2b(f"{model}\0{text}".encode("utf-8"), digest_size=KEY_BYTES).digest()
+
+
+class EmbeddingStore:
+    """
+    Append-only store of float16 embeddings keyed by content hash, read through a memory map.
+
+    Vectors are appended to `vectors.f16`, a row-major float16 matrix, and their keys to
+    `keys.bin`, with the dimension in `meta.json`. A vector is written before its key, so a
+    crash mid-append leaves at most a tail of unreferenced vector bytes, trimmed on open.
+    Reads go through a memory map of the matrix, remapped only when rows were appended, so
+    a large store costs page cache rather than process memory. One process writes a store.
+
+    Attributes:
+        path (str): Directory of the store.
+        dim (Optional[int]): Embedding dimension, set by the first append.
+
+    Methods:
+        get: Returns the stored vectors of the keys found.
+        append: Stores the vectors of keys not stored yet.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.dim: Optional[int] = None
+        self._lock = threading.Lock()
+        self._rows: Dict[bytes, int] = {}
+        self._matrix: Optional[np.ndarray] = None
+        os.makedirs(path, exist_ok=True)
+
+        meta_path = os.path.join(path, META_FILE)
+        if not os.path.exists(meta_path):
+            return
+        with open(meta_path, encoding="utf-8") as file:
+            self.dim = json.load(file)["dim"]
+
+        keys_path, vectors_path = os.path.join(path, KEYS_FILE), os.path.join(path, VECTORS_FILE)
+        with open(keys_path, "a+b") as file:
+            file.seek(0)
+            raw = file.read()
+        vector_bytes = os.path.getsize(vectors_path) if os.path.exists(vectors_path) else 0
+        rows = min(len(raw) // KEY_BYTES, vector_bytes // (2 * self.dim))
+        if len(raw) > rows * KEY_BYTES or vector_bytes > rows * 2 * self.dim:
+            trace_logger.warning(f"Trimming the embedding store at {path} to its {rows} complete rows")
+            with open(keys_path, "r+b") as file:
+                file.truncate(rows * KEY_BYTES)
+            with open(vectors_path, "a+b") as file:
+                file.truncate(rows * 2 * self.dim)
+        self._rows = {raw[row * KEY_BYTES:(row + 1) * KEY_BYTES]: row for row in range(rows)}
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, key: bytes) -> bool:
+        return key in self._rows
+
+    def __matrix__(self) -> np.ndarray:
+        rows = len(self._rows)
+        if self._matrix is None or len(self._matrix) < rows:
+            self._matrix = np.memmap(os.path.join(self.path, VECTORS_FILE), dtype=np.float16, mode="r",
+                                     shape=(rows, self.dim))
+        return self._matrix
+
+    def get(self, keys: Sequence[bytes]) -> Dict[bytes, np.ndarray]:
+        """
+        Returns the float32 vectors of the stored `keys`; missing keys are left out.
+        """
+        with self._lock:
+            found = [(key, self._rows[key]) for key in keys if key in self._rows]
+            if not found:
+                return {}
+            vectors = self.__matrix__()[[row for _, row in found]].astype(np.float32)
+        return {key: vector for (key, _), vector in zip(found, vectors)}
+
+    def append(self, keys: Sequence[bytes], vectors: np.ndarray):
+        """
+        Stores the vectors of the `keys` not stored yet.
+        """
+        with self._lock:
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                with open(os.path.join(self.path, META_FILE), "w", encoding="utf-8") as file:
+                    json.dump({"dim": self.dim}, file)
+            elif vectors.shape[1] != self.dim:
+                raise Exception(f"Embeddings of dimension {vectors.shape[1]} do not fit the store at {self.path} "
+                                f"of dimension {self.dim}")
+
+            new = {}
+            for key, vector in zip(keys, vectors):
+                if key not in self._rows and key not in new:
+                    new[key] = vector
+            if not new:
+                return
+            with open(os.path.join(self.path, VECTORS_FILE), "ab") as file:
+                file.write(np.asarray(list(new.values()), dtype=np.float16).tobytes())
+            with open(os.path.join(self.path, KEYS_FILE), "ab") as file:
+                file.write(b"".join(new))
+            for key in new:
+                self._rows[key] = len(self._rows)
+
+
+@dataclass
+class EmbeddingStats:
+    """
+    Counters of an `EmbeddingClient`.
+
+    Attributes:
+        texts (int): Texts asked for.
+        duplicates (int): Texts repeated within a call, embedded once.
+        stored (int): Texts served from the embedding store.
+        collapsed (int): Texts already being embedded for another call.
+        embedded (int): Texts sent to the endpoint.
+        truncated (int): Texts cut to `max_length` tokens.
+        batches (int): Requests sent to the endpoint.
+        errors (int): Failed endpoint requests.
+        seconds (float): Total time spent in calls.
+    """
+    texts: int = 0
+    duplicates: int = 0
+    stored: int = 0
+    collapsed: int = 0
+    embedded: int = 0
+    truncated: int = 0
+    batches: int = 0
+    errors: int = 0
+    seconds: float = 0.0
+
+    @property
+    def mean_batch(self) -> float:
+        return self.embedded / self.batches if self.batches else 0.0
+
+    def to_dict(self) -> Dict:
+        return {**asdict(self), "mean_batch": self.mean_batch}
+
+
+class EmbeddingClient:
+    """
+    Micro-batching client of an OpenAI-compatible embedding endpoint, backed by an `EmbeddingStore`.
+
+    Texts are cut to `max_length` tokens and hashed with the model name. Those already in the
+    store are read from it, and identical texts, within a call or already in flight for another
+    caller, are embedded once. The rest are queued: a dispatcher gathers queued texts from all
+    callers for up to `window` seconds or until `max_batch` are waiting, and sends each batch
+    from a pool of `max_concurrency` workers. Embeddings are L2-normalised and appended to the
+    store, so re-embedding an unchanged corpus sends no request. Returned vectors are the
+    stored float16 values, so a text embeds to the same vector whether it was cached or not.
+
+    Instances are callable like the other embedders and meant to be shared, see `document_embedder`
+    and `sentence_embedder`: callers only batch together through the same client.
+
+    Attributes:
+        model (str): Embedding model name, part of the content hash.
+        max_length (int): Maximum tokens of an embedded text, see `EMBEDDING_MAX_LENGTH`.
+        max_batch (int): Maximum texts per request, see `EMBEDDING_MAX_BATCH`.
+        window (float): Seconds a batch waits for more texts, see `EMBEDDING_BATCH_WINDOW`.
+        store (Optional[EmbeddingStore]): Persistent embeddings, disabled when `store_path` is None.
+        stats (EmbeddingStats): Batching, deduplication and store counters.
+
+    Methods:
+        embed: Returns one normalised embedding per text.
+        aembed: Async counterpart of `embed`.
+    """
+
+    def __init__(self,
+                 base_url: str = EMBEDDING_API_MODEL_URL,
+                 api_key: str = EMBEDDING_API_MODEL_KEY,
+                 model: str = EMBEDDING_API_MODEL_NAME,
+                 max_length: int = EMBEDDING_MAX_LENGTH,
+                 store_path: Optional[str] = EMBEDDING_STORE_PATH,
+                 max_batch: int = EMBEDDING_MAX_BATCH,
+                 window: float = EMBEDDING_BATCH_WINDOW,
+                 max_concurrency: int = EMBEDDING_MAX_CONCURRENCY):
+        self.model = model
+        self.max_length = max_length
+        self.max_batch = max_batch
+        self.window = window
+        self.store = EmbeddingStore(os.path.join(store_path, _UNSAFE_PATTERN.sub("_", model))) if store_path else None
+        self.stats = EmbeddingStats()
+        self.openai_client = client_registry.get(base_url, api_key or "EMPTY", "embedding").openai_client
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="embedding")
+        self._queue: "queue.Queue[Tuple[bytes, str]]" = queue.Queue()
+        self._pending: Dict[bytes, Future] = {}
+        self._lock = threading.Lock()
+        self._dispatcher: Optional[threading.Thread] = None
+
+    def __truncate__(self, text: str) -> str:
+        # A token spans at least one character, so shorter texts need no tokenization
+        if len(text) <= self.max_length:
+            return text
+        truncated = truncate_text(text, self.max_length)
+        if len(truncated) < len(text):
+            with self._lock:
+                self.stats.truncated += 1
+        return truncated
+
+    def __dispatch__(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            with self._lock:
+                self.stats.batches += 1
+            self._executor.submit(self.__send__, batch)
+
+    def __post__(self, texts: List[str]) -> np.ndarray:
+        # Raw base64 float32 payloads: building SDK models float by float costs more than the request itself
+        response = self.openai_client.post(
+            "/embeddings",
+            body={"model": self.model, "input": texts, "encoding_format": "base64"},
+            cast_to=object,
+        )
+        data = sorted(response["data"], key=lambda item: item["index"])
+        if len(data) != len(texts):
+            raise Exception(f"Expected {len(texts)} embeddings, got {len(data)}")
+        # Servers ignoring `encoding_format` answer with lists of floats
+        return np.array([np.frombuffer(base64.b64decode(item["embedding"]), dtype=np.float32)
+                         if isinstance(item["embedding"], str) else item["embedding"] for item in data],
+                        dtype=np.float32)
+
+    def __send__(self, batch: List[Tuple[bytes, str]]):
+        keys = [key for key, _ in batch]
+        try:
+            vectors = _normalize(self.__post__([text for _, text in batch]))
+            if self.store is not None:
+                self.store.append(keys, vectors)
+            vectors = vectors.astype(np.float16).astype(np.float32)
+        except Exception as e:
+            with self._lock:
+                self.stats.errors += 1
+                futures = [self._pending.pop(key) for key in keys]
+            trace_logger.error(f"Embedding request of {len(batch)} texts failed: {e}")
+            for future in futures:
+                future.set_exception(e)
+            return
+        with self._lock:
+            futures = [self._pending.pop(key) for key in keys]
+        for future, vector in zip(futures, vectors):
+            future.set_result(vector)
+
+    def __submit__(self, missing: Dict[bytes, str]) -> Dict[bytes, Future]:
+        futures = {}
+        with self._lock:
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self.__dispatch__, name="embedding-dispatcher", daemon=True)
+                self._dispatcher.start()
+            for key, text in missing.items():
+                future = self._pending.get(key)
+                if future is None:
+                    future = self._pending[key] = Future()
+                    self._queue.put((key, text))
+                    self.stats.embedded += 1
+                else:
+                    self.stats.collapsed += 1
+                futures[key] = future
+        return futures
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        Returns one L2-normalised embedding per text, as rows of a float32 matrix.
+        """
+        start = time.perf_counter()
+        texts = [self.__truncate__(text) for text in texts]
+        keys = [content_key(self.model, text) for text in texts]
+        unique = dict(zip(keys, texts))
+        known = self.store.get(list(unique)) if self.store is not None else {}
+        missing = {key: text for key, text in unique.items() if key not in known}
+        with self._lock:
+            self.stats.texts += len(texts)
+            self.stats.duplicates += len(keys) - len(unique)
+            self.stats.stored += len(known)
+
+        if missing:
+            for key, future in self.__submit__(missing).items():
+                known[key] = future.result()
+        with self._lock:
+            self.stats.seconds += time.perf_counter() - start
+        if not keys:
+            dim = self.store.dim if self.store is not None and self.store.dim else 0
+            return np.zeros((0, dim), dtype=np.float32)
+        return np.stack([known[key] for key in keys])
+
+    async def aembed(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        Async counterpart of `embed`.
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, self.embed, texts)
+
+    def __call__(self, texts: Sequence[str]) -> np.ndarray:
+        return self.embed(texts)
+
+
+@lru_cache(maxsize=None)
+def document_embedder() -> EmbeddingClient:
+    """
+    Returns the shared client of the `EMBEDDING_API_MODEL_*` endpoint, used for chunks and retrieval queries.
+    """
+    return EmbeddingClient()
+
+
+@lru_cache(maxsize=None)
+def sentence_embedder() -> EmbeddingClient:
+    """
+    Returns the shared client of the `SENTENCE_EMBEDDING_API_MODEL_*` endpoint, used for short texts such as prompts.
+    """
+    return EmbeddingClient(base_url=SENTENCE_EMBEDDING_API_MODEL_URL, api_key=SENTENCE_EMBEDDING_API_MODEL_KEY,
+                           model=SENTENCE_EMBEDDING_API_MODEL_NAME, max_length=SENTENCE_EMBEDDING_MAX_LENGTH)
@@ -0,0 +1,47 @@
+from typing import Any, Dict, Optional
+
+from langchain_core.outputs import Generation
+from pydantic import BaseModel, computed_field
+
+# Key of the validated response in `generation_info`
+PARSED_KEY = "parsed"
+
+
+class ParsedGeneration(Generation):
+    """
+    Generation carrying the validated pydantic response instead of its JSON dump.
+
+    The response is kept in `generation_info["parsed"]`, so consumers use it as is rather than
+    parsing `.text` back. `.text` is the compact JSON of the response, produced only when it is
+    first read (e.g. by `invoke`, callbacks or serialization) and then kept.
+    """
+
+    def __init__(self, parsed: BaseModel, generation_info: Optional[Dict[str, Any]] = None, **kwargs: Any):
+        super().__init__(generation_info=dict(generation_info or {}, **{PARSED_KEY: parsed}), **kwargs)
+        self._text = None
+
+    @computed_field  # type: ignore[prop-decorator]
+    @property
+    def text(self) -> str:
+        """Compact JSON of the parsed response, serialized on first access."""
+        if self._text is None:
+            self._text = self.parsed.model_dump_json()
+        return self._text
+
+    @property
+    def parsed(self) -> BaseModel:
+        return self.generation_info[PARSED_KEY]
+
+
+def parsed_response(generation: Generation, response_model=None) -> Any:
+    """
+    Returns the pydantic response of a generation, parsing `.text` only for generations without one.
+
+    Args:
+        generation (Generation): A generation returned by `RouterLLM`.
+        response_model: Schema used to parse `.text` when the generation carries no parsed response.
+    """
+    parsed = (generation.generation_info or {}).get(PARSED_KEY)
+    if parsed is not None or response_model is None:
+        return parsed
+    return response_model.model_validate_json(generation.text)
@@ -0,0 +1,253 @@
+import asyncio
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+from pydantic import BaseModel, Field
+
+from src.constants import GRAMMAR_CHUNK_TOKENS, GRAMMAR_MAX_CONCURRENCY
+from src.logging import trace_logger
+from src.model.cascade import Cascade
+from src.model.context import count_text_tokens
+from src.model.prompt import canonical
+
+GRAMMAR_INSTRUCTIONS = canonical("""
+    Analyze the following text for grammar errors, correct them, and provide
+    explanations for each correction. Keep the wording, formatting and line breaks
+    of the text unless they are wrong.
+
+    Return the response as a JSON object with the following structure:
+    {
+      "corrected_text": "The corrected text.",
+      "explanations": [
+        "Explanation of the first error.",
+        "Explanation of the second error.",
+        ...
+      ],
+      "errors": [
+          "Description of the first error",
+          "Description of the second error",
+          ...
+      ]
+    }
+""")
+
+# A sentence ends at terminal punctuation (Latin or Arabic) followed by whitespace, or at a blank line
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?؟۔])\s+|\n\s*\n\s*")
+
+
+class GrammarCheck(BaseModel):
+    """
+    A JSON object containing corrected text, explanations, and error descriptions.
+    """
+    corrected_text: str = Field(
+        ...,
+        description="The corrected text."
+    )
+    explanations: List[str] = Field(
+        ...,
+        description="An array of explanations for each correction."
+    )
+    errors: List[str] = Field(
+        ...,
+        description="An array of descriptions of each error."
+    )
+
+
+@dataclass
+class TextChunk:
+    """
+    Sentence-aligned part of a text.
+
+    Attributes:
+        start (int): Offset of the first character in the original text.
+        end (int): Offset after the last character; whitespace up to the next chunk is not part of it.
+        text (str): The chunk's text, `original[start:end]`.
+    """
+    start: int
+    end: int
+    text: str
+
+
+def sentence_spans(text: str) -> List[tuple]:
+    """
+    Returns the `(start, end)` offsets of the sentences of `text`, without the whitespace between them.
+    """
+    spans, start = [], len(text) - len(text.lstrip())
+    for boundary in SENTENCE_BOUNDARY.finditer(text):
+        if boundary.start() > start:
+            spans.append((start, boundary.start()))
+        start = max(start, boundary.end())
+    stripped_end = len(text.rstrip())
+    if stripped_end > start:
+        spans.append((start, stripped_end))
+    return spans
+
+
+def chunk_text(text: str, max_tokens: int = GRAMMAR_CHUNK_TOKENS) -> List[TextChunk]:
+    """
+    Groups consecutive sentences of `text` into chunks of at most `max_tokens` tokens.
+
+    A sentence longer than `max_tokens` becomes a chunk of its own rather than being cut mid-sentence.
+    """
+    chunks: List[TextChunk] = []
+    start = end = None
+    tokens = 0
+    for sentence_start, sentence_end in sentence_spans(text):
+        sentence_tokens = count_text_tokens(text[sentence_start:sentence_end])
+        if start is not None and tokens + sentence_tokens > max_tokens:
+            chunks.append(TextChunk(start, end, text[start:end]))
+            start = None
+        if start is None:
+            start, tokens = sentence_start, 0
+        end = sentence_end
+        tokens += sentence_tokens
+    if start is not None:
+        chunks.append(TextChunk(start, end, text[start:end]))
+    return chunks
+
+
+class GrammarEngine:
+    """
+    Grammar checker splitting long texts into sentence-aligned chunks checked concurrently.
+
+    Every chunk is sent through one long-lived `Cascade` with a fixed instruction prefix, at
+    most `max_concurrency` at a time; identical chunks, within a text or across a batch, are
+    checked once. The corrected chunks are stitched back together with the original
+    whitespace between them, and every correction is reported with its offsets in both the
+    original and the corrected text. A chunk whose check fails keeps its original text.
+
+    Attributes:
+        cascade (Cascade): Models checking the chunks, cheapest first.
+        chunk_tokens (int): Maximum tokens of a chunk, see `GRAMMAR_CHUNK_TOKENS`.
+        max_concurrency (int): Maximum chunks checked at once, see `GRAMMAR_MAX_CONCURRENCY`.
+
+    Methods:
+        check: Checks one text.
+        check_many: Checks several texts at once.
+        acheck: Async counterpart of `check`.
+        acheck_many: Async counterpart of `check_many`.
+    """
+
+    def __init__(self, cascade: Cascade, chunk_tokens: int = GRAMMAR_CHUNK_TOKENS,
+                 max_concurrency: int = GRAMMAR_MAX_CONCURRENCY):
+        self.cascade = cascade
+        self.chunk_tokens = chunk_tokens
+        self.max_concurrency = max_concurrency
+
+    def __prompt__(self, chunk: str) -> str:
+        # Instructions first so every chunk shares the cached prefix; the text is sent verbatim
+        return f"{GRAMMAR_INSTRUCTIONS}\n\nText: {chunk}"
+
+    def __check_chunk__(self, chunk: str) -> Optional[GrammarCheck]:
+        try:
+            response = self.cascade.run(self.__prompt__(chunk), response_model=GrammarCheck)
+        except Exception as e:
+            trace_logger.error(f"Grammar check of a chunk failed: {e}")
+            return None
+        return response if isinstance(response, GrammarCheck) else None
+
+    async def __acheck_chunk__(self, chunk: str) -> Optional[GrammarCheck]:
+        try:
+            response = await self.cascade.arun(self.__prompt__(chunk), response_model=GrammarCheck)
+        except Exception as e:
+            trace_logger.error(f"Grammar check of a chunk failed: {e}")
+            return None
+        return response if isinstance(response, GrammarCheck) else None
+
+    def __merge__(self, text: str, chunks: List[TextChunk], results: Dict[str, Optional[GrammarCheck]]) -> Dict:
+        if not chunks:
+            return {"corrected_text": text, "explanations": [], "errors": [], "corrections": []}
+        if all(results[chunk.text] is None for chunk in chunks):
+            return {
+                "corrected_text": None,
+                "explanations": ["Error communicating with grammar models: no chunk could be checked"],
+                "errors": [],
+                "corrections": [],
+            }
+
+        parts = [text[:chunks[0].start]]
+        length = len(parts[0])
+        explanations, errors, corrections = [], [], []
+        for index, chunk in enumerate(chunks):
+            result = results[chunk.text]
+            corrected = chunk.text if result is None else result.corrected_text.strip() or chunk.text
+            if result is None:
+                explanations.append(f"Text at offsets {chunk.start}-{chunk.end} could not be checked.")
+            else:
+                explanations.extend(result.explanations)
+                errors.extend(result.errors)
+            if corrected != chunk.text:
+                corrections.append({
+                    "start": chunk.start,
+                    "end": chunk.end,
+                    "corrected_start": length,
+                    "corrected_end": length + len(corrected),
+                    "original": chunk.text,
+                    "corrected": corrected,
+                })
+            following = chunks[index + 1].start if index + 1 < len(chunks) else len(text)
+            separator = text[chunk.end:following]
+            parts += [corrected, separator]
+            length += len(corrected) + len(separator)
+
+        return {
+            "corrected_text": "".join(parts),
+            "explanations": explanations,
+            "errors": errors,
+            "corrections": corrections,
+        }
+
+    def __chunks__(self, texts: Sequence[str]) -> List[List[TextChunk]]:
+        return [chunk_text(text, self.chunk_tokens) for text in texts]
+
+    def check_many(self, texts: Sequence[str]) -> List[Dict]:
+        """
+        Checks the grammar of several texts, sharing one pool of concurrent chunk checks.
+
+        Args:
+            texts (Sequence[str]): The texts to check.
+
+        Returns:
+            List[Dict]: Per text, `corrected_text`, `explanations`, `errors` and `corrections`, the
+            changed chunks with their `start`/`end` offsets in the text and `corrected_start`/
+            `corrected_end` offsets in the corrected text. `corrected_text` is None when no chunk
+            of the text could be checked.
+        """
+        chunked = self.__chunks__(texts)
+        unique = list(dict.fromkeys(chunk.text for chunks in chunked for chunk in chunks))
+        results: Dict[str, Optional[GrammarCheck]] = {}
+        if unique:
+            with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(unique))) as executor:
+                results = dict(zip(unique, executor.map(self.__check_chunk__, unique)))
+        trace_logger.info(f"Checked grammar of {len(texts)} texts in {len(unique)} chunks")
+        return [self.__merge__(text, chunks, results) for text, chunks in zip(texts, chunked)]
+
+    def check(self, text: str) -> Dict:
+        """
+        Checks the grammar of one text, see `check_many`.
+        """
+        return self.check_many([text])[0]
+
+    async def acheck_many(self, texts: Sequence[str]) -> List[Dict]:
+        """
+        Async counterpart of `check_many`.
+        """
+        chunked = self.__chunks__(texts)
+        unique = list(dict.fromkeys(chunk.text for chunks in chunked for chunk in chunks))
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def check_one(chunk: str) -> Optional[GrammarCheck]:
+            async with semaphore:
+                return await self.__acheck_chunk__(chunk)
+
+        results = dict(zip(unique, await asyncio.gather(*[check_one(chunk) for chunk in unique])))
+        trace_logger.info(f"Checked grammar of {len(texts)} texts in {len(unique)} chunks")
+        return [self.__merge__(text, chunks, results) for text, chunks in zip(texts, chunked)]
+
+    async def acheck(self, text: str) -> Dict:
+        """
+        Async counterpart of `check`.
+        """
+        return (await self.acheck_many([text]))[0]
@@ -0,0 +1,309 @@
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+import time
+from array import array
+from collections import Counter
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+from src.constants import BM25_K1, BM25_B
+from src.logging import trace_logger
+
+# Numbers keep their separators so references like "33/2021" or "12.3" stay one term
+_TOKEN_PATTERN = re.compile(r"\d+(?:[./-]\d+)*|\w+", re.UNICODE)
+_ARABIC_DIACRITICS = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")
+_ARABIC_LETTERS = str.maketrans({"أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا", "ة": "ه", "ى": "ي", "ؤ": "و", "ئ": "ي"})
+_ARABIC_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹", "01234567890123456789")
+# Definite article and attached prepositions/conjunctions, longest first
+_ARABIC_PREFIXES = ("وبال", "وكال", "فبال", "وال", "بال", "كال", "فال", "لل", "ال")
+_ARABIC_RANGE = re.compile("[\u0600-\u06ff]")
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this to was were will with which
+في من على الى عن او ان ما هذا هذه التي الذي التى ذلك تلك مع كل كان قد لا
+""".split())
+
+
+def _arabic_stem(token: str) -> str:
+    for prefix in _ARABIC_PREFIXES:
+        if token.startswith(prefix) and len(token) - len(prefix) >= 2:
+            return token[len(prefix):]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits English and Arabic text into BM25 terms.
+
+    Text is lower-cased; Arabic diacritics and tatweel are removed, letter variants (alef forms,
+    ta marbuta, alef maqsura) unified, Arabic-Indic digits mapped to ASCII and the definite
+    article with attached particles stripped. Stopwords are dropped; numbers are kept whole.
+    """
+    text = text.lower().translate(_ARABIC_DIGITS)
+    if _ARABIC_RANGE.search(text):
+        text = _ARABIC_DIACRITICS.sub("", text).translate(_ARABIC_LETTERS)
+    terms = []
+    for token in _TOKEN_PATTERN.findall(text):
+        if _ARABIC_RANGE.match(token):
+            token = _arabic_stem(token)
+        if token not in STOPWORDS:
+            terms.append(token)
+    return terms
+
+
+def term_hash(term: str) -> int:
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def varint_sizes(values: np.ndarray) -> np.ndarray:
+    """
+    Returns the encoded size in bytes of every value, see `encode_varints`.
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    sizes = np.ones(len(values), dtype=np.int64)
+    for shift in range(7, 64, 7):
+        sizes += values >= (np.uint64(1) << np.uint64(shift))
+    return sizes
+
+
+def encode_varints(values: np.ndarray) -> np.ndarray:
+    """
+    Encodes non-negative integers as LEB128 varints: 7 bits per byte, high bit set on all but the last byte.
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    sizes = varint_sizes(values)
+    starts = np.cumsum(sizes) - sizes
+    encoded = np.empty(int(sizes.sum()), dtype=np.uint8)
+    for position in range(int(sizes.max()) if len(values) else 0):
+        selected = sizes > position
+        chunk = (values[selected] >> np.uint64(7 * position)) & np.uint64(0x7f)
+        more = (sizes[selected] - 1 > position).astype(np.uint64) << np.uint64(7)
+        encoded[starts[selected] + position] = (chunk | more).astype(np.uint8)
+    return encoded
+
+
+def decode_varints(encoded: np.ndarray) -> np.ndarray:
+    """
+    Decodes LEB128 varints written by `encode_varints`, vectorized.
+    """
+    encoded = np.asarray(encoded, dtype=np.uint8)
+    ends = np.flatnonzero(encoded < 0x80)
+    if len(ends) == len(encoded):
+        # Every value fits in one byte, the common case for the postings of frequent terms
+        return encoded.astype(np.uint64)
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    sizes = ends - starts + 1
+    values = (encoded[starts] & 0x7f).astype(np.uint64)
+    for position in range(1, int(sizes.max())):
+        selected = np.flatnonzero(sizes > position)
+        values[selected] |= (encoded[starts[selected] + position] & 0x7f).astype(np.uint64) << np.uint64(7 * position)
+    return values
+
+
+@dataclass
+class LexicalHit:
+    """
+    One BM25 result.
+
+    Attributes:
+        id (int): Document id, the chunk's position in the indexed corpus.
+        score (float): BM25 score.
+    """
+    id: int
+    score: float
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index with compressed, memory-mapped postings.
+
+    Terms are looked up by a 64-bit hash in a sorted array, so no vocabulary is held in memory.
+    Each term's postings are its document ids, delta-encoded as varints, and its term
+    frequencies as one byte each (capped at 255); both files are memory-mapped, so only the
+    postings of the query terms are read. Document ids are the chunks' positions in the corpus,
+    the same ids `VectorIndex` reports, so the two can be fused.
+
+    Attributes:
+        path (str): Directory of the index files.
+        documents (int): Number of documents.
+        k1 (float): BM25 term-frequency saturation, see `BM25_K1`.
+        b (float): BM25 length normalization, see `BM25_B`.
+
+    Methods:
+        build: Builds an index from texts and saves it.
+        load: Opens a saved index.
+        search: Returns the `top_k` best BM25 matches of a query.
+    """
+
+    def __init__(self, path: str, k1: float = BM25_K1, b: float = BM25_B):
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as file:
+            meta = json.load(file)
+        self.path = path
+        self.documents: int = meta["documents"]
+        self.average_length: float = meta["average_length"]
+        self.k1 = k1
+        self.b = b
+
+        def load(name: str) -> np.ndarray:
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+
+        self.term_hashes = load("term_hashes")
+        self.posting_offsets = load("posting_offsets")
+        self.byte_offsets = load("byte_offsets")
+        self.document_lengths = load("document_lengths")
+        # Length normalization of every document, 4 bytes each, computed once instead of per posting
+        self.length_norms = (self.k1 * (1 - self.b + self.b * np.asarray(self.document_lengths, dtype=np.float32)
+                                        / max(self.average_length, 1e-9))).astype(np.float32)
+        self.postings = np.memmap(os.path.join(path, "postings.bin"), dtype=np.uint8, mode="r") \
+            if self.byte_offsets[-1] else np.zeros(0, dtype=np.uint8)
+        self.frequencies = np.memmap(os.path.join(path, "frequencies.bin"), dtype=np.uint8, mode="r") \
+            if self.posting_offsets[-1] else np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return self.documents
+
+    @classmethod
+    def load(cls, path: str) -> "LexicalIndex":
+        return cls(path)
+
+    @classmethod
+    def build(cls, path: str, texts: Iterable[str]) -> "LexicalIndex":
+        """
+        Tokenizes `texts`, the document with id `i` being the `i`-th text, and saves the index to `path`.
+        """
+        start = time.perf_counter()
+        # Typed buffers keep one posting at 9 bytes while collecting millions of them
+        term_ids, document_ids, frequencies, lengths = array("i"), array("i"), array("B"), array("I")
+        vocabulary = {}
+        for document, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths.append(sum(counts.values()))
+            for term, count in counts.items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                document_ids.append(document)
+                frequencies.append(min(count, 255))
+
+        hashes = np.array([term_hash(term) for term in vocabulary], dtype=np.uint64)
+        if len(np.unique(hashes)) != len(hashes):
+            raise Exception("Term hash collision while building the lexical index")
+        # Terms are stored in hash order, so lookups are a binary search
+        rank = np.empty(len(hashes), dtype=np.int64)
+        rank[np.argsort(hashes)] = np.arange(len(hashes))
+        term_ranks = rank[np.frombuffer(term_ids, dtype=np.int32)] if term_ids else np.zeros(0, dtype=np.int64)
+        del term_ids
+        posting_offsets = np.concatenate([[0], np.cumsum(np.bincount(term_ranks, minlength=len(hashes)))])
+        # Documents were added in id order, so a stable sort by term keeps every term's ids sorted
+        order = np.argsort(term_ranks, kind="stable")
+        del term_ranks
+        document_ids = np.frombuffer(document_ids, dtype=np.int32)[order].astype(np.int64) if document_ids \
+            else np.zeros(0, dtype=np.int64)
+        frequencies = np.frombuffer(frequencies, dtype=np.uint8)[order] if frequencies else np.zeros(0, np.uint8)
+        del order
+        # Delta-encode the sorted ids of every term, the first one absolute
+        firsts = posting_offsets[:-1][np.diff(posting_offsets) > 0]
+        deltas = np.diff(document_ids, prepend=0)
+        deltas[firsts] = document_ids[firsts]
+        byte_offsets = np.concatenate([[0], np.cumsum(varint_sizes(deltas))])[posting_offsets]
+
+        temporary = f"{path}.building"
+        shutil.rmtree(temporary, ignore_errors=True)
+        os.makedirs(temporary)
+        arrays = {
+            "term_hashes": np.sort(hashes),
+            "posting_offsets": posting_offsets.astype(np.int64),
+            "byte_offsets": byte_offsets.astype(np.int64),
+            "document_lengths": np.frombuffer(lengths, dtype=np.uint32) if lengths else np.zeros(0, np.uint32),
+        }
+        for name, values in arrays.items():
+            np.save(os.path.join(temporary, f"{name}.npy"), values)
+        with open(os.path.join(temporary, "postings.bin"), "wb") as file:
+            file.write(encode_varints(deltas).tobytes())
+        with open(os.path.join(temporary, "frequencies.bin"), "wb") as file:
+            file.write(frequencies.tobytes())
+        with open(os.path.join(temporary, "meta.json"), "w", encoding="utf-8") as file:
+            json.dump({
+                "documents": len(lengths),
+                "average_length": sum(lengths) / len(lengths) if lengths else 0.0,
+                "terms": len(hashes),
+                "postings": int(posting_offsets[-1]),
+            }, file)
+
+        previous = f"{path}.previous"
+        shutil.rmtree(previous, ignore_errors=True)
+        if os.path.exists(path):
+            os.replace(path, previous)
+        os.replace(temporary, path)
+        shutil.rmtree(previous, ignore_errors=True)
+        trace_logger.info(f"Built lexical index of {len(lengths)} documents and {len(hashes)} terms at {path} "
+                          f"in {time.perf_counter() - start:.1f}s")
+        return cls(path)
+
+    def __position__(self, term: str) -> Optional[int]:
+        hashed = np.uint64(term_hash(term))
+        position = int(np.searchsorted(self.term_hashes, hashed))
+        if position >= len(self.term_hashes) or self.term_hashes[position] != hashed:
+            return None
+        return position
+
+    def postings_of(self, term: str):
+        """
+        Returns the document ids and term frequencies of `term`, or None when it does not occur.
+        """
+        position = self.__position__(term)
+        if position is None:
+            return None
+        start, end = int(self.byte_offsets[position]), int(self.byte_offsets[position + 1])
+        documents = np.cumsum(decode_varints(self.postings[start:end]).astype(np.int64))
+        first, last = int(self.posting_offsets[position]), int(self.posting_offsets[position + 1])
+        return documents, np.asarray(self.frequencies[first:last], dtype=np.float32)
+
+    def search(self, query: str, top_k: int, allowed: Optional[np.ndarray] = None) -> List[LexicalHit]:
+        """
+        Returns the `top_k` documents with the highest BM25 score for `query`, best first.
+
+        Args:
+            query (str): The query text, tokenized like the documents.
+            top_k (int): Number of results.
+            allowed (Optional[np.ndarray]): Ids of the only documents that may be returned.
+        """
+        mask = None
+        if allowed is not None:
+            mask = np.zeros(self.documents, dtype=bool)
+            mask[allowed] = True
+        documents, scores = [], []
+        for term, query_count in Counter(tokenize(query)).items():
+            postings = self.postings_of(term)
+            if postings is None:
+                continue
+            term_documents, term_frequencies = postings
+            # Document frequency over the whole corpus, so a filter does not change the term weights
+            frequency = len(term_documents)
+            if mask is not None:
+                keep = mask[term_documents]
+                term_documents, term_frequencies = term_documents[keep], term_frequencies[keep]
+            idf = math.log(1 + (self.documents - frequency + 0.5) / (frequency + 0.5))
+            norm = self.length_norms[term_documents]
+            documents.append(term_documents)
+            scores.append(query_count * idf * term_frequencies * (self.k1 + 1) / (term_frequencies + norm))
+        if not documents:
+            return []
+        documents, scores = np.concatenate(documents), np.concatenate(scores)
+        if len(documents) > self.documents // 8:
+            # Frequent terms: summing over all documents beats sorting the postings
+            totals = np.bincount(documents, weights=scores, minlength=self.documents)
+            unique = np.flatnonzero(totals)
+            totals = totals[unique]
+        else:
+            unique, inverse = np.unique(documents, return_inverse=True)
+            totals = np.bincount(inverse, weights=scores)
+        if len(totals) > top_k:
+            selected = np.argpartition(-totals, top_k - 1)[:top_k]
+            unique, totals = unique[selected], totals[selected]
+        order = np.argsort(-totals, kind="stable")
+        return [LexicalHit(id=int(unique[i]), score=float(totals[i])) for i in order]
@@ -0,0 +1,214 @@
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+import openai
+
+from src.constants import MODEL_POOL_ENDPOINTS, MODEL_POOL_REPLICAS, MODEL_POOL_EWMA_ALPHA, \
+    MODEL_POOL_FAILURE_THRESHOLD, MODEL_POOL_EJECTION_SECONDS, MODEL_POOL_MAX_EJECTION_SECONDS
+from src.logging import trace_logger
+
+
+def unwrap_error(error: BaseException) -> BaseException:
+    """
+    Returns the underlying API error of an exception raised through instructor/tenacity retries.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        last_attempt = getattr(error, "last_attempt", None)
+        if last_attempt is not None and last_attempt.failed:
+            error = last_attempt.exception()
+        elif error.__cause__ is not None:
+            error = error.__cause__
+        else:
+            break
+    return error
+
+
+def is_endpoint_failure(error: BaseException) -> bool:
+    """
+    Tells whether an error says something about the health of the endpoint.
+
+    Connection errors, timeouts, throttling and server errors count; validation errors of
+    the model output do not.
+    """
+    error = unwrap_error(error)
+    if isinstance(error, (openai.APIConnectionError, TimeoutError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+@dataclass
+class Replica:
+    """
+    One OpenAI-compatible endpoint serving a model, together with its load and health state.
+    """
+    name: str
+    base_url: str
+    api_key: str
+    model: str
+    ewma_latency: Optional[float] = None
+    in_flight: int = 0
+    requests: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    ejections: int = 0
+    ejected_until: float = 0.0
+
+    def is_available(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+    def score(self, default_latency: float) -> float:
+        latency = self.ewma_latency if self.ewma_latency is not None else default_latency
+        return latency * (self.in_flight + 1)
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "base_url": self.base_url,
+            "model": self.model,
+            "ewma_latency": self.ewma_latency,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "ejections": self.ejections,
+            "ejected": not self.is_available(time.monotonic()),
+        }
+
+
+class ModelPool:
+    """
+    Latency-aware load balancer over equivalent OpenAI-compatible replicas.
+
+    A replica is picked with the power of two choices on `ewma_latency * (in_flight + 1)`, so
+    slow or busy replicas receive less traffic. Health is checked passively: after
+    `failure_threshold` consecutive endpoint failures a replica is ejected for an exponentially
+    growing period and re-admitted afterwards; a single failure on re-admission ejects it again.
+
+    Attributes:
+        replicas (List[Replica]): The replicas of the pool.
+        alpha (float): Smoothing factor of the latency EWMA.
+        failure_threshold (int): Consecutive failures that eject a replica.
+        ejection_seconds (float): First ejection period.
+        max_ejection_seconds (float): Upper bound of the ejection period.
+
+    Methods:
+        from_endpoints: Builds a pool from the named endpoints of `MODEL_POOL_ENDPOINTS`.
+        choose: Picks the replica for the next request, optionally avoiding some replicas.
+        acquire: Context manager picking a replica and recording the outcome of the request.
+        aacquire: Async counterpart of `acquire`.
+        stats: Returns the load and health state of every replica.
+    """
+
+    def __init__(self,
+                 replicas: Iterable[Replica],
+                 alpha: float = MODEL_POOL_EWMA_ALPHA,
+                 failure_threshold: int = MODEL_POOL_FAILURE_THRESHOLD,
+                 ejection_seconds: float = MODEL_POOL_EJECTION_SECONDS,
+                 max_ejection_seconds: float = MODEL_POOL_MAX_EJECTION_SECONDS):
+        self.replicas: List[Replica] = list(replicas)
+        if not self.replicas:
+            raise Exception("A model pool needs at least one replica")
+
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.ejection_seconds = ejection_seconds
+        self.max_ejection_seconds = max_ejection_seconds
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_endpoints(cls, names: Iterable[str], **kwargs) -> "ModelPool":
+        """
+        Builds a pool from the named endpoints of `MODEL_POOL_ENDPOINTS` (e.g. `["QWEN"]`).
+
+        Extra base URLs listed in `MODEL_API_REPLICAS_<NAME>` become additional replicas of
+        the same endpoint; endpoints without a base URL are skipped.
+        """
+        replicas = []
+        for name in names:
+            endpoint = MODEL_POOL_ENDPOINTS[name]
+            base_urls = [endpoint["base_url"]] + MODEL_POOL_REPLICAS.get(name, [])
+            for index, base_url in enumerate(url for url in base_urls if url):
+                replicas.append(Replica(
+                    name=f"{name}-{index}",
+                    base_url=base_url,
+                    api_key=endpoint["api_key"],
+                    model=endpoint["model"],
+                ))
+        return cls(replicas, **kwargs)
+
+    def choose(self, exclude: Iterable[str] = ()) -> Replica:
+        """
+        Picks the replica for the next request, avoiding the replica names in `exclude` when possible.
+        """
+        with self._lock:
+            now = time.monotonic()
+            available = [replica for replica in self.replicas if replica.is_available(now)]
+            preferred = [replica for replica in available if replica.name not in exclude]
+            available = preferred or available
+            if not available:
+                # Every replica is ejected; probe the one coming back first
+                replica = min(self.replicas, key=lambda r: r.ejected_until)
+            elif len(available) == 1:
+                replica = available[0]
+            else:
+                known = [r.ewma_latency for r in available if r.ewma_latency is not None]
+                default_latency = min(known) if known else 0.0
+                first, second = random.sample(available, 2)
+                replica = min((first, second), key=lambda r: r.score(default_latency))
+            replica.in_flight += 1
+            replica.requests += 1
+            return replica
+
+    def record(self, replica: Replica, latency: float, error: Optional[BaseException] = None):
+        with self._lock:
+            replica.in_flight -= 1
+            if error is None:
+                replica.consecutive_failures = 0
+                replica.ejections = 0
+                if replica.ewma_latency is None:
+                    replica.ewma_latency = latency
+                else:
+                    replica.ewma_latency = self.alpha * latency + (1 - self.alpha) * replica.ewma_latency
+            elif is_endpoint_failure(error):
+                replica.failures += 1
+                replica.consecutive_failures += 1
+                if replica.consecutive_failures >= self.failure_threshold:
+                    period = min(self.ejection_seconds * 2 ** replica.ejections, self.max_ejection_seconds)
+                    replica.ejected_until = time.monotonic() + period
+                    replica.ejections += 1
+                    # One more failure after re-admission ejects the replica again
+                    replica.consecutive_failures = self.failure_threshold - 1
+                    trace_logger.error(f"Ejected replica {replica.name} ({replica.base_url}) for {period:.0f}s")
+
+    @contextmanager
+    def acquire(self, exclude: Iterable[str] = ()):
+        replica = self.choose(exclude)
+        start = time.perf_counter()
+        try:
+            yield replica
+        except BaseException as e:
+            self.record(replica, time.perf_counter() - start, e)
+            raise
+        self.record(replica, time.perf_counter() - start)
+
+    @asynccontextmanager
+    async def aacquire(self, exclude: Iterable[str] = ()):
+        replica = self.choose(exclude)
+        start = time.perf_counter()
+        try:
+            yield replica
+        except BaseException as e:
+            self.record(replica, time.perf_counter() - start, e)
+            raise
+        self.record(replica, time.perf_counter() - start)
+
+    def stats(self) -> List[Dict]:
+        with self._lock:
+            return [replica.to_dict() for replica in self.replicas]
@@ -0,0 +1,184 @@
+import inspect
+import json
+import re
+import threading
+from collections import deque
+from dataclasses import dataclass, asdict
+from functools import lru_cache
+from typing import Deque, Dict, Iterable, List, Optional, Sequence
+
+from src.constants import PROMPT_PREFIX_WINDOW
+from src.logging import trace_logger
+from src.model.context import count_text_tokens
+
+SEGMENT_SEPARATOR = "\n\n"
+
+
+def canonical(text: str) -> str:
+    """
+    Returns `text` in a byte-stable form: dedented, without trailing spaces, at most one blank line in a row.
+
+    `inspect.cleandoc` dedents from the second line on, so a triple-quoted block whose first line
+    starts right after the quotes loses the indentation of the following lines too.
+    """
+    lines = [line.rstrip() for line in inspect.cleandoc(text).splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+
+class PromptLayout:
+    """
+    Prompt assembled from static, stable and dynamic segments, in that order.
+
+    vLLM's automatic prefix caching reuses the KV cache of the longest prefix a request shares
+    with earlier ones, so text that never changes (instructions, persona) goes first, then
+    blocks that change rarely (tool and schema descriptions, team roles), and only then
+    per-request content (history, retrieved context, other models' answers). Every segment is
+    canonicalized, so prompts built by different call sites are byte-identical where they agree.
+
+    Attributes:
+        static (List[str]): Fixed instructions.
+        stable (List[str]): Blocks shared by many requests, e.g. tools, schemas, roles.
+        dynamic (List[str]): Per-request content.
+
+    Methods:
+        render: Returns the full prompt.
+        prefix: Returns the cacheable part (static and stable segments).
+    """
+
+    def __init__(self, static: Iterable[str] = (), stable: Iterable[str] = (), dynamic: Iterable[str] = ()):
+        self.static = [canonical(segment) for segment in static if segment and segment.strip()]
+        self.stable = [canonical(segment) for segment in stable if segment and segment.strip()]
+        self.dynamic = [canonical(segment) for segment in dynamic if segment and segment.strip()]
+
+    def prefix(self) -> str:
+        cacheable = self.static + self.stable
+        return SEGMENT_SEPARATOR.join(cacheable) + (SEGMENT_SEPARATOR if cacheable and self.dynamic else "")
+
+    def render(self) -> str:
+        return SEGMENT_SEPARATOR.join(self.static + self.stable + self.dynamic)
+
+
+def assemble_prompt(static: Iterable[str] = (), stable: Iterable[str] = (), dynamic: Iterable[str] = ()) -> str:
+    """
+    Renders a `PromptLayout` of the given segments.
+    """
+    return PromptLayout(static, stable, dynamic).render()
+
+
+@lru_cache(maxsize=256)
+def schema_text(response_model) -> str:
+    """
+    Returns the canonical JSON schema of a response model, as it appears in the tool block of a request.
+    """
+    return json.dumps(response_model.model_json_schema(), sort_keys=True)
+
+
+def _content_text(content) -> str:
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(_content_text(part) for part in content)
+    if isinstance(content, dict):
+        return json.dumps(content, sort_keys=True, default=str)
+    arguments = getattr(content, "arguments", None)
+    if arguments is not None:
+        return f"{content.name}({arguments})"
+    inner = getattr(content, "content", None)
+    return inner if isinstance(inner, str) else str(content)
+
+
+def request_text(messages: Sequence, tools: Optional[Sequence] = None) -> str:
+    """
+    Flattens a chat request the way chat templates lay it out: tool definitions, then messages in order.
+
+    Accepts OpenAI message dicts as well as autogen `LLMMessage` objects and `ToolSchema` dicts.
+    """
+    parts: List[str] = []
+    for tool in tools or []:
+        parts.append(tool if isinstance(tool, str) else json.dumps(tool, sort_keys=True, default=str))
+    for message in messages:
+        if isinstance(message, dict):
+            role, content = message.get("role", ""), message.get("content")
+        else:
+            role, content = type(message).__name__, getattr(message, "content", "")
+        parts.append(f"<{role}>{_content_text(content) if content is not None else ''}")
+    return "\n".join(parts)
+
+
+@dataclass
+class PrefixStats:
+    """
+    Shared-prefix counters of the requests sent to one model.
+
+    Attributes:
+        requests (int): Requests observed.
+        prompt_tokens (int): Total estimated prompt tokens.
+        shared_prefix_tokens (int): Total tokens each request shared with the closest recent request.
+    """
+    requests: int = 0
+    prompt_tokens: int = 0
+    shared_prefix_tokens: int = 0
+
+    @property
+    def shared_ratio(self) -> float:
+        return self.shared_prefix_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+    def to_dict(self) -> Dict:
+        return dict(asdict(self), shared_ratio=self.shared_ratio)
+
+
+def _common_prefix_length(first: str, second: str) -> int:
+    # Binary search over slice comparisons, which run in C
+    low, high = 0, min(len(first), len(second))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if first[:middle] == second[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+class PrefixTracker:
+    """
+    Measures how much of each request's prompt a prefix-caching server can serve from its KV cache.
+
+    Every request is compared with the last `window` requests sent to the same model; the
+    longest common prefix approximates the cache hit, since vLLM keeps recently used prefix
+    blocks. The shared length of each request is logged and accumulated per model. Tracking is
+    opt-in: the shared `prefix_tracker` records nothing unless `PROMPT_PREFIX_WINDOW` is above 0.
+
+    Methods:
+        observe: Records a request and returns its shared-prefix length in tokens.
+        stats: Returns the counters of every model.
+    """
+
+    def __init__(self, window: int = PROMPT_PREFIX_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._recent: Dict[str, Deque[str]] = {}
+        self._stats: Dict[str, PrefixStats] = {}
+
+    def observe(self, model: str, text: str) -> int:
+        if self.window <= 0:
+            return 0
+        with self._lock:
+            recent = self._recent.setdefault(model, deque(maxlen=self.window))
+            shared = max((_common_prefix_length(text, previous) for previous in recent), default=0)
+            recent.append(text)
+        shared_tokens = count_text_tokens(text[:shared]) if shared else 0
+        prompt_tokens = count_text_tokens(text)
+        with self._lock:
+            stats = self._stats.setdefault(model, PrefixStats())
+            stats.requests += 1
+            stats.prompt_tokens += prompt_tokens
+            stats.shared_prefix_tokens += shared_tokens
+        trace_logger.debug(f"Prompt to {model}: {shared_tokens}/{prompt_tokens} tokens shared with a recent request")
+        return shared_tokens
+
+    def stats(self) -> Dict[str, PrefixStats]:
+        with self._lock:
+            return {model: PrefixStats(**asdict(stats)) for model, stats in self._stats.items()}
+
+
+prefix_tracker = PrefixTracker()
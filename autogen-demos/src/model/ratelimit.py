@@ -0,0 +1,231 @@
+import asyncio
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from typing import Dict, Optional, Tuple
+
+from src.constants import MODEL_POOL_ENDPOINTS, MODEL_POOL_REPLICAS, RATE_LIMITS, RATE_LIMIT_PATH, \
+    RATE_LIMIT_BURST_SECONDS, RATE_LIMIT_MAX_WAIT
+from src.logging import trace_logger
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows; buckets are then only shared between threads of one process
+    fcntl = None
+
+# Request bucket (tokens, updated at) followed by the token bucket (tokens, updated at)
+_LAYOUT = struct.Struct("<4d")
+
+
+class RateLimitExceeded(Exception):
+    """
+    Raised when a request would have to queue longer than the limiter's `max_wait`.
+    """
+
+
+@dataclass
+class RateLimitStats:
+    """
+    Counters of a `RateLimiter` in this process.
+
+    Attributes:
+        requests (int): Requests admitted.
+        queued (int): Requests that had to wait for budget.
+        wait_seconds (float): Total time spent waiting.
+        rejected (int): Requests refused because the wait exceeded `max_wait`.
+    """
+    requests: int = 0
+    queued: int = 0
+    wait_seconds: float = 0.0
+    rejected: int = 0
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+class RateLimiter:
+    """
+    Requests-per-second and tokens-per-minute budget of one endpoint, shared by every process on the host.
+
+    Both budgets are token buckets kept in a small memory-mapped file under `path` and updated
+    under an exclusive file lock. A request reserves its cost up front, even if that drives a
+    bucket negative, and then sleeps until the deficit has refilled. Waiting times therefore
+    grow in arrival order, so callers are served first come, first served instead of being
+    answered with 429s, and a crashed process never leaves the queue blocked. Once the
+    response arrives, `settle` corrects the token estimate with the actual usage.
+
+    Attributes:
+        key (str): Identifier of the endpoint, usually its base URL.
+        rps (float): Requests per second; 0 disables the request budget.
+        tpm (float): Tokens per minute; 0 disables the token budget.
+        burst_seconds (float): Seconds of request budget that may be spent at once.
+        max_wait (float): Longest time a request may queue before `RateLimitExceeded` is raised.
+        stats (RateLimitStats): Counters of this process.
+
+    Methods:
+        reserve: Reserves budget for a request and returns how long to wait before sending it.
+        acquire: Waits until a request may be sent.
+        aacquire: Async counterpart of `acquire`.
+        settle: Returns or charges the difference between estimated and actual tokens.
+    """
+
+    def __init__(self,
+                 key: str,
+                 rps: float = 0,
+                 tpm: float = 0,
+                 path: str = RATE_LIMIT_PATH,
+                 burst_seconds: float = RATE_LIMIT_BURST_SECONDS,
+                 max_wait: float = RATE_LIMIT_MAX_WAIT):
+        self.key = key
+        self.rps = rps
+        self.tpm = tpm
+        self.burst_seconds = burst_seconds
+        self.max_wait = max_wait
+        self.stats = RateLimitStats()
+        self._lock = threading.Lock()
+
+        os.makedirs(path, exist_ok=True)
+        file_name = hashlib.sha256(key.encode("utf-8")).hexdigest()[:32] + ".bucket"
+        self._fd = os.open(os.path.join(path, file_name), os.O_RDWR | os.O_CREAT, 0o666)
+        with self.__locked__():
+            if os.fstat(self._fd).st_size < _LAYOUT.size:
+                os.ftruncate(self._fd, _LAYOUT.size)
+        self._map = mmap.mmap(self._fd, _LAYOUT.size)
+
+    @contextmanager
+    def __locked__(self):
+        with self._lock:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    @property
+    def request_capacity(self) -> float:
+        return max(1.0, self.rps * self.burst_seconds)
+
+    @property
+    def token_capacity(self) -> float:
+        return self.tpm
+
+    def __refill__(self, tokens: float, updated: float, capacity: float, rate: float, now: float) -> float:
+        if updated == 0.0:
+            # Fresh bucket file
+            return capacity
+        return min(capacity, tokens + max(0.0, now - updated) * rate)
+
+    def __update__(self, requests: float, tokens: float) -> float:
+        """
+        Applies a reservation of `requests` and `tokens` to the shared buckets and returns the wait.
+        """
+        now = time.time()
+        request_tokens, request_updated, token_tokens, token_updated = _LAYOUT.unpack_from(self._map)
+        wait = 0.0
+
+        if self.rps > 0:
+            request_tokens = self.__refill__(request_tokens, request_updated, self.request_capacity, self.rps, now)
+            request_tokens -= requests
+            wait = max(wait, -request_tokens / self.rps)
+            request_updated = now
+
+        if self.tpm > 0:
+            token_rate = self.tpm / 60.0
+            token_tokens = self.__refill__(token_tokens, token_updated, self.token_capacity, token_rate, now)
+            token_tokens -= tokens
+            wait = max(wait, -token_tokens / token_rate)
+            token_updated = now
+
+        _LAYOUT.pack_into(self._map, 0, request_tokens, request_updated, token_tokens, token_updated)
+        return wait
+
+    def reserve(self, tokens: int = 0) -> float:
+        """
+        Reserves one request and `tokens` tokens and returns the seconds to wait before sending.
+
+        Raises:
+            RateLimitExceeded: If the wait would exceed `max_wait`; the reservation is then returned.
+        """
+        with self.__locked__():
+            wait = self.__update__(1, tokens)
+            if wait > self.max_wait:
+                self.__update__(-1, -tokens)
+                self.stats.rejected += 1
+                raise RateLimitExceeded(f"Rate limit of {self.key} would queue the request for {wait:.1f}s")
+            self.stats.requests += 1
+            if wait > 0:
+                self.stats.queued += 1
+                self.stats.wait_seconds += wait
+        return wait
+
+    def acquire(self, tokens: int = 0):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: int = 0):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def settle(self, estimated: int, actual: Optional[int]):
+        """
+        Corrects the token bucket once the actual usage of a request is known.
+        """
+        if self.tpm <= 0 or actual is None or actual == estimated:
+            return
+        with self.__locked__():
+            self.__update__(0, actual - estimated)
+
+
+def _normalize(base_url: str) -> str:
+    return str(base_url).rstrip("/")
+
+
+def _endpoint_limits() -> Dict[str, Tuple[float, float]]:
+    limits = {}
+    for name, endpoint in MODEL_POOL_ENDPOINTS.items():
+        rps, tpm = RATE_LIMITS.get(name, (0, 0))
+        if rps <= 0 and tpm <= 0:
+            continue
+        for base_url in [endpoint["base_url"]] + MODEL_POOL_REPLICAS.get(name, []):
+            if base_url:
+                limits[_normalize(base_url)] = (rps, tpm)
+    return limits
+
+
+_limiters: Dict[str, Optional[RateLimiter]] = {}
+_limiters_lock = threading.Lock()
+
+
+def rate_limiter_for(base_url: str) -> Optional[RateLimiter]:
+    """
+    Returns the process-wide limiter of an endpoint, or None when `RATE_LIMITS` sets no budget for it.
+    """
+    key = _normalize(base_url)
+    if key not in _limiters:
+        with _limiters_lock:
+            if key not in _limiters:
+                limits = _endpoint_limits().get(key)
+                _limiters[key] = RateLimiter(key, *limits) if limits else None
+                if limits:
+                    trace_logger.debug(f"Rate limiting {key} to {limits[0]} rps / {limits[1]} tpm")
+    return _limiters[key]
+
+
+def response_tokens(response) -> Optional[int]:
+    """
+    Returns the total tokens reported for a chat completion or an instructor-parsed response.
+    """
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        usage = getattr(getattr(response, "_raw_response", None), "usage", None)
+    return getattr(usage, "total_tokens", None)
@@ -0,0 +1,289 @@
+import json
+import threading
+import time
+import typing
+from dataclasses import dataclass, asdict
+from enum import Enum
+from json import JSONDecodeError
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from instructor.exceptions import IncompleteOutputException
+from pydantic import BaseModel, ValidationError
+
+from src.model.pool import unwrap_error
+
+# Cut points tried, latest first, when closing a truncated document does not parse
+MAX_TRUNCATION_CUTS = 64
+
+_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+@dataclass
+class RepairStats:
+    """
+    Counters of local structured-output repair.
+
+    Attributes:
+        parse_failures (int): Structured responses that failed to parse or validate.
+        repaired (int): Failures fixed locally, each one a re-ask avoided.
+        reasks (int): Requests sent back to the model because repair failed.
+        repair_seconds (float): Time spent repairing.
+        seconds_saved (float): Estimated latency saved: the duration of the failed request each
+            repair made unnecessary to repeat, minus the repair time.
+    """
+    parse_failures: int = 0
+    repaired: int = 0
+    reasks: int = 0
+    repair_seconds: float = 0.0
+    seconds_saved: float = 0.0
+
+    @property
+    def repair_rate(self) -> float:
+        return self.repaired / self.parse_failures if self.parse_failures else 0.0
+
+    def to_dict(self) -> Dict:
+        return dict(asdict(self), repair_rate=self.repair_rate)
+
+
+class RepairLog:
+    """
+    Thread-safe `RepairStats` shared by every `RouterLLM` of the process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = RepairStats()
+
+    def record(self, repaired: bool, request_seconds: float, repair_seconds: float):
+        with self._lock:
+            self._stats.parse_failures += 1
+            self._stats.repair_seconds += repair_seconds
+            if repaired:
+                self._stats.repaired += 1
+                self._stats.seconds_saved += request_seconds - repair_seconds
+
+    def record_reask(self):
+        with self._lock:
+            self._stats.reasks += 1
+
+    def stats(self) -> RepairStats:
+        with self._lock:
+            return RepairStats(**asdict(self._stats))
+
+
+repair_log = RepairLog()
+
+
+def is_parse_failure(error: BaseException) -> bool:
+    """
+    Tells whether a structured request failed on the response itself rather than on the endpoint.
+    """
+    return isinstance(unwrap_error(error), (ValidationError, JSONDecodeError, IncompleteOutputException))
+
+
+def _json_start(text: str) -> str:
+    starts = [index for index in (text.find("{"), text.find("[")) if index >= 0]
+    return text[min(starts):] if starts else text
+
+
+def repair_json(text: str) -> Optional[Any]:
+    """
+    Parses almost-JSON as produced by small models, or returns None.
+
+    Handles code fences and prose around the document, single-quoted strings, raw newlines
+    and tabs inside strings, trailing commas, Python literals (`True`, `None`) and documents
+    truncated by the token limit, which are closed at the latest point that still parses.
+    """
+    try:
+        return json.loads(text)
+    except (TypeError, ValueError):
+        pass
+    if not isinstance(text, str):
+        return None
+
+    text = _json_start(text.strip())
+    out: List[str] = []
+    stack: List[str] = []
+    # (length of `out`, open containers) at each point where the document may be cut
+    cuts: List[Tuple[int, str]] = []
+    quote = None
+    index = 0
+    while index < len(text):
+        char = text[index]
+        if quote is not None:
+            if char == "\\" and index + 1 < len(text):
+                following = text[index + 1]
+                if quote == "'" and following == "'":
+                    out.append("'")
+                else:
+                    out.append(char + following)
+                index += 2
+                continue
+            if char == quote:
+                out.append('"')
+                quote = None
+            elif char == '"':
+                out.append('\\"')
+            else:
+                out.append(_ESCAPES.get(char, char))
+        elif char in "\"'":
+            out.append('"')
+            quote = char
+        elif char in "{[":
+            out.append(char)
+            stack.append(char)
+            cuts.append((len(out), "".join(stack)))
+        elif char in "}]":
+            while out and (out[-1].isspace() or out[-1] == ","):
+                out.pop()
+            if stack:
+                stack.pop()
+            out.append(char)
+            if not stack:
+                break
+        elif char == ",":
+            cuts.append((len(out), "".join(stack)))
+            out.append(char)
+        elif char.isalpha():
+            end = index
+            while end < len(text) and (text[end].isalnum() or text[end] == "_"):
+                end += 1
+            word = text[index:end]
+            out.append(_LITERALS.get(word, word))
+            index = end
+            continue
+        else:
+            out.append(char)
+        index += 1
+
+    if quote is not None:
+        out.append('"')
+    closers = "".join(_CLOSERS[opener] for opener in reversed(stack))
+    candidates = ["".join(out) + closers]
+    for length, open_containers in reversed(cuts[-MAX_TRUNCATION_CUTS:]):
+        candidates.append("".join(out[:length]) + "".join(_CLOSERS[opener] for opener in reversed(open_containers)))
+    for candidate in candidates:
+        try:
+            return json.loads(candidate)
+        except ValueError:
+            continue
+    return None
+
+
+def _match_choice(value: Any, choices: List[Any]) -> Any:
+    if isinstance(value, str):
+        for choice in choices:
+            if isinstance(choice, str) and choice.lower() == value.strip().lower():
+                return choice
+    return value
+
+
+def _coerce(value: Any, annotation: Any) -> Any:
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+    if origin is typing.Literal:
+        return _match_choice(value, list(args))
+    if isinstance(annotation, type) and issubclass(annotation, Enum):
+        matched = _match_choice(value, [member.value for member in annotation])
+        name = _match_choice(matched, [member.name for member in annotation])
+        return annotation[name].value if name is not matched else matched
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return coerce_fields(value, annotation)
+    if origin in (list, List, set, tuple) and isinstance(value, list) and args:
+        return [_coerce(item, args[0]) for item in value]
+    if origin in (dict, Dict) and isinstance(value, dict) and len(args) == 2:
+        return {key: _coerce(item, args[1]) for key, item in value.items()}
+    if args and origin not in (list, List, set, tuple, dict, Dict):
+        # Union / Optional / Annotated: the first member the value changes under wins
+        for member in args:
+            if member is type(None):
+                continue
+            coerced = _coerce(value, member)
+            if coerced is not value:
+                return coerced
+    return value
+
+
+def _allows_none(annotation: Any) -> bool:
+    return annotation is None or type(None) in typing.get_args(annotation)
+
+
+def coerce_fields(data: Any, response_model: Type[BaseModel]) -> Any:
+    """
+    Fixes enum and literal case mismatches and fills missing optional fields of `data`, recursively.
+    """
+    if not isinstance(data, dict):
+        return data
+    data = dict(data)
+    for name, field in response_model.model_fields.items():
+        key = field.alias or name
+        if key not in data:
+            if field.is_required() and _allows_none(field.annotation):
+                data[key] = None
+            continue
+        data[key] = _coerce(data[key], field.annotation)
+    return data
+
+
+def _completion_payload(completion) -> Optional[str]:
+    try:
+        message = completion.choices[0].message
+    except (AttributeError, IndexError, TypeError):
+        return None
+    if message.tool_calls:
+        return message.tool_calls[0].function.arguments
+    return message.content
+
+
+def repair_completion(completion, response_model: Type[BaseModel]) -> Optional[BaseModel]:
+    """
+    Repairs the tool-call arguments (or content) of a completion that failed to parse into `response_model`.
+
+    Returns:
+        The validated response, carrying the completion as `_raw_response` like instructor's
+        responses, or None when the response cannot be repaired locally.
+    """
+    if completion is None or not (isinstance(response_model, type) and issubclass(response_model, BaseModel)):
+        return None
+    payload = _completion_payload(completion)
+    if payload is None:
+        return None
+    data = repair_json(payload)
+    if data is None:
+        return None
+    try:
+        response = response_model.model_validate(coerce_fields(data, response_model))
+    except ValidationError:
+        return None
+    response._raw_response = completion
+    return response
+
+
+def repair_failed_response(error: Exception, response_model: Type[BaseModel],
+                           request_seconds: float) -> Optional[BaseModel]:
+    """
+    Repairs the completion carried by a structured request that failed to parse, and records the outcome.
+
+    Args:
+        error (Exception): The parse failure raised by instructor, see `is_parse_failure`.
+        response_model (Type[BaseModel]): The schema of the response.
+        request_seconds (float): Duration of the failed request, i.e. roughly what a re-ask costs.
+
+    Returns:
+        The repaired response, or None when the model has to be asked again.
+    """
+    start = time.perf_counter()
+    completion = getattr(error, "last_completion", None) or getattr(unwrap_error(error), "last_completion", None)
+    response = repair_completion(completion, response_model)
+    repair_log.record(response is not None, request_seconds, time.perf_counter() - start)
+    return response
+
+
+def reask_messages(error: Exception, messages: List[Dict]) -> List[Dict]:
+    """
+    Returns the messages of a re-ask: instructor's validation feedback when it built one, else the original request.
+    """
+    create_kwargs = getattr(error, "create_kwargs", None) or {}
+    return list(create_kwargs.get("messages") or messages)
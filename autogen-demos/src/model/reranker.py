@@ -0,0 +1,228 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Sequence, Tuple, TypeVar
+
+from src.constants import RERANKER_CACHE, RERANKER_CACHE_TTL, RERANK_MODEL_API_URL, RERANK_MODEL_API_KEY, \
+    RERANK_MODEL_NAME, RERANK_MAX_BATCH, RERANK_MAX_CONCURRENCY, RERANK_DEADLINE
+from src.logging import trace_logger
+from src.model.clients import client_registry
+
+_WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+Candidate = TypeVar("Candidate")
+
+
+def query_hash(query: str) -> str:
+    """
+    Hashes a query ignoring case, punctuation and spacing, so near-repeated queries share cached scores.
+    """
+    normalized = " ".join(_WORD_PATTERN.findall(query.lower()))
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def chunk_id(text: str) -> str:
+    """
+    Content hash of a chunk; unlike index positions it stays valid when the index is rebuilt.
+    """
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class RerankStats:
+    """
+    Counters of a `Reranker`.
+
+    Attributes:
+        queries (int): Rerank calls.
+        cached (int): Candidate scores served from the cache.
+        scored (int): Candidate scores requested from the endpoint.
+        batches (int): Requests sent to the endpoint.
+        fallbacks (int): Queries returned in first-stage order because scores missed the deadline or failed.
+        errors (int): Failed endpoint requests.
+        seconds (float): Total time spent in `rerank`.
+    """
+    queries: int = 0
+    cached: int = 0
+    scored: int = 0
+    batches: int = 0
+    fallbacks: int = 0
+    errors: int = 0
+    seconds: float = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.cached + self.scored
+        return self.cached / lookups if lookups else 0.0
+
+    def to_dict(self) -> Dict:
+        return {**asdict(self), "hit_rate": self.hit_rate}
+
+
+class ScoreCache:
+    """
+    Persistent SQLite store of reranker scores keyed by (query hash, chunk id, model), with TTL expiry.
+    """
+
+    def __init__(self, path: str = RERANKER_CACHE, ttl: float = RERANKER_CACHE_TTL):
+        self.ttl = ttl
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(os.path.join(path, "scores.sqlite3"), check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS scores ("
+            "query TEXT NOT NULL, chunk TEXT NOT NULL, model TEXT NOT NULL, score REAL NOT NULL, "
+            "created REAL NOT NULL, PRIMARY KEY (query, model, chunk)) WITHOUT ROWID"
+        )
+        self._connection.commit()
+
+    def get_many(self, query: str, model: str, chunks: Sequence[str]) -> Dict[str, float]:
+        """
+        Returns the unexpired scores of `chunks` for a query hash and model.
+        """
+        if not chunks:
+            return {}
+        oldest = time.time() - self.ttl if self.ttl else 0.0
+        placeholders = ",".join("?" * len(chunks))
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT chunk, score FROM scores WHERE query = ? AND model = ? AND created >= ? "
+                f"AND chunk IN ({placeholders})",
+                (query, model, oldest, *chunks)
+            ).fetchall()
+        return dict(rows)
+
+    def set_many(self, query: str, model: str, scores: Dict[str, float]):
+        now = time.time()
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO scores (query, chunk, model, score, created) VALUES (?, ?, ?, ?, ?)",
+                [(query, chunk, model, score, now) for chunk, score in scores.items()]
+            )
+            self._connection.commit()
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM scores")
+            self._connection.commit()
+
+    def close(self):
+        self._connection.close()
+
+
+class Reranker:
+    """
+    Cross-encoder reranking stage with a persistent score cache.
+
+    Candidates whose score for the (normalized) query and model is cached are not sent again;
+    the others are posted to the `RERANK_MODEL_API_*` endpoint's `/rerank` route in batches of
+    at most `max_batch` documents, `max_concurrency` batches at a time. If any score is missing
+    when `deadline` expires, or a batch fails, the candidates are returned in their first-stage
+    order; batches still in flight keep running and store their scores, so a repeat of the query
+    is reranked from the cache.
+
+    Attributes:
+        model (str): Reranker model name, part of the cache key.
+        max_batch (int): Maximum documents per request, see `RERANK_MAX_BATCH`.
+        deadline (float): Seconds to wait for missing scores, see `RERANK_DEADLINE`.
+        cache (Optional[ScoreCache]): Score cache, disabled when `cache_path` is None.
+        stats (RerankStats): Cache and fallback counters.
+
+    Methods:
+        scores: Returns the score of every text for a query, or None past the deadline.
+        rerank: Orders candidates by their reranker score, returned with it.
+    """
+
+    def __init__(self,
+                 base_url: str = RERANK_MODEL_API_URL,
+                 api_key: str = RERANK_MODEL_API_KEY,
+                 model: str = RERANK_MODEL_NAME,
+                 cache_path: Optional[str] = RERANKER_CACHE,
+                 max_batch: int = RERANK_MAX_BATCH,
+                 max_concurrency: int = RERANK_MAX_CONCURRENCY,
+                 deadline: float = RERANK_DEADLINE):
+        self.model = model
+        self.max_batch = max_batch
+        self.deadline = deadline
+        self.cache = ScoreCache(cache_path) if cache_path else None
+        self.stats = RerankStats()
+        self.openai_client = client_registry.get(base_url, api_key or "EMPTY", "rerank").openai_client
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="rerank")
+        self._lock = threading.Lock()
+
+    def __post__(self, query: str, documents: List[str]) -> List[float]:
+        response = self.openai_client.post(
+            "/rerank",
+            body={"model": self.model, "query": query, "documents": documents},
+            cast_to=object,
+        )
+        # vLLM, Jina and Cohere answer {"results": [{"index", "relevance_score"}]}; TEI a list of {"index", "score"}
+        results = response["results"] if isinstance(response, dict) else response
+        scores = [0.0] * len(documents)
+        for result in results:
+            scores[result["index"]] = float(result.get("relevance_score", result.get("score", 0.0)))
+        return scores
+
+    def __batch__(self, query: str, key: str, batch: Dict[str, str]) -> Dict[str, float]:
+        try:
+            scores = dict(zip(batch, self.__post__(query, list(batch.values()))))
+        except Exception as e:
+            with self._lock:
+                self.stats.errors += 1
+            trace_logger.error(f"Rerank request failed: {e}")
+            raise
+        if self.cache is not None:
+            self.cache.set_many(key, self.model, scores)
+        return scores
+
+    def scores(self, query: str, texts: Sequence[str]) -> Optional[List[float]]:
+        """
+        Returns the reranker score of every text for `query`, or None when some are missing at the deadline.
+        """
+        key = query_hash(query)
+        ids = [chunk_id(text) for text in texts]
+        known = self.cache.get_many(key, self.model, list(set(ids))) if self.cache is not None else {}
+        missing = {id: text for id, text in zip(ids, texts) if id not in known}
+        with self._lock:
+            self.stats.cached += len(ids) - len(missing)
+            self.stats.scored += len(missing)
+
+        if missing:
+            pending = list(missing.items())
+            batches = [dict(pending[start:start + self.max_batch]) for start in range(0, len(pending), self.max_batch)]
+            with self._lock:
+                self.stats.batches += len(batches)
+            futures = [self._executor.submit(self.__batch__, query, key, batch) for batch in batches]
+            done, not_done = wait(futures, timeout=self.deadline)
+            if not_done or any(future.exception() for future in done):
+                return None
+            for future in done:
+                known.update(future.result())
+        return [known[id] for id in ids]
+
+    def rerank(self, query: str, candidates: Sequence[Candidate],
+               texts: Sequence[str]) -> List[Tuple[Candidate, Optional[float]]]:
+        """
+        Orders `candidates` by the reranker score of their `texts`, best first.
+
+        Returns:
+            List[tuple]: `(candidate, score)` pairs. When scores are not available in time the
+                candidates keep the given (first-stage) order and every score is None.
+        """
+        start = time.perf_counter()
+        scores = self.scores(query, texts) if candidates else []
+        with self._lock:
+            self.stats.queries += 1
+            self.stats.fallbacks += int(scores is None)
+            self.stats.seconds += time.perf_counter() - start
+        if scores is None:
+            trace_logger.warning(f"Reranking missed its {self.deadline}s deadline, keeping the first-stage order")
+            return [(candidate, None) for candidate in candidates]
+        order = sorted(range(len(candidates)), key=lambda index: scores[index], reverse=True)
+        return [(candidates[index], scores[index]) for index in order]
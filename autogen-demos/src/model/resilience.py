@@ -0,0 +1,229 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, asdict
+from typing import Awaitable, Callable, Dict, Optional, Set, TypeVar
+
+from src.constants import RETRY_BASE_DELAY, RETRY_MAX_DELAY, ATTEMPT_TIMEOUT, HEDGE_QUANTILE, HEDGE_MIN_SAMPLES, \
+    HEDGE_LATENCY_WINDOW
+from src.logging import trace_logger
+from src.model.pool import is_endpoint_failure
+
+T = TypeVar("T")
+
+# An attempt sends one request; it receives the replicas already used by the call so a retry or
+# hedge can go elsewhere, and adds the replica it picks.
+Attempt = Callable[[Set[str]], T]
+
+
+@dataclass
+class ResilienceStats:
+    """
+    Counters of a `Resilience` layer.
+
+    Attributes:
+        calls (int): Logical requests made through the layer.
+        attempts (int): Requests actually sent, including retries and hedges.
+        retries (int): Attempts repeated after a retryable error.
+        hedges (int): Duplicate requests sent because the first one exceeded the hedge delay.
+        hedge_wins (int): Hedges that answered before the original request.
+        wasted_requests (int): Requests whose answer was not used (hedge losers).
+        failures (int): Calls that failed after exhausting their attempts.
+    """
+    calls: int = 0
+    attempts: int = 0
+    retries: int = 0
+    hedges: int = 0
+    hedge_wins: int = 0
+    wasted_requests: int = 0
+    failures: int = 0
+
+    @property
+    def hedge_rate(self) -> float:
+        return self.hedges / self.calls if self.calls else 0.0
+
+    def to_dict(self) -> Dict:
+        return dict(asdict(self), hedge_rate=self.hedge_rate)
+
+
+class Resilience:
+    """
+    Retries and hedging around a single LLM request.
+
+    Retryable errors (connection errors, timeouts, throttling and server errors) are retried up
+    to `max_tries` attempts in total with exponential backoff and full jitter; other errors are
+    raised at once. With `hedge` enabled, a duplicate request is sent when the first one has not
+    answered after the `hedge_quantile` of recently observed latencies, and whichever succeeds
+    first is used. Attempts are told which replicas were already used, so hedges and retries go
+    to another replica of a `ModelPool` when there is one.
+
+    Attributes:
+        max_tries (int): Attempts per call, the first one included.
+        base_delay (float): Backoff before the first retry, in seconds.
+        max_delay (float): Upper bound of the backoff.
+        attempt_timeout (float): Timeout of a single attempt, passed to the OpenAI client.
+        hedge (bool): Whether slow requests are hedged.
+        hedge_quantile (float): Latency quantile after which a hedge is sent.
+        min_samples (int): Latencies observed before hedging starts.
+        stats (ResilienceStats): Counters, including hedge rate and wasted requests.
+
+    Methods:
+        hedge_delay: Returns the current hedge delay, or None while too few latencies are known.
+        call: Runs a synchronous attempt with retries and hedging.
+        acall: Async counterpart of `call`.
+    """
+
+    def __init__(self,
+                 max_tries: int = 1,
+                 base_delay: float = RETRY_BASE_DELAY,
+                 max_delay: float = RETRY_MAX_DELAY,
+                 attempt_timeout: float = ATTEMPT_TIMEOUT,
+                 hedge: bool = False,
+                 hedge_quantile: float = HEDGE_QUANTILE,
+                 min_samples: int = HEDGE_MIN_SAMPLES,
+                 window: int = HEDGE_LATENCY_WINDOW):
+        self.max_tries = max(1, max_tries)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.attempt_timeout = attempt_timeout
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.min_samples = min_samples
+        self.stats = ResilienceStats()
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def hedge_delay(self) -> Optional[float]:
+        with self._lock:
+            if not self.hedge or len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(self.hedge_quantile * len(ordered)))]
+
+    def backoff(self, retry: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
+
+    def __count__(self, **counters):
+        with self._lock:
+            for name, value in counters.items():
+                setattr(self.stats, name, getattr(self.stats, name) + value)
+
+    def __timed__(self, attempt: Attempt, used: Set[str]):
+        self.__count__(attempts=1)
+        start = time.perf_counter()
+        result = attempt(used)
+        with self._lock:
+            self._latencies.append(time.perf_counter() - start)
+        return result
+
+    async def __atimed__(self, attempt: Callable[[Set[str]], Awaitable[T]], used: Set[str]) -> T:
+        self.__count__(attempts=1)
+        start = time.perf_counter()
+        result = await attempt(used)
+        with self._lock:
+            self._latencies.append(time.perf_counter() - start)
+        return result
+
+    def __hedged__(self, attempt: Attempt, used: Set[str]):
+        delay = self.hedge_delay()
+        if delay is None:
+            return self.__timed__(attempt, used)
+
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(thread_name_prefix="hedge")
+        primary = self._executor.submit(self.__timed__, attempt, used)
+        if wait([primary], timeout=delay).done:
+            return primary.result()
+
+        self.__count__(hedges=1)
+        hedge = self._executor.submit(self.__timed__, attempt, used)
+        pending, error = {primary, hedge}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # The losing thread cannot be interrupted; its answer is discarded
+                    self.__count__(wasted_requests=len(pending), hedge_wins=int(future is hedge))
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def __ahedged__(self, attempt: Callable[[Set[str]], Awaitable[T]], used: Set[str]) -> T:
+        delay = self.hedge_delay()
+        if delay is None:
+            return await self.__atimed__(attempt, used)
+
+        primary = asyncio.ensure_future(self.__atimed__(attempt, used))
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+
+        self.__count__(hedges=1)
+        hedge = asyncio.ensure_future(self.__atimed__(attempt, used))
+        pending, error = {primary, hedge}, None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.__count__(wasted_requests=len(pending), hedge_wins=int(task is hedge))
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def __retry__(self, error: Exception, tries: int) -> Optional[float]:
+        """
+        Returns the backoff before the next attempt, or None when `error` must be raised.
+        """
+        if tries >= self.max_tries or not is_endpoint_failure(error):
+            self.__count__(failures=1)
+            return None
+        self.__count__(retries=1)
+        delay = self.backoff(tries - 1)
+        trace_logger.warning(f"Attempt {tries}/{self.max_tries} failed ({error}), retrying in {delay:.2f}s")
+        return delay
+
+    def call(self, attempt: Attempt):
+        """
+        Runs `attempt` with retries and, when enabled, hedging.
+
+        Args:
+            attempt (Callable): Sends one request; called with the set of replicas already used.
+
+        Returns:
+            The result of the first successful attempt.
+        """
+        self.__count__(calls=1)
+        used: Set[str] = set()
+        for tries in range(1, self.max_tries + 1):
+            try:
+                return self.__hedged__(attempt, used)
+            except Exception as e:
+                delay = self.__retry__(e, tries)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+
+    async def acall(self, attempt: Callable[[Set[str]], Awaitable[T]]) -> T:
+        """
+        Async counterpart of `call`.
+        """
+        self.__count__(calls=1)
+        used: Set[str] = set()
+        for tries in range(1, self.max_tries + 1):
+            try:
+                return await self.__ahedged__(attempt, used)
+            except Exception as e:
+                delay = self.__retry__(e, tries)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
@@ -0,0 +1,154 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from src.constants import TOP_K, N_PROBE, POLICY_CONTEXT_CHUNKS, RRF_K, EMBEDDING_MAX_CONCURRENCY
+from src.logging import trace_logger
+from src.model.lexical import LexicalIndex
+from src.model.reranker import Reranker
+from src.model.vector_index import VectorIndex
+
+# Maps texts to one embedding per row, e.g. `EmbeddingClient` or `HashingEmbedder`
+Embedder = Callable[[Sequence[str]], np.ndarray]
+
+EMBED_BATCH_SIZE = 64
+LEXICAL_DIRECTORY = "lexical"
+
+
+@dataclass
+class RetrievedChunk:
+    """
+    A chunk returned by a retriever.
+
+    Attributes:
+        id (int): Chunk id, its position in the indexed corpus.
+        text (str): The chunk's text.
+        score (float): Relevance score, higher is more relevant: the reranker's score when the chunk
+            was reranked, else its reciprocal-rank fusion score.
+        module (Optional[str]): Module the chunk belongs to.
+        countries (List[str]): Countries the chunk is about.
+    """
+    id: int
+    text: str
+    score: float
+    module: Optional[str] = None
+    countries: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> Dict:
+        return {"id": self.id, "text": self.text, "score": round(self.score, 4), "module": self.module,
+                "countries": self.countries}
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = RRF_K) -> List[tuple]:
+    """
+    Fuses rankings of ids: each id scores the sum of `1 / (k + rank)` over the rankings it appears in.
+
+    Returns:
+        List[tuple]: `(id, score)` pairs, best first.
+    """
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, id in enumerate(ranking, start=1):
+            scores[id] = scores.get(id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def index_chunks(path: str, chunks: Iterable[Dict], embedder: Embedder, **index_kwargs) -> VectorIndex:
+    """
+    Embeds chunk records `{"text", "module", "countries", ...}` in concurrent batches and builds a
+    `VectorIndex` at `path`, with a BM25 `LexicalIndex` of the same chunks next to it.
+    """
+    records = list(chunks)
+    batches = [[record["text"] for record in records[start:start + EMBED_BATCH_SIZE]]
+               for start in range(0, len(records), EMBED_BATCH_SIZE)]
+    with ThreadPoolExecutor(max_workers=EMBEDDING_MAX_CONCURRENCY) as executor:
+        vectors = list(executor.map(embedder, batches))
+    index = VectorIndex.build(path, np.concatenate(vectors) if vectors else np.zeros((0, 0)), records, **index_kwargs)
+    LexicalIndex.build(os.path.join(path, LEXICAL_DIRECTORY), (record["text"] for record in records))
+    return index
+
+
+class Retriever:
+    """
+    Hybrid retriever over a dense `VectorIndex` and, when available, a BM25 `LexicalIndex`.
+
+    The query is embedded and searched in the vector index; with a lexical index it is also
+    scored by BM25 under the same countries/module filter, and the two rankings are fused with
+    reciprocal-rank fusion, so exact terms such as article numbers or Arabic legal terms reach
+    the results even when the embedding misses them. If the query cannot be embedded, the
+    lexical ranking is used alone. With a `Reranker`, the `top_k` fused candidates are
+    reordered by the cross-encoder before the best `limit` are returned.
+
+    Attributes:
+        index (VectorIndex): Index of the chunks, built with the same embedder.
+        embedder (Callable): Embeds the queries.
+        lexical (Optional[LexicalIndex]): BM25 index of the same chunks.
+        top_k (int): Candidates taken from each index, see `TOP_K`.
+        n_probe (int): Inverted lists searched, see `N_PROBE`.
+        rrf_k (int): Rank constant of the fusion, see `RRF_K`.
+        reranker (Optional[Reranker]): Cross-encoder stage over the fused candidates.
+
+    Methods:
+        open: Loads the indexes at a path, or returns None when none was built there.
+        retrieve: Returns the most relevant chunks for a query.
+    """
+
+    def __init__(self, index: VectorIndex, embedder: Embedder, lexical: Optional[LexicalIndex] = None,
+                 top_k: int = TOP_K, n_probe: int = N_PROBE, rrf_k: int = RRF_K,
+                 reranker: Optional[Reranker] = None):
+        self.index = index
+        self.embedder = embedder
+        self.lexical = lexical
+        self.top_k = top_k
+        self.n_probe = n_probe
+        self.rrf_k = rrf_k
+        self.reranker = reranker
+
+    @classmethod
+    def open(cls, path: str, embedder: Embedder, **kwargs) -> Optional["Retriever"]:
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            trace_logger.warning(f"No vector index at {path}")
+            return None
+        lexical_path = os.path.join(path, LEXICAL_DIRECTORY)
+        lexical = LexicalIndex.load(lexical_path) if os.path.exists(os.path.join(lexical_path, "meta.json")) else None
+        return cls(VectorIndex.load(path), embedder, lexical=lexical, **kwargs)
+
+    def __dense__(self, query: str, countries, module, top_k: int) -> List[int]:
+        try:
+            vector = self.embedder([query])[0]
+        except Exception as e:
+            if self.lexical is None:
+                raise
+            trace_logger.warning(f"Query embedding failed, retrieving lexically only: {e}")
+            return []
+        hits = self.index.search(vector, top_k=top_k, n_probe=self.n_probe, countries=countries, module=module)
+        return [hit.id for hit in hits]
+
+    def retrieve(self, query: str, countries: Optional[Iterable[str]] = None, module: Optional[str] = None,
+                 limit: int = POLICY_CONTEXT_CHUNKS) -> List[RetrievedChunk]:
+        """
+        Returns up to `limit` chunks nearest to `query`, restricted to `countries` and `module` when given.
+        """
+        top_k = max(limit, self.top_k)
+        dense = self.__dense__(query, countries, module, top_k)
+        rankings = [dense]
+        if self.lexical is not None:
+            allowed = self.index.filter_ids(countries, module)
+            rankings.append([hit.id for hit in self.lexical.search(query, top_k, allowed=allowed)])
+        fused = reciprocal_rank_fusion(rankings, self.rrf_k)
+
+        chunks = []
+        for id, score in fused[:top_k if self.reranker is not None else limit]:
+            record = self.index.record(self.index.row_of(id))
+            chunks.append(RetrievedChunk(id=id, text=record.get("text", ""), score=score,
+                                         module=record.get("module"), countries=record.get("countries") or []))
+        if self.reranker is not None:
+            reranked = self.reranker.rerank(query, chunks, [chunk.text for chunk in chunks])
+            for chunk, score in reranked:
+                if score is not None:
+                    chunk.score = score
+            chunks = [chunk for chunk, _ in reranked]
+        return chunks[:limit]
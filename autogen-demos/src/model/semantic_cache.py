@@ -0,0 +1,192 @@
+import hashlib
+import re
+import threading
+import time
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Type
+
+import numpy as np
+from pydantic import BaseModel
+
+from src.constants import EMBEDDING_API_MODEL_URL, EMBEDDING_API_MODEL_KEY, EMBEDDING_API_MODEL_NAME, \
+    SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_CAPACITY, SEMANTIC_CACHE_EVICTION, SENTENCE_EMBEDDING_API_MODEL_URL
+from src.logging import trace_logger
+from src.model.clients import client_registry
+from src.model.embedding import document_embedder, sentence_embedder
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32)
+
+
+class OpenAIEmbedder:
+    """
+    Embeds texts through the configured OpenAI-compatible `EMBEDDING_API_MODEL_*` endpoint, one request per call.
+
+    See `EmbeddingClient` for the batching, deduplicating and persistent client.
+    """
+
+    def __init__(self,
+                 base_url: str = EMBEDDING_API_MODEL_URL,
+                 api_key: str = EMBEDDING_API_MODEL_KEY,
+                 model: str = EMBEDDING_API_MODEL_NAME):
+        self.model = model
+        self.openai_client = client_registry.get(base_url, api_key, "embedding").openai_client
+
+    def __call__(self, texts: Sequence[str]) -> np.ndarray:
+        response = self.openai_client.embeddings.create(model=self.model, input=list(texts))
+        return _normalize(np.array([item.embedding for item in response.data], dtype=np.float32))
+
+
+class HashingEmbedder:
+    """
+    Local stand-in embedder hashing word unigrams and character trigrams into a fixed-size vector.
+
+    It needs no network access, which makes it useful for tests and offline benchmarks; it
+    only captures lexical overlap, not meaning.
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        words = _TOKEN_PATTERN.findall(text.lower())
+        features = list(words)
+        for word in words:
+            padded = f"#{word}#"
+            features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def __call__(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+                index = int.from_bytes(digest[:4], "little") % self.dim
+                sign = 1.0 if digest[4] & 1 else -1.0
+                vectors[row, index] += sign
+        return _normalize(vectors)
+
+
+@dataclass
+class SemanticCacheStats:
+    """
+    Counters exposed by the `SemanticCache`.
+    """
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def to_dict(self) -> Dict:
+        return {**asdict(self), "hit_rate": self.hit_rate}
+
+
+class SemanticCache:
+    """
+    Embedding-similarity cache for structured responses of paraphrased prompts.
+
+    Prompts are embedded and kept in an in-process, fixed-capacity vector index. A lookup
+    returns the response of the most similar prior prompt in the same namespace when the
+    cosine similarity reaches `threshold`.
+
+    Attributes:
+        embedder (Callable): Maps a list of texts to L2-normalised vectors; defaults to the shared
+            `sentence_embedder`, or `document_embedder` when no sentence endpoint is configured.
+        threshold (float): Minimum cosine similarity for a hit.
+        capacity (int): Maximum number of cached prompts.
+        eviction (str): `lru` evicts the least recently hit entry, `fifo` the oldest one.
+        stats (SemanticCacheStats): Hit, miss and eviction counters.
+
+    Methods:
+        get: Returns the cached response of the nearest similar prompt, or None.
+        set: Stores the response of a prompt, evicting an entry when full.
+    """
+
+    def __init__(self,
+                 embedder: Optional[Callable[[Sequence[str]], np.ndarray]] = None,
+                 threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 capacity: int = SEMANTIC_CACHE_CAPACITY,
+                 eviction: str = SEMANTIC_CACHE_EVICTION):
+        if eviction not in ("lru", "fifo"):
+            raise Exception(f"Unsupported eviction policy `{eviction}`; use `lru` or `fifo`")
+
+        self.embedder = embedder or (sentence_embedder() if SENTENCE_EMBEDDING_API_MODEL_URL else document_embedder())
+        self.threshold = threshold
+        self.capacity = capacity
+        self.eviction = eviction
+        self.stats = SemanticCacheStats()
+
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None
+        self._namespace_ids: Dict[str, int] = {}
+        self._namespaces = np.full(capacity, -1, dtype=np.int64)
+        self._values: List[Optional[str]] = [None] * capacity
+        self._inserted = np.zeros(capacity, dtype=np.float64)
+        self._used = np.zeros(capacity, dtype=np.float64)
+        self._size = 0
+
+    def _embed(self, prompt: str) -> np.ndarray:
+        return self.embedder([prompt])[0]
+
+    def _nearest(self, vector: np.ndarray, namespace: str) -> Tuple[int, float]:
+        namespace_id = self._namespace_ids.get(namespace)
+        if namespace_id is None:
+            return -1, 0.0
+        similarities = self._vectors[:self._size] @ vector
+        mask = self._namespaces[:self._size] == namespace_id
+        if not mask.any():
+            return -1, 0.0
+        similarities = np.where(mask, similarities, -np.inf)
+        index = int(np.argmax(similarities))
+        return index, float(similarities[index])
+
+    def get(self, prompt: str, namespace: str, response_model: Type[BaseModel]) -> Optional[BaseModel]:
+        vector = self._embed(prompt)
+        with self._lock:
+            if self._size == 0:
+                self.stats.misses += 1
+                return None
+            index, similarity = self._nearest(vector, namespace)
+            if index < 0 or similarity < self.threshold:
+                self.stats.misses += 1
+                return None
+            self.stats.hits += 1
+            self._used[index] = time.monotonic()
+            value = self._values[index]
+
+        trace_logger.debug(f"Semantic cache hit ({similarity:.3f}) for prompt: {prompt}")
+        return response_model.model_validate_json(value)
+
+    def set(self, prompt: str, namespace: str, response: BaseModel):
+        vector = self._embed(prompt)
+        value = response.model_dump_json()
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.capacity, vector.shape[0]), dtype=np.float32)
+
+            if self._size < self.capacity:
+                index = self._size
+                self._size += 1
+            else:
+                order = self._used if self.eviction == "lru" else self._inserted
+                index = int(np.argmin(order))
+                self.stats.evictions += 1
+
+            now = time.monotonic()
+            self._vectors[index] = vector
+            self._namespaces[index] = self._namespace_ids.setdefault(namespace, len(self._namespace_ids))
+            self._values[index] = value
+            self._inserted[index] = now
+            self._used[index] = now
+
+    def __len__(self):
+        return self._size
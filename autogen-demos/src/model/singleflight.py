@@ -0,0 +1,122 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass, asdict
+from typing import Awaitable, Callable, Dict, Tuple, TypeVar
+
+from pydantic import BaseModel
+
+T = TypeVar("T")
+
+
+@dataclass
+class SingleFlightStats:
+    """
+    Counters of a `SingleFlight` group.
+
+    Attributes:
+        leaders (int): Calls that sent their own request.
+        collapsed (int): Calls that waited on an identical in-flight request instead.
+    """
+    leaders: int = 0
+    collapsed: int = 0
+
+    @property
+    def collapse_rate(self) -> float:
+        total = self.leaders + self.collapsed
+        return self.collapsed / total if total else 0.0
+
+    def to_dict(self) -> Dict:
+        return dict(asdict(self), collapse_rate=self.collapse_rate)
+
+
+def _share(result):
+    # Every caller gets its own copy, so one caller post-processing the response cannot affect another
+    if isinstance(result, BaseModel):
+        return result.model_copy(deep=True)
+    return result
+
+
+class SingleFlight:
+    """
+    Collapses concurrent identical requests into one.
+
+    The first call for a key (the leader) runs the request; calls arriving with the same key
+    while it is in flight wait for it and receive a copy of its result, or its exception.
+    Nothing is kept once the request completes, so this is no cache: a later call sends a
+    new request.
+
+    Sync calls from threads and async calls are tracked separately, the latter per event loop.
+
+    Methods:
+        do: Runs `fn` for `key` unless an identical call is already in flight in another thread.
+        ado: Async counterpart of `do`.
+        stats: Returns the leader and collapsed-call counters.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+        self._async_calls: Dict[Tuple[int, str], asyncio.Future] = {}
+        self._stats = SingleFlightStats()
+
+    def do(self, key: str, fn: Callable[[], T]) -> T:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self._stats.leaders += 1
+            else:
+                self._stats.collapsed += 1
+
+        if not leader:
+            return _share(future.result())
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        loop = asyncio.get_running_loop()
+        call_key = (id(loop), key)
+        future = self._async_calls.get(call_key)
+        if future is not None:
+            with self._lock:
+                self._stats.collapsed += 1
+            # Shielded so a cancelled follower does not cancel the leader's request
+            return _share(await asyncio.shield(future))
+
+        future = self._async_calls[call_key] = loop.create_future()
+        with self._lock:
+            self._stats.leaders += 1
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception retrieved when no follower was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._async_calls[call_key]
+
+    def stats(self) -> SingleFlightStats:
+        with self._lock:
+            return SingleFlightStats(**asdict(self._stats))
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,97 @@
+from typing import AsyncIterator, Callable, Iterator, List, Optional, Sequence, Type, Union
+
+from instructor.dsl.partial import PartialLiteralMixin
+from pydantic import BaseModel
+
+StopPredicate = Callable[[BaseModel], bool]
+
+
+def complete_strings_model(response_model: Type[BaseModel]) -> Type[BaseModel]:
+    """
+    Returns a subclass of `response_model` whose partial responses only expose complete strings.
+
+    Instructor streams incomplete string values by default, which breaks `Literal`/`Enum`
+    fields such as `category` mid-stream; with `PartialLiteralMixin` a string field stays
+    None until its closing quote has been received.
+    """
+    if issubclass(response_model, PartialLiteralMixin):
+        return response_model
+    return type(response_model.__name__, (response_model, PartialLiteralMixin), {"__doc__": response_model.__doc__})
+
+
+def field_is_known(path: str) -> StopPredicate:
+    """
+    Builds an early-exit predicate that is true once the dotted field `path` has a value.
+
+    Args:
+        path (str): Dotted attribute path, e.g. `policy.category`.
+
+    Returns:
+        Callable: Predicate over a partial response.
+    """
+    attributes = path.split(".")
+
+    def predicate(partial: BaseModel) -> bool:
+        value = partial
+        for attribute in attributes:
+            value = getattr(value, attribute, None)
+            if value is None:
+                return False
+        return True
+
+    predicate.__name__ = f"field_is_known({path})"
+    return predicate
+
+
+def _normalize_predicates(stop_when: Optional[Union[StopPredicate, Sequence[StopPredicate]]]) -> List[StopPredicate]:
+    if stop_when is None:
+        return []
+    if callable(stop_when):
+        return [stop_when]
+    return list(stop_when)
+
+
+def stream_until(partials: Iterator[BaseModel],
+                 stop_when: Optional[Union[StopPredicate, Sequence[StopPredicate]]] = None) -> Iterator[BaseModel]:
+    """
+    Yields each new partial response and stops as soon as any predicate in `stop_when` holds.
+
+    Partials identical to the previous one are skipped. Stopping closes `partials`, which ends
+    the underlying HTTP stream.
+    """
+    predicates = _normalize_predicates(stop_when)
+    previous = None
+    try:
+        for partial in partials:
+            snapshot = partial.model_dump(warnings=False)
+            if snapshot == previous:
+                continue
+            previous = snapshot
+            yield partial
+            if any(predicate(partial) for predicate in predicates):
+                return
+    finally:
+        if hasattr(partials, "close"):
+            partials.close()
+
+
+async def astream_until(partials: AsyncIterator[BaseModel],
+                        stop_when: Optional[Union[StopPredicate, Sequence[StopPredicate]]] = None
+                        ) -> AsyncIterator[BaseModel]:
+    """
+    Async counterpart of `stream_until`.
+    """
+    predicates = _normalize_predicates(stop_when)
+    previous = None
+    try:
+        async for partial in partials:
+            snapshot = partial.model_dump(warnings=False)
+            if snapshot == previous:
+                continue
+            previous = snapshot
+            yield partial
+            if any(predicate(partial) for predicate in predicates):
+                return
+    finally:
+        if hasattr(partials, "aclose"):
+            await partials.aclose()
@@ -0,0 +1,347 @@
+import json
+import os
+import shutil
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from src.constants import LOCAL_INDEX_TYPE, LOCAL_INDEX_N_LIST, LOCAL_INDEX_EXACT_ROWS, METRIC_TYPE, TOP_K, N_PROBE
+from src.logging import trace_logger
+
+INDEX_TYPES = ("IVF_FLAT", "FLAT")
+METRICS = ("COSINE", "IP", "L2")
+
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLES_PER_LIST = 64
+ASSIGN_BATCH_ROWS = 65536
+
+
+def _key(value: str) -> str:
+    return value.strip().lower()
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    # Nearest centroid by L2: argmax of x.c - |c|^2 / 2, in batches to bound memory
+    half_norms = 0.5 * np.einsum("ij,ij->i", centroids, centroids)
+    assignment = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_BATCH_ROWS):
+        block = np.asarray(vectors[start:start + ASSIGN_BATCH_ROWS], dtype=np.float32)
+        assignment[start:start + len(block)] = np.argmax(block @ centroids.T - half_norms, axis=1)
+    return assignment
+
+
+def _kmeans(vectors: np.ndarray, n_list: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), n_list * KMEANS_SAMPLES_PER_LIST)
+    sample = vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))]
+    centroids = sample[rng.choice(sample_size, n_list, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assignment = _assign(sample, centroids)
+        counts = np.bincount(assignment, minlength=n_list)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # Re-seed empty lists with random points so no list stays unused
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = sample[rng.choice(sample_size, len(empty), replace=False)]
+    return centroids
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32)
+
+
+@dataclass
+class Hit:
+    """
+    One search result.
+
+    Attributes:
+        id (int): Position of the chunk in the vectors the index was built from.
+        row (int): Position of the chunk inside the index, see `VectorIndex.record`.
+        score (float): Similarity to the query; higher is closer for every metric (negated distance for L2).
+    """
+    id: int
+    row: int
+    score: float
+
+
+class VectorIndex:
+    """
+    In-process approximate nearest-neighbour index over NumPy arrays, persisted in a directory.
+
+    `IVF_FLAT` clusters the vectors with k-means into `n_list` inverted lists stored
+    contiguously, so a search scores only the `n_probe` lists closest to the query; `FLAT`
+    scores every vector exactly. Every vector carries a JSON record with its `module` and
+    `countries`, which can pre-filter a search: the allowed rows are selected before scoring,
+    and filters matching at most `LOCAL_INDEX_EXACT_ROWS` rows, or leaving fewer than `top_k`
+    candidates in the probed lists, are searched exactly over the allowed rows. Arrays are
+    memory-mapped when loaded, so opening a large index is cheap and its pages are shared
+    between processes.
+
+    Attributes:
+        path (str): Directory of the index files.
+        dim (int): Vector dimension.
+        metric (str): `COSINE`, `IP` or `L2`, see `METRIC_TYPE`.
+        index_type (str): `IVF_FLAT` or `FLAT`, see `LOCAL_INDEX_TYPE`.
+
+    Methods:
+        build: Builds an index from vectors and records and saves it.
+        load: Opens a saved index.
+        search: Returns the `top_k` nearest chunks, optionally filtered by countries and module.
+        record: Returns the record of a row.
+        row_of: Returns the row of a chunk id.
+        filter_ids: Returns the ids of the chunks matching a filter.
+    """
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as file:
+            meta = json.load(file)
+        self.path = path
+        self.dim: int = meta["dim"]
+        self.metric: str = meta["metric"]
+        self.index_type: str = meta["index_type"]
+        self.modules: Dict[str, int] = {module: code for code, module in enumerate(meta["modules"])}
+        self.countries: Dict[str, int] = {country: code for code, country in enumerate(meta["countries"])}
+
+        def load(name: str) -> np.ndarray:
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+
+        self.vectors = load("vectors")
+        self.norms = load("norms")
+        self.ids = load("ids")
+        self.centroids = np.asarray(load("centroids"))
+        self.list_offsets = np.asarray(load("list_offsets"))
+        self.module_codes = load("module_codes")
+        self.country_offsets = np.asarray(load("country_offsets"))
+        self.country_rows = load("country_rows")
+        self.record_offsets = load("record_offsets")
+        self.records = np.memmap(os.path.join(path, "records.bin"), dtype=np.uint8, mode="r") \
+            if self.record_offsets[-1] else np.zeros(0, dtype=np.uint8)
+        self._rows: Optional[np.ndarray] = None
+
+    def __len__(self):
+        return len(self.vectors)
+
+    @classmethod
+    def load(cls, path: str) -> "VectorIndex":
+        return cls(path)
+
+    @classmethod
+    def build(cls, path: str, vectors: np.ndarray, records: Sequence[Dict], index_type: str = LOCAL_INDEX_TYPE,
+              metric: str = METRIC_TYPE, n_list: int = LOCAL_INDEX_N_LIST, seed: int = 0) -> "VectorIndex":
+        """
+        Builds an index and saves it to `path`, replacing any index there.
+
+        Args:
+            path (str): Directory of the index.
+            vectors (np.ndarray): One embedding per record.
+            records (Sequence[Dict]): JSON-serializable records, e.g. `{"text", "module", "countries"}`.
+            index_type (str): `IVF_FLAT` or `FLAT`.
+            metric (str): `COSINE`, `IP` or `L2`.
+            n_list (int): Inverted lists of `IVF_FLAT`; 0 picks the square root of the number of vectors.
+            seed (int): Seed of the k-means sampling.
+        """
+        index_type, metric = index_type.upper(), metric.upper()
+        if index_type not in INDEX_TYPES:
+            raise Exception(f"Unsupported local index type {index_type}, expected one of {INDEX_TYPES}")
+        if metric not in METRICS:
+            raise Exception(f"Unsupported metric {metric}, expected one of {METRICS}")
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) != len(records):
+            raise Exception(f"Got {len(vectors)} vectors for {len(records)} records")
+        if metric == "COSINE":
+            vectors = _normalize(vectors)
+
+        start = time.perf_counter()
+        count = len(vectors)
+        if index_type == "IVF_FLAT" and count:
+            n_list = min(n_list or max(1, int(np.sqrt(count))), count)
+            centroids = _kmeans(vectors, n_list, seed)
+            assignment = _assign(vectors, centroids)
+            order = np.argsort(assignment, kind="stable")
+            list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=n_list))])
+        else:
+            centroids = np.zeros((0, vectors.shape[1] if vectors.ndim == 2 else 0), dtype=np.float32)
+            order = np.arange(count)
+            list_offsets = np.array([0, count])
+        vectors = vectors[order]
+
+        modules = sorted({record["module"] for record in records if record.get("module")})
+        module_index = {module: code for code, module in enumerate(modules)}
+        countries = sorted({_key(country) for record in records for country in record.get("countries") or []})
+        country_index = {country: code for code, country in enumerate(countries)}
+        module_codes = np.full(count, -1, dtype=np.int16)
+        country_members: List[List[int]] = [[] for _ in countries]
+        encoded, record_offsets = [], [0]
+        for row, position in enumerate(order):
+            record = records[position]
+            if record.get("module"):
+                module_codes[row] = module_index[record["module"]]
+            for country in {_key(country) for country in record.get("countries") or []}:
+                country_members[country_index[country]].append(row)
+            data = json.dumps(record, ensure_ascii=False).encode("utf-8")
+            encoded.append(data)
+            record_offsets.append(record_offsets[-1] + len(data))
+
+        temporary = f"{path}.building"
+        shutil.rmtree(temporary, ignore_errors=True)
+        os.makedirs(temporary)
+        arrays = {
+            "vectors": vectors,
+            "norms": np.einsum("ij,ij->i", vectors, vectors).astype(np.float32),
+            "ids": order.astype(np.int64),
+            "centroids": centroids.astype(np.float32),
+            "list_offsets": np.asarray(list_offsets, dtype=np.int64),
+            "module_codes": module_codes,
+            "country_offsets": np.cumsum([0] + [len(members) for members in country_members]).astype(np.int64),
+            "country_rows": np.array([row for members in country_members for row in members], dtype=np.int64),
+            "record_offsets": np.asarray(record_offsets, dtype=np.int64),
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(temporary, f"{name}.npy"), array)
+        with open(os.path.join(temporary, "records.bin"), "wb") as file:
+            file.write(b"".join(encoded))
+        with open(os.path.join(temporary, "meta.json"), "w", encoding="utf-8") as file:
+            json.dump({
+                "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+                "count": count,
+                "metric": metric,
+                "index_type": index_type,
+                "n_list": len(list_offsets) - 1,
+                "modules": modules,
+                "countries": countries,
+            }, file, ensure_ascii=False)
+
+        # Swap the new index in with renames, so readers never see a half-written directory
+        previous = f"{path}.previous"
+        shutil.rmtree(previous, ignore_errors=True)
+        if os.path.exists(path):
+            os.replace(path, previous)
+        os.replace(temporary, path)
+        shutil.rmtree(previous, ignore_errors=True)
+        trace_logger.info(f"Built {index_type} index of {count} vectors in {len(list_offsets) - 1} lists at {path} "
+                          f"in {time.perf_counter() - start:.1f}s")
+        return cls(path)
+
+    def row_of(self, id: int) -> int:
+        """
+        Returns the row of the chunk with the given id.
+        """
+        if self._rows is None:
+            rows = np.empty(len(self), dtype=np.int64)
+            rows[np.asarray(self.ids)] = np.arange(len(self))
+            self._rows = rows
+        return int(self._rows[id])
+
+    def filter_ids(self, countries: Optional[Iterable[str]], module: Optional[str]) -> Optional[np.ndarray]:
+        """
+        Returns the ids of the chunks matching the filter of `search`, or None without a filter.
+        """
+        allowed = self.__allowed__(countries, module)
+        return None if allowed is None else np.asarray(self.ids[allowed])
+
+    def record(self, row: int) -> Dict:
+        start, end = self.record_offsets[row], self.record_offsets[row + 1]
+        return json.loads(bytes(self.records[start:end]).decode("utf-8"))
+
+    def __allowed__(self, countries: Optional[Iterable[str]], module: Optional[str]) -> Optional[np.ndarray]:
+        """
+        Returns the sorted rows matching the filter (any of `countries` and `module`), or None without a filter.
+        """
+        allowed = None
+        if countries:
+            codes = {self.countries[key] for key in map(_key, countries) if key in self.countries}
+            # Rows of each country are stored sorted, so a single country needs no merge
+            members = [np.asarray(self.country_rows[self.country_offsets[code]:self.country_offsets[code + 1]])
+                       for code in codes]
+            allowed = members[0] if len(members) == 1 else np.unique(np.concatenate(members)) if members \
+                else np.zeros(0, dtype=np.int64)
+        if module:
+            code = self.modules.get(module)
+            if code is None:
+                return np.zeros(0, dtype=np.int64)
+            if allowed is None:
+                allowed = np.flatnonzero(np.asarray(self.module_codes) == code)
+            else:
+                allowed = allowed[np.asarray(self.module_codes[allowed]) == code]
+        return allowed
+
+    def __scores__(self, vectors: np.ndarray, norms: np.ndarray, query: np.ndarray) -> np.ndarray:
+        products = np.asarray(vectors, dtype=np.float32) @ query
+        if self.metric == "L2":
+            return 2 * products - norms - float(query @ query)
+        return products
+
+    def __top__(self, rows: np.ndarray, scores: np.ndarray, top_k: int) -> List[Hit]:
+        if len(scores) > top_k:
+            selected = np.argpartition(-scores, top_k - 1)[:top_k]
+            rows, scores = rows[selected], scores[selected]
+        order = np.argsort(-scores, kind="stable")
+        return [Hit(id=int(self.ids[rows[i]]), row=int(rows[i]), score=float(scores[i])) for i in order]
+
+    def __exact__(self, query: np.ndarray, rows: Optional[np.ndarray], top_k: int) -> List[Hit]:
+        if rows is None:
+            rows = np.arange(len(self))
+            scores = np.concatenate([
+                self.__scores__(self.vectors[start:start + ASSIGN_BATCH_ROWS],
+                                self.norms[start:start + ASSIGN_BATCH_ROWS], query)
+                for start in range(0, len(self), ASSIGN_BATCH_ROWS)
+            ]) if len(self) else np.zeros(0, dtype=np.float32)
+        else:
+            scores = self.__scores__(self.vectors[rows], self.norms[rows], query)
+        return self.__top__(rows, scores, top_k)
+
+    def search(self, query: np.ndarray, top_k: int = TOP_K, n_probe: int = N_PROBE,
+               countries: Optional[Iterable[str]] = None, module: Optional[str] = None) -> List[Hit]:
+        """
+        Returns the `top_k` chunks nearest to `query`, best first.
+
+        Args:
+            query (np.ndarray): Query embedding, from the same embedder as the index.
+            top_k (int): Number of results, see `TOP_K`.
+            n_probe (int): Inverted lists scored by `IVF_FLAT`, see `N_PROBE`; more is slower and more accurate.
+            countries (Optional[Iterable[str]]): Keep chunks about any of these countries (case-insensitive).
+            module (Optional[str]): Keep chunks of this module.
+        """
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        if self.metric == "COSINE":
+            query = _normalize(query)
+        allowed = self.__allowed__(countries, module)
+        if allowed is not None and not len(allowed):
+            return []
+        if self.index_type == "FLAT" or (allowed is not None and len(allowed) <= max(top_k, LOCAL_INDEX_EXACT_ROWS)):
+            return self.__exact__(query, allowed, top_k)
+
+        n_probe = min(max(1, n_probe), len(self.centroids))
+        closeness = self.centroids @ query - 0.5 * np.einsum("ij,ij->i", self.centroids, self.centroids)
+        probes = np.argpartition(-closeness, n_probe - 1)[:n_probe]
+        mask = None
+        if allowed is not None:
+            mask = np.zeros(len(self), dtype=bool)
+            mask[allowed] = True
+
+        candidate_rows, candidate_scores = [], []
+        for probe in probes:
+            start, end = int(self.list_offsets[probe]), int(self.list_offsets[probe + 1])
+            if start == end:
+                continue
+            scores = self.__scores__(self.vectors[start:end], self.norms[start:end], query)
+            rows = np.arange(start, end)
+            if mask is not None:
+                keep = mask[start:end]
+                rows, scores = rows[keep], scores[keep]
+            candidate_rows.append(rows)
+            candidate_scores.append(scores)
+        rows = np.concatenate(candidate_rows) if candidate_rows else np.zeros(0, dtype=np.int64)
+        if allowed is not None and len(rows) < top_k:
+            # Too few matching chunks near the query; the filtered rows are searched exactly instead
+            return self.__exact__(query, allowed, top_k)
+        scores = np.concatenate(candidate_scores) if candidate_scores else np.zeros(0, dtype=np.float32)
+        return self.__top__(rows, scores, top_k)
@@ -1,8 +1,14 @@
-from typing import Literal, Optional
+from functools import lru_cache
+from typing import List, Literal, Optional
 
 from .constants import *
 from .logging import trace_logger
-from .model.base import RouterLLM
+from .model.cascade import Cascade
+from .model.grammar import GrammarEngine
+from .model.reranker import Reranker
+from .model.retrieval import Retriever
+from .model.embedding import document_embedder
+from .model.semantic_cache import HashingEmbedder
 
 g20_with_eu_members = [
     # G20 Countries
@@ -58,32 +64,74 @@ g20_with_eu_members = [
 ]
 
 
+def query_embedder():
+    """
+    Returns the shared `EMBEDDING_API_MODEL_*` client, or the local `HashingEmbedder` when no endpoint is configured.
+
+    Indexes must have been built with the same embedder.
+    """
+    return document_embedder() if EMBEDDING_API_MODEL_URL else HashingEmbedder()
+
+
+@lru_cache(maxsize=None)
+def reranker() -> Optional[Reranker]:
+    """
+    Returns the reranking stage shared by the retrievers, or None when no `RERANK_MODEL_API_URL` is configured.
+    """
+    return Reranker() if RERANK_MODEL_API_URL else None
+
+
+@lru_cache(maxsize=None)
+def policy_retriever() -> Optional[Retriever]:
+    """
+    Returns the hybrid retriever over the policy index at `POLICY_INDEX_PATH`, or None when it was not built.
+    """
+    return Retriever.open(POLICY_INDEX_PATH, query_embedder(), reranker=reranker())
+
+
+@lru_cache(maxsize=None)
+def data_retriever() -> Optional[Retriever]:
+    """
+    Returns the hybrid retriever over the data index at `DATA_INDEX_PATH`, or None when it was not built.
+    """
+    return Retriever.open(DATA_INDEX_PATH, query_embedder(), reranker=reranker())
+
+
 def get_policy_context_tool(module: Literal[
     'social_security_or_insurance_or_emiratisation_schemes', 'employment_service_related_queries', 'labor_law_and_employment_policy_query', 'migration_or_visa_or_workforce_mobility_query', 'mohre_or_government_policy_or_administration_query'],
-                            countries: Optional[list[str]] = ['UAE']) -> dict:
+                            countries: Optional[list[str]] = ['UAE'], query: Optional[str] = None) -> dict:
     """Retrieves the relevant information about Labor Policy Documents (laws, amendments, unemployment insurance, social security, employment schemes, migration policies, visa/workforce mobility policies, etc) pre-stored in our Vector Database.
         Args:
             module (str): Type of user query
             countries (List[str]): The name of the countries for which the policy report needs to be retrieved. Defaults to ['UAE'] if no country was specified.
+            query (str): The user's question, used to find the most relevant policy passages.
         Returns:
             dict: status and result or error msg.
     """
 
     if not countries:
-        countries = 'UAE'
-
-    else:
-        countries = ', '.join(countries)
+        countries = ['UAE']
 
     try:
+        retriever = policy_retriever()
+        if retriever is None:
+            return {
+                "status": "error",
+                "error_message": f"No Information found from Vector Database is not available."
+            }
+        chunks = retriever.retrieve(query or module.replace("_", " "), countries=countries, module=module)
+        if not chunks:
+            return {
+                "status": "error",
+                "error_message": f"No Information found in Policy documents for module {module} and "
+                                 f"countries {', '.join(countries)}."
+            }
         return {
             "status": "success",
-            "report": (
-                f"The information is present in Policy documents and can be extracted via module: {module}",
-                f"The country/countries referenced here was/were: {countries}"
-            ),
+            "report": [chunk.to_dict() for chunk in chunks],
         }
     except Exception as e:
+        trace_logger.error(f"Policy retrieval failed: {e}")
         return {
             "status": "error",
             "error_message": f"No Information found from Vector Database is not available."
@@ -91,25 +139,38 @@ def get_policy_context_tool(module: Literal[
 
 
 def get_data_context_tool(
-        module: Literal['economic_data_query', 'labor_force_or_database_query', 'markdown_data_query']) -> dict:
+        module: Literal['economic_data_query', 'labor_force_or_database_query', 'markdown_data_query'],
+        query: Optional[str] = None) -> dict:
     """Returns the data context w.r.t to the module workflow chosen for context retrieval.
 
 
     Args:
         module (str): Type of user query.
+        query (str): The user's question, used to find the most relevant data descriptions.
 
     Returns:
         dict: status and result or error msg.
     """
 
     try:
+        retriever = data_retriever()
+        if retriever is None:
+            return {
+                "status": "error",
+                "error_message": f"No Information found from Vector Database is not available."
+            }
+        chunks = retriever.retrieve(query or module.replace("_", " "), module=module, limit=DATA_CONTEXT_CHUNKS)
+        if not chunks:
+            return {
+                "status": "error",
+                "error_message": f"No Information found in data sources for module {module}."
+            }
         return {
             "status": "success",
-            "report": (
-                f"The data is present in {module}"
-            ),
+            "report": [chunk.to_dict() for chunk in chunks],
         }
     except Exception as e:
+        trace_logger.error(f"Data retrieval failed: {e}")
         return {
             "status": "error",
             "error_message": f"No Information found from Vector Database is not available."
@@ -141,15 +202,41 @@ def get_general_context_tool(module: Literal[
         }
 
 
+@lru_cache(maxsize=None)
+def grammar_cascade() -> Cascade:
+    """
+    Returns the cheap-first cascade behind `check_grammar_tool`, see `CASCADE_GRAMMAR_TIERS`.
+
+    A response is escalated to the next tier when it does not parse or its corrected text is empty.
+    """
+    return Cascade.from_endpoints(
+        CASCADE_GRAMMAR_TIERS,
+        checks=[lambda response: bool(response.corrected_text.strip())],
+        temperature=0.4,
+        top_p=0.1,
+        # The corrected chunk is echoed back along with the explanations
+        max_tokens=3 * GRAMMAR_CHUNK_TOKENS
+    )
+
+
+@lru_cache(maxsize=None)
+def grammar_engine() -> GrammarEngine:
+    """
+    Returns the chunking, concurrent grammar checker behind `check_grammar_tool`, over `grammar_cascade`.
+    """
+    return GrammarEngine(grammar_cascade())
+
+
 def check_grammar_tool(text_input: str) -> dict:
     """Checks the grammar of input text and returns corrections and explanations.
 
-    This function uses the Gemini API to analyze the provided text for
-    grammatical errors. It returns a dictionary containing the corrected
-    text, explanations of the errors, and descriptions of the errors.  The
-    Gemini API is called with a prompt requesting a JSON response in a
-    specific format.  The function handles potential errors in communicating
-    with the Gemini API and parsing the JSON response.
+    This function uses `grammar_engine` to analyze the provided text for
+    grammatical errors. Long texts are split into sentence-aligned chunks
+    that are checked concurrently by the grammar models and merged back in
+    order. It returns a dictionary containing the corrected text,
+    explanations of the errors, and descriptions of the errors.  The
+    function handles potential errors in communicating with the grammar
+    models and parsing their JSON responses.
 
     Args:
         text_input: The input text to be checked for grammar errors.
@@ -163,6 +250,10 @@ def check_grammar_tool(text_input: str) -> dict:
             "errors": A list of strings describing each error found.  This may
                       be an empty list if no errors were found or if an error
                       occurred during processing.
+            "corrections": The changed chunks, each with its "original" and
+                           "corrected" text, "start"/"end" offsets in the input
+                           and "corrected_start"/"corrected_end" offsets in the
+                           corrected text.
 
         The dictionary structure is designed to conform to the following JSON schema:
 
@@ -200,79 +291,43 @@ def check_grammar_tool(text_input: str) -> dict:
         }
         ```
 
-        If an error occurs during communication with the Gemini API or parsing
+        If an error occurs during communication with the grammar models or parsing
         the JSON response, the "corrected_text" will be None and the "explanations"
         list will contain an error message. The "errors" list might be empty
         in such cases.
     """
 
-    prompt = f"""
-    Analyze the following text for grammar errors, correct them, and provide 
-    explanations for each correction:
-
-    Text: {text_input}
-
-    Return the response as a JSON object with the following structure:
-    {{
-      "corrected_text": "The corrected text.",
-      "explanations": [
-        "Explanation of the first error.",
-        "Explanation of the second error.",
-        ...
-      ],
-      "errors": [
-          "Description of the first error",
-          "Description of the second error",
-          ...
-      ]
-    }}
-    """
+    try:
+        response = grammar_engine().check(text_input)
+        trace_logger.info(f"Response Recorded Here: {response}")
+        return response
+    except Exception as e:
+        return {
+            "corrected_text": None,
+            "explanations": [f"Error communicating with grammar models: {e}"],
+            "errors": []
+        }
 
-    from typing import List
-    from pydantic import BaseModel, Field
-
-    class ResponseSchema(BaseModel):
-        """
-        A JSON object containing corrected text, explanations, and error descriptions.
-        """
-        corrected_text: str = Field(
-            ...,
-            description="The corrected text."
-        )
-        explanations: List[str] = Field(
-            ...,
-            description="An array of explanations for each correction."
-        )
-        errors: List[str] = Field(
-            ...,
-            description="An array of descriptions of each error."
-        )
 
-    try:
+def check_grammar_batch_tool(text_inputs: List[str]) -> List[dict]:
+    """Checks the grammar of several texts at once, see `check_grammar_tool`.
 
-        llm = RouterLLM(
-            model=LLAMA3_2_API_MODEL_NAME,
-            openai_api_base=LLAMA3_2_API_BASE,
-            openai_api_key=LLAMA3_2_API_KEY,
-            temperature=0.4,
-            top_p=0.1
-        )
+    The chunks of all texts are checked concurrently, so a batch takes about as long as its longest text.
 
-        response: ResponseSchema = llm.structured_output_to_pydantic_model(prompt, response_model=ResponseSchema)
+    Args:
+        text_inputs: The texts to be checked for grammar errors.
 
-        try:
-            trace_logger.info(f"Response Recorded Here: {response}")
-            return response.__dict__
-        except Exception as e:
-            return {
+    Returns:
+        A list with one `check_grammar_tool` result per text, in order.
+    """
+    try:
+        return grammar_engine().check_many(text_inputs)
+    except Exception as e:
+        return [
+            {
                 "corrected_text": None,
-                "explanations": [f"Error parsing LLAMA3.2 3B response: {e}"],
+                "explanations": [f"Error communicating with grammar models: {e}"],
                 "errors": []
             }
-
-    except Exception as e:
-        return {
-            "corrected_text": None,
-            "explanations": [f"Error communicating with LLAMA3.2 3B: {e}"],
-            "errors": []
-        }
+            for _ in text_inputs
+        ]
@@ -4,9 +4,9 @@ from autogen_agentchat.agents import AssistantAgent
 from autogen_agentchat.conditions import HandoffTermination, TextMentionTermination
 from autogen_agentchat.teams import Swarm
 from autogen_core.models import ModelInfo, ModelFamily
-from autogen_ext.models.openai import OpenAIChatCompletionClient
 
 from src.constants import *
+from src.model.chat_clients import guarded_client
 from src.model.helpers import run_team_stream
 
 
@@ -15,7 +15,7 @@ def refund_flight(flight_id: str) -> str:
     return f"Flight {flight_id} refunded"
 
 
-model_client = OpenAIChatCompletionClient(
+model_client = guarded_client(
     model=QWEN_API_MODEL_NAME,
     api_key=QWEN_API_KEY,
     base_url=QWEN_API_BASE,